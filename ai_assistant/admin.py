@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Conversation, Message, AIResponse, LearningContent, SalesTemplate
+from .models import Conversation, Message, AIResponse, AICacheEntry, CircuitBreakerState, AIJob, \
+    LearningCatalogEntry, LearningContent, QuizQuestion, SalesTemplate
 
 
 class MessageInline(admin.TabularInline):
@@ -47,31 +50,131 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(AIResponse)
 class AIResponseAdmin(admin.ModelAdmin):
-    list_display = ('user', 'request_type', 'created_at', 'short_prompt', 'short_response')
+    list_display = ('user', 'request_type', 'created_at', 'prompt_size', 'response_size')
     list_filter = ('request_type', 'created_at')
-    search_fields = ('prompt', 'response', 'user__username')
+    search_fields = ('user__username',)
     date_hierarchy = 'created_at'
+    fields = ('user', 'request_type', 'created_at', 'prompt_text', 'response_text')
+    readonly_fields = ('user', 'request_type', 'created_at', 'prompt_text', 'response_text')
+
+    def get_queryset(self, request):
+        # Bodies are only decompressed on the detail page
+        return super().get_queryset(request).select_related('prompt_blob', 'response_blob').defer(
+            'prompt', 'response', 'prompt_blob__data', 'response_blob__data'
+        )
+
+    def prompt_size(self, obj):
+        return obj.prompt_blob.size if obj.prompt_blob_id else None
+
+    prompt_size.short_description = 'Prompt chars'
+
+    def response_size(self, obj):
+        return obj.response_blob.size if obj.response_blob_id else None
+
+    response_size.short_description = 'Response chars'
+
+    def prompt_text(self, obj):
+        return obj.prompt_text
+
+    prompt_text.short_description = 'Prompt'
+
+    def response_text(self, obj):
+        return obj.response_text
+
+    response_text.short_description = 'Response'
+
+
+@admin.register(AICacheEntry)
+class AICacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('cache_type', 'short_key', 'hit_count', 'created_at', 'expires_at')
+    list_filter = ('cache_type', 'created_at')
+    search_fields = ('key', 'response')
+    readonly_fields = ('key', 'cache_type', 'hit_count', 'created_at')
+
+    def short_key(self, obj):
+        return obj.key[:12]
+
+    short_key.short_description = 'Key'
+
+
+@admin.register(CircuitBreakerState)
+class CircuitBreakerStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'state_display', 'failure_count', 'opened_at', 'updated_at')
+    readonly_fields = ('name', 'state', 'failure_count', 'opened_at', 'last_error', 'updated_at')
+
+    def state_display(self, obj):
+        colors = {'closed': 'green', 'half_open': 'orange', 'open': 'red'}
+        return format_html('<span style="color: {};">{}</span>', colors.get(obj.state, 'black'),
+                           obj.get_state_display())
+
+    state_display.short_description = 'State'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(AIJob)
+class AIJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_type', 'user', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('job_type', 'status', 'created_at')
+    search_fields = ('dedup_key', 'user__username', 'error')
+    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at', 'updated_at', 'finished_at', 'locked_by', 'locked_until')
+    actions = ['requeue_jobs']
+
+    def requeue_jobs(self, request, queryset):
+        updated, skipped = 0, 0
+        for job in queryset.filter(status='failed').order_by('id'):
+            try:
+                # One live job per dedup_key: a job already queued or running for the same key wins
+                with transaction.atomic():
+                    updated += AIJob.objects.filter(id=job.id, status='failed').update(
+                        status='queued', attempts=0, error='', available_at=timezone.now(), locked_by='',
+                        locked_until=None, finished_at=None
+                    )
+            except IntegrityError:
+                skipped += 1
+
+        self.message_user(request, f"{updated} failed jobs were queued again.")
+        if skipped:
+            self.message_user(request, f"{skipped} jobs were skipped because a job with the same dedup key "
+                                       f"is already queued or running.", messages.WARNING)
+
+    requeue_jobs.short_description = "Requeue selected failed jobs"
+
+
+@admin.register(LearningCatalogEntry)
+class LearningCatalogEntryAdmin(admin.ModelAdmin):
+    list_display = ('topic', 'product_type', 'difficulty_level', 'version', 'assignment_count', 'created_at')
+    list_filter = ('product_type', 'difficulty_level', 'version')
+    search_fields = ('topic', 'content', 'summary')
+
+    def assignment_count(self, obj):
+        return obj.assignments.count()
+
+    assignment_count.short_description = 'Partners'
 
-    def short_prompt(self, obj):
-        if len(obj.prompt) > 100:
-            return obj.prompt[:100] + '...'
-        return obj.prompt
 
-    short_prompt.short_description = 'Prompt'
+@admin.register(QuizQuestion)
+class QuizQuestionAdmin(admin.ModelAdmin):
+    list_display = ('short_question', 'product_type', 'difficulty_level', 'created_at')
+    list_filter = ('product_type', 'difficulty_level', 'created_at')
+    search_fields = ('question',)
+    readonly_fields = ('fingerprint', 'created_at')
 
-    def short_response(self, obj):
-        if len(obj.response) > 100:
-            return obj.response[:100] + '...'
-        return obj.response
+    def short_question(self, obj):
+        if len(obj.question) > 100:
+            return obj.question[:100] + '...'
+        return obj.question
 
-    short_response.short_description = 'Response'
+    short_question.short_description = 'Question'
 
 
 @admin.register(LearningContent)
 class LearningContentAdmin(admin.ModelAdmin):
     list_display = ('topic', 'user', 'product_type', 'difficulty_level', 'created_at', 'is_read')
     list_filter = ('product_type', 'difficulty_level', 'is_read', 'created_at')
-    search_fields = ('topic', 'content', 'summary', 'user__username')
+    search_fields = ('topic', 'content', 'summary', 'catalog_entry__content', 'user__username')
     list_editable = ('is_read',)
     date_hierarchy = 'created_at'
 
@@ -80,7 +183,7 @@ class LearningContentAdmin(admin.ModelAdmin):
             'fields': ('user', 'topic', 'product_type', 'difficulty_level', 'is_read')
         }),
         ('Content', {
-            'fields': ('summary', 'content')
+            'fields': ('catalog_entry', 'summary', 'content')
         }),
     )
 
@@ -0,0 +1,208 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import AICacheEntry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model, messages, max_tokens):
+    """
+    Build a stable cache key for a completion request
+
+    Whitespace inside message content is collapsed so that prompts which only
+    differ in formatting share an entry.
+
+    Args:
+        model (str): Model name
+        messages (list): List of message dictionaries with role and content
+        max_tokens (int): Maximum tokens for response
+
+    Returns:
+        str: Hex SHA-256 digest of the normalized request
+    """
+    normalized = [
+        {'role': message.get('role', ''), 'content': ' '.join(str(message.get('content', '')).split())}
+        for message in messages
+    ]
+    payload = json.dumps(
+        {'model': model, 'messages': normalized, 'max_tokens': max_tokens},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Bounded in-process cache with per-entry expiry"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= timezone.now():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (value, timezone.now() + timedelta(seconds=ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredResponseCache:
+    """
+    Two-tier cache for AI responses
+
+    Lookups go to the in-process LRU first and then to the AICacheEntry table,
+    which survives restarts and is shared between worker processes. Entries
+    found in the database are promoted into the LRU.
+    """
+
+    def __init__(self, max_entries=1000, ttls=None):
+        self.memory = LRUCache(max_entries)
+        self.ttls = ttls or {}
+        self.stats = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, counter):
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    def get_ttl(self, cache_type):
+        """Return the TTL in seconds for a cache type, or 0 if it is not cacheable"""
+        return self.ttls.get(cache_type, 0)
+
+    def get(self, key):
+        """Look up a response in both tiers"""
+        response = self.memory.get(key)
+        if response is not None:
+            self._record('memory_hits')
+            return response
+
+        try:
+            entry = AICacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+        except Exception as e:
+            logger.error(f"Error reading AI response cache: {str(e)}")
+            entry = None
+
+        if entry is None:
+            self._record('misses')
+            return None
+
+        self._record('persistent_hits')
+        AICacheEntry.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1)
+
+        remaining = (entry.expires_at - timezone.now()).total_seconds()
+        if remaining > 0:
+            self.memory.set(key, entry.response, remaining)
+        return entry.response
+
+    def peek(self, key):
+        """Look up a response without touching the hit/miss counters"""
+        response = self.memory.get(key)
+        if response is not None:
+            return response
+        entry = AICacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+        return entry.response if entry else None
+
+    def set(self, key, response, cache_type):
+        """Store a response in both tiers using the TTL for its cache type"""
+        ttl = self.get_ttl(cache_type)
+        if ttl <= 0:
+            return
+
+        self.memory.set(key, response, ttl)
+        try:
+            AICacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    'cache_type': cache_type,
+                    'response': response,
+                    'expires_at': timezone.now() + timedelta(seconds=ttl)
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error writing AI response cache: {str(e)}")
+
+    async def aget(self, key):
+        """Async version of get"""
+        response = self.memory.get(key)
+        if response is not None:
+            self._record('memory_hits')
+            return response
+        return await sync_to_async(self.get)(key)
+
+    async def apeek(self, key):
+        """Async version of peek"""
+        return await sync_to_async(self.peek)(key)
+
+    async def aset(self, key, response, cache_type):
+        """Async version of set"""
+        await sync_to_async(self.set)(key, response, cache_type)
+
+    def purge_expired(self):
+        """Delete expired rows from the persistent tier"""
+        deleted, _ = AICacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+    def get_stats(self):
+        """Return a snapshot of the hit/miss counters"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['memory_hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_rate'] = (lookups - stats['misses']) / lookups if lookups else 0
+        stats['memory_entries'] = len(self.memory)
+        return stats
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache configured by AI_CACHE_BACKEND"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                backend = import_string(getattr(settings, 'AI_CACHE_BACKEND',
+                                                'ai_assistant.ai_cache.TieredResponseCache'))
+                _response_cache = backend(
+                    max_entries=getattr(settings, 'AI_CACHE_MAX_ENTRIES', 1000),
+                    ttls=getattr(settings, 'AI_CACHE_TTLS', {})
+                )
+    return _response_cache
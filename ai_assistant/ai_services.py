@@ -1,74 +1,304 @@
 import os
+import re
+import time
 import json
 import logging
 import openai
 from django.conf import settings
 from django.utils import timezone
-from .models import AIResponse
+from .ai_cache import get_response_cache, make_cache_key
+from .single_flight import coalesce, acoalesce
+from .context_manager import context_manager, estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+from .rate_limiter import rate_governor, priority_for
+from .resilience import openai_caller, remaining_budget
+from .hedging import hedger, should_hedge
+from .interaction_log import interaction_log
+from .telemetry import telemetry
+from .transport import chat_completion, achat_completion
+from .lead_analysis import lead_pipeline
+from .outreach import outreach_batcher
 from dashboard.models import AIInsight, CustomerLead
 
 # Configure OpenAI API
 openai.api_key = settings.OPENAI_API_KEY
+if getattr(settings, 'OPENAI_API_BASE', None):
+    # e.g. the local stand-in started with run_fake_openai
+    openai.api_base = settings.OPENAI_API_BASE
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Model used for all chat completions
+CHAT_MODEL = "gpt-3.5-turbo"
+
+# Returned to the user when the OpenAI API cannot be reached
+FALLBACK_RESPONSE = "I'm sorry, I'm having trouble connecting to my AI services. Please try again later."
+
 
 class AIService:
     """Base class for all AI services"""
 
     @staticmethod
-    def generate_response(messages, max_tokens=500):
+    def generate_response(messages, max_tokens=500, cache_type=None, user=None, request_type=None, hedge=None):
         """
         Generate a response using OpenAI API
 
         Args:
             messages (list): List of message dictionaries with role and content
             max_tokens (int): Maximum tokens for response
+            cache_type (str): Cache bucket for deterministic prompts (see
+                AI_CACHE_TTLS); None bypasses the response cache
+            user (User): User the call is made for, used for fair sharing
+            request_type (str): AIResponse request type, used for priority
+            hedge (bool): Send a second call if the first is slower than the
+                p95 for its request type; None uses AI_HEDGE_REQUEST_TYPES
 
         Returns:
             str: Generated response text
         """
+        started = time.monotonic()
+        content, outcome = AIService._generate_response(messages, max_tokens, cache_type, user, request_type, hedge)
+        telemetry.record_request(request_type, CHAT_MODEL, time.monotonic() - started, outcome)
+        return content
+
+    @staticmethod
+    def _generate_response(messages, max_tokens, cache_type, user, request_type, hedge):
+        """Return the response text and the outcome recorded in telemetry"""
+        cache = get_response_cache() if cache_type else None
+        if cache is None:
+            try:
+                return AIService._create_completion(messages, max_tokens, user, request_type, hedge), 'success'
+            except Exception as e:
+                logger.error(f"Error generating OpenAI response: {str(e)}")
+                return FALLBACK_RESPONSE, 'error'
+
+        cache_key = make_cache_key(CHAT_MODEL, messages, max_tokens)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached, 'cache_hit'
+
+        def produce():
+            content = AIService._create_completion(messages, max_tokens, user, request_type, hedge)
+            cache.set(cache_key, content, cache_type)
+            return content
+
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
+            # Identical concurrent prompts share a single upstream call
+            return coalesce(cache_key, produce, cache.peek), 'success'
+        except Exception as e:
+            logger.error(f"Error generating OpenAI response: {str(e)}")
+            return FALLBACK_RESPONSE, 'error'
+
+    @staticmethod
+    def _admission(messages, max_tokens, user, request_type):
+        """Return the rate governor arguments for a call"""
+        user_key = user.pk if user is not None else 'anonymous'
+        tokens = sum(estimate_tokens(message) for message in messages) + max_tokens
+        return user_key, priority_for(request_type), tokens
+
+    @staticmethod
+    def _admission_wait():
+        """Longest the rate governor may queue a call within the request budget"""
+        remaining = remaining_budget()
+        if remaining is None:
+            return None
+        return max(0.0, min(rate_governor.max_wait, remaining))
+
+    @staticmethod
+    def _create_completion(messages, max_tokens, user=None, request_type=None, hedge=None):
+        """Call the ChatCompletion API and return the stripped reply text"""
+        user_key, priority, tokens = AIService._admission(messages, max_tokens, user, request_type)
+
+        def admit():
+            rate_governor.acquire(user_key, priority, tokens, max_wait=AIService._admission_wait())
+
+        def attempt(timeout):
+            return chat_completion(
+                model=CHAT_MODEL,
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=0.7,
+                request_timeout=timeout,
             )
 
-            return response.choices[0].message.content.strip()
+        def leg():
+            # Retries, per-call timeouts and the circuit breaker
+            response = openai_caller.call(attempt, admit)
+            rate_governor.refund(tokens - response.usage.total_tokens)
+            telemetry.record_usage(request_type, CHAT_MODEL, response.model, response.usage.prompt_tokens,
+                                   response.usage.completion_tokens)
+            return response
+
+        response = hedger.call(leg, request_type) if should_hedge(request_type, hedge) else leg()
+        return response.choices[0].message.content.strip()
+
+    @staticmethod
+    async def agenerate_response(messages, max_tokens=500, cache_type=None, user=None, request_type=None,
+                                 hedge=None):
+        """
+        Async version of generate_response
+
+        Awaits the completion on the event loop instead of blocking a worker,
+        so a single ASGI process can hold many requests in flight.
 
+        Args:
+            messages (list): List of message dictionaries with role and content
+            max_tokens (int): Maximum tokens for response
+            cache_type (str): Cache bucket for deterministic prompts
+            user (User): User the call is made for, used for fair sharing
+            request_type (str): AIResponse request type, used for priority
+            hedge (bool): Hedge slow calls; None uses AI_HEDGE_REQUEST_TYPES
+
+        Returns:
+            str: Generated response text
+        """
+        started = time.monotonic()
+        content, outcome = await AIService._agenerate_response(messages, max_tokens, cache_type, user, request_type,
+                                                               hedge)
+        telemetry.record_request(request_type, CHAT_MODEL, time.monotonic() - started, outcome)
+        return content
+
+    @staticmethod
+    async def _agenerate_response(messages, max_tokens, cache_type, user, request_type, hedge):
+        """Async version of _generate_response"""
+        cache = get_response_cache() if cache_type else None
+        if cache is None:
+            try:
+                return await AIService._acreate_completion(messages, max_tokens, user, request_type, hedge), 'success'
+            except Exception as e:
+                logger.error(f"Error generating OpenAI response: {str(e)}")
+                return FALLBACK_RESPONSE, 'error'
+
+        cache_key = make_cache_key(CHAT_MODEL, messages, max_tokens)
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            return cached, 'cache_hit'
+
+        async def produce():
+            content = await AIService._acreate_completion(messages, max_tokens, user, request_type, hedge)
+            await cache.aset(cache_key, content, cache_type)
+            return content
+
+        try:
+            # Identical concurrent prompts share a single upstream call
+            return await acoalesce(cache_key, produce, cache.apeek), 'success'
         except Exception as e:
             logger.error(f"Error generating OpenAI response: {str(e)}")
-            return "I'm sorry, I'm having trouble connecting to my AI services. Please try again later."
+            return FALLBACK_RESPONSE, 'error'
 
     @staticmethod
-    def log_interaction(user, request_type, prompt, response):
-        """Log AI interaction to database"""
-        try:
-            AIResponse.objects.create(
-                user=user,
-                request_type=request_type,
-                prompt=json.dumps(prompt) if isinstance(prompt, list) else prompt,
-                response=response
+    async def _acreate_completion(messages, max_tokens, user=None, request_type=None, hedge=None):
+        """Async version of _create_completion"""
+        user_key, priority, tokens = AIService._admission(messages, max_tokens, user, request_type)
+
+        async def admit():
+            await rate_governor.aacquire(user_key, priority, tokens, max_wait=AIService._admission_wait())
+
+        async def attempt(timeout):
+            return await achat_completion(
+                model=CHAT_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                request_timeout=timeout,
             )
+
+        async def leg():
+            response = await openai_caller.acall(attempt, admit)
+            await rate_governor.arefund(tokens - response.usage.total_tokens)
+            telemetry.record_usage(request_type, CHAT_MODEL, response.model, response.usage.prompt_tokens,
+                                   response.usage.completion_tokens)
+            return response
+
+        if should_hedge(request_type, hedge):
+            response = await hedger.acall(leg, request_type)
+        else:
+            response = await leg()
+        return response.choices[0].message.content.strip()
+
+    @staticmethod
+    async def astream_response(messages, max_tokens=500, user=None, request_type=None):
+        """
+        Stream a response from the OpenAI API as it is generated
+
+        Args:
+            messages (list): List of message dictionaries with role and content
+            max_tokens (int): Maximum tokens for response
+            user (User): User the call is made for, used for fair sharing
+            request_type (str): AIResponse request type, used for priority
+
+        Yields:
+            str: Content deltas in the order the model produces them
+        """
+        started = time.monotonic()
+        streamed = []
+        outcome = 'success'
+        try:
+            user_key, priority, tokens = AIService._admission(messages, max_tokens, user, request_type)
+
+            async def admit():
+                await rate_governor.aacquire(user_key, priority, tokens, max_wait=AIService._admission_wait())
+
+            async def attempt(timeout):
+                return await achat_completion(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    stream=True,
+                    request_timeout=timeout,
+                )
+
+            # Only opening the stream is retried; a broken stream is not resumed
+            response = await openai_caller.acall(attempt, admit)
+
+            async for chunk in response:
+                delta = chunk.choices[0].delta.get('content')
+                if delta:
+                    streamed.append(delta)
+                    yield delta
+
+            # Streamed responses carry no usage, so the token counts are estimates
+            completion_tokens = estimate_tokens({'content': ''.join(streamed)}) - MESSAGE_OVERHEAD_TOKENS
+            telemetry.record_usage(request_type, CHAT_MODEL, CHAT_MODEL, tokens - max_tokens, completion_tokens)
+            await rate_governor.arefund(max_tokens - completion_tokens)
+
         except Exception as e:
-            logger.error(f"Error logging AI interaction: {str(e)}")
+            outcome = 'error'
+            logger.error(f"Error streaming OpenAI response: {str(e)}")
+            # Only fall back if the client has not already received part of an answer
+            if not streamed:
+                yield FALLBACK_RESPONSE
+        finally:
+            telemetry.record_request(request_type, CHAT_MODEL, time.monotonic() - started, outcome)
+
+    @staticmethod
+    def log_interaction(user, request_type, prompt, response):
+        """Queue an AI interaction to be written to the database in the background"""
+        # Calls made for no partner (e.g. catalog warming) have no AIResponse owner
+        if user is not None:
+            interaction_log.record(user, request_type, prompt, response)
+
+    @staticmethod
+    async def alog_interaction(user, request_type, prompt, response):
+        """Async version of log_interaction"""
+        # Queuing never blocks, so there is nothing to await
+        if user is not None:
+            interaction_log.record(user, request_type, prompt, response)
 
 
 class SalesCopilotService(AIService):
     """Service for sales co-pilot functionality"""
 
     @classmethod
-    def generate_sales_suggestion(cls, user, messages):
+    def generate_sales_suggestion(cls, user, messages, conversation_id=None):
         """Generate sales suggestion based on conversation"""
         try:
-            # Extract conversation context
-            prompt = messages
+            # Trim conversation context to the token budget
+            prompt = context_manager.fit(user, messages, conversation_id)
 
             # Generate response
-            response = cls.generate_response(prompt, max_tokens=600)
+            response = cls.generate_response(prompt, max_tokens=600, user=user, request_type='copilot')
 
             # Log interaction
             cls.log_interaction(user, 'copilot', prompt, response)
@@ -79,20 +309,64 @@ class SalesCopilotService(AIService):
             logger.error(f"Error in sales suggestion: {str(e)}")
             return {'status': 'error', 'message': str(e)}
 
+    @classmethod
+    async def agenerate_sales_suggestion(cls, user, messages, conversation_id=None):
+        """Async version of generate_sales_suggestion"""
+        try:
+            # Trim conversation context to the token budget
+            prompt = await context_manager.afit(user, messages, conversation_id)
+
+            # Generate response
+            response = await cls.agenerate_response(prompt, max_tokens=600, user=user, request_type='copilot')
+
+            # Log interaction
+            await cls.alog_interaction(user, 'copilot', prompt, response)
+
+            return {'status': 'success', 'response': response}
+
+        except Exception as e:
+            logger.error(f"Error in sales suggestion: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @classmethod
+    async def astream_sales_suggestion(cls, user, messages, conversation_id=None):
+        """
+        Stream a sales suggestion token by token
+
+        The full text is logged once the stream has finished.
+        """
+        # Trim conversation context to the token budget
+        prompt = await context_manager.afit(user, messages, conversation_id)
+
+        # Stream response
+        chunks = []
+        async for token in cls.astream_response(prompt, max_tokens=600, user=user, request_type='copilot'):
+            chunks.append(token)
+            yield token
+
+        # Log interaction
+        await cls.alog_interaction(user, 'copilot', prompt, ''.join(chunks).strip())
+
+    @staticmethod
+    def build_objection_prompt(objection, product_type):
+        """Build the prompt for handling a customer objection"""
+        return [
+            {"role": "system",
+             "content": f"You are an AI sales assistant helping a financial agent sell {product_type} products in India. You provide concise, effective responses to customer objections."},
+            {"role": "user",
+             "content": f"The customer has raised this objection: '{objection}'. How should I respond to overcome this objection and continue the sale? Give me a short, practical response I can use with the customer."}
+        ]
+
     @classmethod
     def handle_objection(cls, user, objection, product_type):
         """Generate response to customer objection"""
         try:
             # Create prompt
-            prompt = [
-                {"role": "system",
-                 "content": f"You are an AI sales assistant helping a financial agent sell {product_type} products in India. You provide concise, effective responses to customer objections."},
-                {"role": "user",
-                 "content": f"The customer has raised this objection: '{objection}'. How should I respond to overcome this objection and continue the sale? Give me a short, practical response I can use with the customer."}
-            ]
+            prompt = cls.build_objection_prompt(objection, product_type)
 
             # Generate response
-            response = cls.generate_response(prompt, max_tokens=400)
+            response = cls.generate_response(prompt, max_tokens=400, cache_type='objection',
+                                             user=user, request_type='copilot')
 
             # Log interaction
             cls.log_interaction(user, 'copilot', prompt, response)
@@ -103,24 +377,50 @@ class SalesCopilotService(AIService):
             logger.error(f"Error handling objection: {str(e)}")
             return {'status': 'error', 'message': str(e)}
 
+    @classmethod
+    async def ahandle_objection(cls, user, objection, product_type):
+        """Async version of handle_objection"""
+        try:
+            # Create prompt
+            prompt = cls.build_objection_prompt(objection, product_type)
+
+            # Generate response
+            response = await cls.agenerate_response(prompt, max_tokens=400, cache_type='objection',
+                                                    user=user, request_type='copilot')
+
+            # Log interaction
+            await cls.alog_interaction(user, 'copilot', prompt, response)
+
+            return {'status': 'success', 'response': response}
+
+        except Exception as e:
+            logger.error(f"Error handling objection: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
 
 class LearningService(AIService):
     """Service for personalized learning content"""
 
+    @staticmethod
+    def build_learning_content_prompt(product_type, skill_level):
+        """Build the prompt for a learning module"""
+        return [
+            {"role": "system",
+             "content": f"You are an AI educator specializing in teaching financial agents how to sell {product_type} products in India. Create personalized learning content for a {skill_level} level agent."},
+            {"role": "user",
+             "content": f"Create a concise, practical learning module about selling {product_type} products. Include key features, benefits, common objections, and effective sales techniques. The content should be appropriate for a {skill_level} level agent working in India. Format with headings and bullet points for readability."}
+        ]
+
     @classmethod
     def generate_learning_content(cls, user, product_type, skill_level):
         """Generate personalized learning content"""
         try:
             # Create prompt
-            prompt = [
-                {"role": "system",
-                 "content": f"You are an AI educator specializing in teaching financial agents how to sell {product_type} products in India. Create personalized learning content for a {skill_level} level agent."},
-                {"role": "user",
-                 "content": f"Create a concise, practical learning module about selling {product_type} products. Include key features, benefits, common objections, and effective sales techniques. The content should be appropriate for a {skill_level} level agent working in India. Format with headings and bullet points for readability."}
-            ]
+            prompt = cls.build_learning_content_prompt(product_type, skill_level)
 
             # Generate response
-            response = cls.generate_response(prompt, max_tokens=1000)
+            response = cls.generate_response(prompt, max_tokens=1000, cache_type='learning_content',
+                                             user=user, request_type='learning')
 
             # Log interaction
             cls.log_interaction(user, 'learning', prompt, response)
@@ -132,34 +432,75 @@ class LearningService(AIService):
             return {'status': 'error', 'message': str(e)}
 
     @classmethod
-    def generate_quiz_questions(cls, user, product_type, skill_level):
-        """Generate quiz questions for skill assessment"""
+    async def agenerate_learning_content(cls, user, product_type, skill_level):
+        """Async version of generate_learning_content"""
         try:
             # Create prompt
-            prompt = [
-                {"role": "system",
-                 "content": f"You are an AI educator creating assessment questions for financial agents selling {product_type} products in India."},
-                {"role": "user",
-                 "content": f"Create 5 multiple-choice questions to assess knowledge about {product_type} products for a {skill_level} level agent. Each question should have 4 options with 1 correct answer. Format the response as a JSON array of question objects."}
-            ]
+            prompt = cls.build_learning_content_prompt(product_type, skill_level)
 
             # Generate response
-            response = cls.generate_response(prompt, max_tokens=800)
+            response = await cls.agenerate_response(prompt, max_tokens=1000, cache_type='learning_content',
+                                                    user=user, request_type='learning')
 
-            # Try to parse JSON
-            try:
-                questions = json.loads(response)
-            except json.JSONDecodeError:
-                # If response is not valid JSON, extract JSON part
-                import re
-                json_match = re.search(r'(\[{.*}])', response.replace('\n', ''))
-                if json_match:
-                    try:
-                        questions = json.loads(json_match.group(1))
-                    except json.JSONDecodeError:
-                        questions = []
-                else:
-                    questions = []
+            # Log interaction
+            await cls.alog_interaction(user, 'learning', prompt, response)
+
+            return {'status': 'success', 'response': response}
+
+        except Exception as e:
+            logger.error(f"Error generating learning content: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @staticmethod
+    def build_quiz_prompt(product_type, skill_level, count=5, avoid=None):
+        """Build the prompt for quiz question generation"""
+        prompt = (f"Create {count} multiple-choice questions to assess knowledge about {product_type} products for a {skill_level} level agent. "
+                  "Each question should have 4 options with 1 correct answer. "
+                  "Format the response as a JSON array of objects with the keys question, options (a list of 4 strings) "
+                  "and correct_answer (the 0-based index of the correct option).")
+        if avoid:
+            prompt += f" Do not repeat any of these questions: {json.dumps(avoid)}"
+        return [
+            {"role": "system",
+             "content": f"You are an AI educator creating assessment questions for financial agents selling {product_type} products in India."},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def parse_quiz_questions(response):
+        """Extract the list of question objects from a model response"""
+        # Take the outermost JSON array, ignoring any text around it
+        match = re.search(r'\[.*\]', response, re.DOTALL)
+        try:
+            questions = json.loads(match.group(0) if match else response)
+        except (json.JSONDecodeError, TypeError):
+            return []
+        if isinstance(questions, dict):
+            questions = questions.get('questions', [])
+        return questions if isinstance(questions, list) else []
+
+    @classmethod
+    def generate_quiz_questions(cls, user, product_type, skill_level, count=5, avoid=None):
+        """
+        Generate a batch of raw quiz questions, e.g. to fill the question bank
+
+        Args:
+            user (User): User the call is made for, or None for background fills
+            product_type (str): Product the questions are about
+            skill_level (str): beginner, intermediate or advanced
+            count (int): Number of questions to ask for
+            avoid (list): Existing question texts the model should not repeat
+
+        Returns:
+            dict: Status and the unvalidated question objects
+        """
+        try:
+            # Create prompt
+            prompt = cls.build_quiz_prompt(product_type, skill_level, count, avoid)
+
+            # Generate response; not cached, since every fill should bring new questions
+            response = cls.generate_response(prompt, max_tokens=160 * count, user=user, request_type='learning')
+            questions = cls.parse_quiz_questions(response)
 
             # Log interaction
             cls.log_interaction(user, 'learning', prompt, response)
@@ -170,25 +511,55 @@ class LearningService(AIService):
             logger.error(f"Error generating quiz questions: {str(e)}")
             return {'status': 'error', 'message': str(e)}
 
+    @classmethod
+    async def agenerate_quiz_questions(cls, user, product_type, skill_level, count=5, avoid=None):
+        """Async version of generate_quiz_questions"""
+        try:
+            # Create prompt
+            prompt = cls.build_quiz_prompt(product_type, skill_level, count, avoid)
+
+            # Generate response
+            response = await cls.agenerate_response(prompt, max_tokens=160 * count, user=user,
+                                                    request_type='learning')
+            questions = cls.parse_quiz_questions(response)
+
+            # Log interaction
+            await cls.alog_interaction(user, 'learning', prompt, response)
+
+            return {'status': 'success', 'questions': questions}
+
+        except Exception as e:
+            logger.error(f"Error generating quiz questions: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
 
 class LeadService(AIService):
     """Service for lead management and suggestions"""
 
+    @staticmethod
+    def build_lead_analysis_prompt(leads_data):
+        """Build the prompt for lead analysis"""
+        leads_json = json.dumps(leads_data)
+        return [
+            {"role": "system",
+             "content": "You are an AI sales assistant helping a financial agent analyze customer leads to identify the most promising ones."},
+            {"role": "user",
+             "content": f"Analyze these leads and identify the 3 most promising ones with specific reasons for each. Also provide 1 general tip for improving lead conversion: {leads_json}"}
+        ]
+
     @classmethod
     def analyze_leads(cls, user, leads_data):
         """Analyze leads and provide insights"""
         try:
-            # Create prompt
-            leads_json = json.dumps(leads_data)
-            prompt = [
-                {"role": "system",
-                 "content": "You are an AI sales assistant helping a financial agent analyze customer leads to identify the most promising ones."},
-                {"role": "user",
-                 "content": f"Analyze these leads and identify the 3 most promising ones with specific reasons for each. Also provide 1 general tip for improving lead conversion: {leads_json}"}
-            ]
+            if len(leads_data) > lead_pipeline.chunk_size:
+                # Too many leads for one prompt: score them in chunks, then merge
+                prompt, response = lead_pipeline.run(cls, user, leads_data)
+            else:
+                # Create prompt
+                prompt = cls.build_lead_analysis_prompt(leads_data)
 
-            # Generate response
-            response = cls.generate_response(prompt, max_tokens=700)
+                # Generate response
+                response = cls.generate_response(prompt, max_tokens=700, user=user, request_type='lead')
 
             # Log interaction
             cls.log_interaction(user, 'lead', prompt, response)
@@ -199,20 +570,47 @@ class LeadService(AIService):
             logger.error(f"Error analyzing leads: {str(e)}")
             return {'status': 'error', 'message': str(e)}
 
+    @classmethod
+    async def aanalyze_leads(cls, user, leads_data):
+        """Async version of analyze_leads"""
+        try:
+            if len(leads_data) > lead_pipeline.chunk_size:
+                prompt, response = await lead_pipeline.arun(cls, user, leads_data)
+            else:
+                # Create prompt
+                prompt = cls.build_lead_analysis_prompt(leads_data)
+
+                # Generate response
+                response = await cls.agenerate_response(prompt, max_tokens=700, user=user, request_type='lead')
+
+            # Log interaction
+            await cls.alog_interaction(user, 'lead', prompt, response)
+
+            return {'status': 'success', 'response': response}
+
+        except Exception as e:
+            logger.error(f"Error analyzing leads: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @staticmethod
+    def build_outreach_prompt(lead_data, product_type):
+        """Build the prompt for a lead outreach message"""
+        return [
+            {"role": "system",
+             "content": f"You are an AI assistant helping a financial agent create personalized outreach messages for potential {product_type} customers in India."},
+            {"role": "user",
+             "content": f"Create a short, personalized WhatsApp or SMS message for this lead interested in {product_type}. The message should be friendly, concise, and include a clear next step: {json.dumps(lead_data)}"}
+        ]
+
     @classmethod
     def generate_outreach_message(cls, user, lead_data, product_type):
         """Generate a personalized outreach message for a lead"""
         try:
             # Create prompt
-            prompt = [
-                {"role": "system",
-                 "content": f"You are an AI assistant helping a financial agent create personalized outreach messages for potential {product_type} customers in India."},
-                {"role": "user",
-                 "content": f"Create a short, personalized WhatsApp or SMS message for this lead interested in {product_type}. The message should be friendly, concise, and include a clear next step: {json.dumps(lead_data)}"}
-            ]
+            prompt = cls.build_outreach_prompt(lead_data, product_type)
 
             # Generate response
-            response = cls.generate_response(prompt, max_tokens=300)
+            response = cls.generate_response(prompt, max_tokens=300, user=user, request_type='lead')
 
             # Log interaction
             cls.log_interaction(user, 'lead', prompt, response)
@@ -223,25 +621,87 @@ class LeadService(AIService):
             logger.error(f"Error generating outreach message: {str(e)}")
             return {'status': 'error', 'message': str(e)}
 
+    @classmethod
+    async def agenerate_outreach_message(cls, user, lead_data, product_type):
+        """Async version of generate_outreach_message"""
+        try:
+            # Create prompt
+            prompt = cls.build_outreach_prompt(lead_data, product_type)
+
+            # Generate response
+            response = await cls.agenerate_response(prompt, max_tokens=300, user=user, request_type='lead')
+
+            # Log interaction
+            await cls.alog_interaction(user, 'lead', prompt, response)
+
+            return {'status': 'success', 'response': response}
+
+        except Exception as e:
+            logger.error(f"Error generating outreach message: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @classmethod
+    def generate_outreach_messages(cls, user, leads_data):
+        """
+        Generate outreach messages for several leads, several leads per call
+
+        Args:
+            user (User): Agent the messages are written for
+            leads_data (list): Lead dictionaries with id, name, interest, status and notes
+
+        Returns:
+            dict: Status, messages by lead id, and the ids no message could be written for
+        """
+        try:
+            messages = outreach_batcher.run(cls, user, leads_data)
+            return cls._outreach_result(leads_data, messages)
+
+        except Exception as e:
+            logger.error(f"Error generating outreach messages: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @classmethod
+    async def agenerate_outreach_messages(cls, user, leads_data):
+        """Async version of generate_outreach_messages"""
+        try:
+            messages = await outreach_batcher.arun(cls, user, leads_data)
+            return cls._outreach_result(leads_data, messages)
+
+        except Exception as e:
+            logger.error(f"Error generating outreach messages: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @staticmethod
+    def _outreach_result(leads_data, messages):
+        failed = [lead['id'] for lead in leads_data if lead['id'] not in messages]
+        if leads_data and len(failed) == len(leads_data):
+            return {'status': 'error', 'message': 'Could not generate outreach messages', 'failed': failed}
+        return {'status': 'success', 'messages': messages, 'failed': failed}
+
 
 class PerformanceInsightService(AIService):
     """Service for generating performance insights"""
 
+    @staticmethod
+    def build_insight_prompt(sales_data):
+        """Build the prompt for a performance insight"""
+        sales_json = json.dumps(sales_data)
+        return [
+            {"role": "system",
+             "content": "You are an AI assistant that analyzes sales performance data and provides helpful insights and suggestions for financial agents in India."},
+            {"role": "user",
+             "content": f"Analyze this sales performance data and provide ONE concise, actionable insight that can help improve results: {sales_json}"}
+        ]
+
     @classmethod
     def generate_insight(cls, user, sales_data):
         """Generate performance insight from sales data"""
         try:
             # Create prompt
-            sales_json = json.dumps(sales_data)
-            prompt = [
-                {"role": "system",
-                 "content": "You are an AI assistant that analyzes sales performance data and provides helpful insights and suggestions for financial agents in India."},
-                {"role": "user",
-                 "content": f"Analyze this sales performance data and provide ONE concise, actionable insight that can help improve results: {sales_json}"}
-            ]
+            prompt = cls.build_insight_prompt(sales_data)
 
             # Generate response
-            response = cls.generate_response(prompt, max_tokens=300)
+            response = cls.generate_response(prompt, max_tokens=300, user=user, request_type='performance')
 
             # Create insight object
             insight = AIInsight.objects.create(
@@ -259,21 +719,52 @@ class PerformanceInsightService(AIService):
             logger.error(f"Error generating performance insight: {str(e)}")
             return {'status': 'error', 'message': str(e)}
 
+    @classmethod
+    async def agenerate_insight(cls, user, sales_data):
+        """Async version of generate_insight"""
+        try:
+            # Create prompt
+            prompt = cls.build_insight_prompt(sales_data)
+
+            # Generate response
+            response = await cls.agenerate_response(prompt, max_tokens=300, user=user, request_type='performance')
+
+            # Create insight object
+            insight = await AIInsight.objects.acreate(
+                user=user,
+                insight_text=response,
+                category='performance'
+            )
+
+            # Log interaction
+            await cls.alog_interaction(user, 'performance', prompt, response)
+
+            return {'status': 'success', 'insight': response, 'insight_id': insight.id}
+
+        except Exception as e:
+            logger.error(f"Error generating performance insight: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @staticmethod
+    def build_next_action_prompt(recent_activity):
+        """Build the prompt for a next-best-action suggestion"""
+        activity_json = json.dumps(recent_activity)
+        return [
+            {"role": "system",
+             "content": "You are an AI assistant that suggests the next best action for financial agents to maximize their sales and earnings."},
+            {"role": "user",
+             "content": f"Based on this agent's recent activity, suggest ONE specific, high-value action they should take next to improve their results: {activity_json}"}
+        ]
+
     @classmethod
     def suggest_next_action(cls, user, recent_activity):
         """Suggest next best action for the agent"""
         try:
             # Create prompt
-            activity_json = json.dumps(recent_activity)
-            prompt = [
-                {"role": "system",
-                 "content": "You are an AI assistant that suggests the next best action for financial agents to maximize their sales and earnings."},
-                {"role": "user",
-                 "content": f"Based on this agent's recent activity, suggest ONE specific, high-value action they should take next to improve their results: {activity_json}"}
-            ]
+            prompt = cls.build_next_action_prompt(recent_activity)
 
             # Generate response
-            response = cls.generate_response(prompt, max_tokens=300)
+            response = cls.generate_response(prompt, max_tokens=300, user=user, request_type='performance')
 
             # Create insight object
             insight = AIInsight.objects.create(
@@ -287,6 +778,32 @@ class PerformanceInsightService(AIService):
 
             return {'status': 'success', 'suggestion': response, 'insight_id': insight.id}
 
+        except Exception as e:
+            logger.error(f"Error suggesting next action: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+
+    @classmethod
+    async def asuggest_next_action(cls, user, recent_activity):
+        """Async version of suggest_next_action"""
+        try:
+            # Create prompt
+            prompt = cls.build_next_action_prompt(recent_activity)
+
+            # Generate response
+            response = await cls.agenerate_response(prompt, max_tokens=300, user=user, request_type='performance')
+
+            # Create insight object
+            insight = await AIInsight.objects.acreate(
+                user=user,
+                insight_text=response,
+                category='sales'
+            )
+
+            # Log interaction
+            await cls.alog_interaction(user, 'performance', prompt, response)
+
+            return {'status': 'success', 'suggestion': response, 'insight_id': insight.id}
+
         except Exception as e:
             logger.error(f"Error suggesting next action: {str(e)}")
             return {'status': 'error', 'message': str(e)}
\ No newline at end of file
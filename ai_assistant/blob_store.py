@@ -0,0 +1,91 @@
+import zlib
+import hashlib
+import logging
+
+from django.conf import settings
+
+from .ai_cache import LRUCache
+from .models import AIContentBlob
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+COMPRESSION_LEVEL = 6
+
+# How long a digest's blob id is remembered, in seconds
+KNOWN_DIGEST_TTL = 60 * 60 * 24
+
+
+def content_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compress(text):
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(bytes(data)).decode('utf-8')
+
+
+class BlobStore:
+    """
+    Content-addressed storage for AIResponse prompt and response bodies
+
+    Each distinct body is stored once, zlib-compressed, under its SHA-256
+    digest. The ids of recently seen digests are kept in memory, so the
+    system prompts that most rows share cost no queries at all.
+    """
+
+    def __init__(self, max_known=5000):
+        self.known = LRUCache(max_known)
+
+    def store_many(self, texts):
+        """
+        Make sure a blob exists for every text
+
+        Args:
+            texts (iterable): Prompt or response bodies
+
+        Returns:
+            dict: Maps each digest to its AIContentBlob id
+        """
+        by_digest = {content_digest(text): text for text in texts}
+        ids = {}
+        missing = []
+        for digest in by_digest:
+            blob_id = self.known.get(digest)
+            if blob_id is None:
+                missing.append(digest)
+            else:
+                ids[digest] = blob_id
+
+        if missing:
+            existing = dict(AIContentBlob.objects.filter(digest__in=missing).values_list('digest', 'id'))
+            new_blobs = [
+                AIContentBlob(digest=digest, data=compress(by_digest[digest]), size=len(by_digest[digest]))
+                for digest in missing if digest not in existing
+            ]
+            if new_blobs:
+                # Another writer may insert the same digest concurrently
+                AIContentBlob.objects.bulk_create(new_blobs, ignore_conflicts=True)
+                existing.update(AIContentBlob.objects.filter(
+                    digest__in=[blob.digest for blob in new_blobs]
+                ).values_list('digest', 'id'))
+            for digest, blob_id in existing.items():
+                self.known.set(digest, blob_id, KNOWN_DIGEST_TTL)
+            ids.update(existing)
+        return ids
+
+    def attach(self, entries):
+        """Move the prompt and response bodies of AIResponse instances into blobs"""
+        ids = self.store_many([e.prompt for e in entries] + [e.response for e in entries])
+        for entry in entries:
+            entry.prompt_blob_id = ids[content_digest(entry.prompt)]
+            entry.response_blob_id = ids[content_digest(entry.response)]
+            entry.prompt = ''
+            entry.response = ''
+        return entries
+
+
+blob_store = BlobStore(max_known=getattr(settings, 'AI_BLOB_CACHE_SIZE', 5000))
@@ -0,0 +1,171 @@
+import json
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rough average for English text with the gpt-3.5 tokenizer
+CHARS_PER_TOKEN = 4
+
+# Per-message overhead for the role and message separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def estimate_tokens(message):
+    """Estimate the number of prompt tokens a chat message will use"""
+    content = message.get('content') or ''
+    return len(content) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_digest(turns):
+    """Hash of the turns a summary was made from"""
+    history = json.dumps([[m.get('role'), m.get('content')] for m in turns])
+    return hashlib.sha256(history.encode('utf-8')).hexdigest()
+
+
+class ConversationContextManager:
+    """
+    Keep a conversation's prompt under a token budget
+
+    Leading system messages and the most recent turns are sent verbatim.
+    Older turns are folded into a rolling summary that is cached per
+    conversation, so each request only summarizes turns that have newly
+    fallen out of the window. A cached summary is stored with a digest of
+    the turns it covers and only reused while those turns are unchanged,
+    so chats that merely share a key never share a summary.
+    """
+
+    def __init__(self, max_tokens=None, recent_turns=None, summary_tokens=None, cache_timeout=None):
+        self.max_tokens = max_tokens or getattr(settings, 'AI_CONTEXT_MAX_TOKENS', 3000)
+        self.recent_turns = recent_turns or getattr(settings, 'AI_CONTEXT_RECENT_TURNS', 6)
+        self.summary_tokens = summary_tokens or getattr(settings, 'AI_CONTEXT_SUMMARY_TOKENS', 250)
+        self.cache_timeout = cache_timeout or getattr(settings, 'AI_CONTEXT_CACHE_TIMEOUT', 60 * 60 * 6)
+
+    @staticmethod
+    def conversation_key(user, messages, conversation_id=None):
+        """Identify a conversation by its id, or by its opening messages"""
+        if conversation_id is None:
+            opening = json.dumps(messages[:2], sort_keys=True)
+            conversation_id = hashlib.sha256(opening.encode('utf-8')).hexdigest()
+        return f"copilot_summary:{user.pk}:{conversation_id}"
+
+    @staticmethod
+    def split_system(messages):
+        """Split leading system messages from the conversation turns"""
+        index = 0
+        while index < len(messages) and messages[index].get('role') == 'system':
+            index += 1
+        return messages[:index], messages[index:]
+
+    def required_fold_count(self, system, turns):
+        """Return how many of the oldest turns must be folded to fit the budget"""
+        if sum(estimate_tokens(m) for m in system + turns) <= self.max_tokens:
+            return 0
+
+        budget = self.max_tokens - sum(estimate_tokens(m) for m in system) - self.summary_tokens
+        used = 0
+        kept = 0
+        for message in reversed(turns):
+            used += estimate_tokens(message)
+            # Always keep the latest turn, even if it alone exceeds the budget
+            if used > budget and kept > 0:
+                break
+            kept += 1
+        return len(turns) - kept
+
+    def plan(self, user, messages, conversation_id=None):
+        """
+        Work out what needs summarizing for this request
+
+        Returns:
+            tuple: (key, system, turns, fold_count, previous_summary, to_summarize)
+            where ``to_summarize`` is None if the cached summary can be reused
+        """
+        system, turns = self.split_system(messages)
+        needed = self.required_fold_count(system, turns)
+        key = self.conversation_key(user, messages, conversation_id)
+        if needed == 0:
+            return key, system, turns, 0, None, None
+
+        cached = cache.get(key)
+        if cached and (cached['count'] > len(turns)
+                       or cached.get('digest') != history_digest(turns[:cached['count']])):
+            # Made from a different history, e.g. another chat with the same opening messages
+            cached = None
+        if cached and needed <= cached['count'] < len(turns):
+            # The folded window still covers everything that has to go
+            return key, system, turns, cached['count'], cached['summary'], None
+
+        # Fold down to the recent window so the next few turns reuse this summary
+        fold_count = max(needed, len(turns) - self.recent_turns)
+        if cached and cached['count'] <= fold_count:
+            return key, system, turns, fold_count, cached['summary'], turns[cached['count']:fold_count]
+        return key, system, turns, fold_count, None, turns[:fold_count]
+
+    def build_summary_prompt(self, previous_summary, turns):
+        """Build the prompt that folds turns into the rolling summary"""
+        transcript = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in turns)
+        if previous_summary:
+            transcript = f"{SUMMARY_PREFIX}{previous_summary}\n{transcript}"
+        return [
+            {"role": "system",
+             "content": "You summarize sales conversations between a financial agent and an AI sales assistant. Keep customer needs, objections raised, products discussed and any commitments made."},
+            {"role": "user",
+             "content": f"Update the summary of this conversation in under {self.summary_tokens} tokens:\n{transcript}"}
+        ]
+
+    def assemble(self, key, system, turns, fold_count, summary, summarized):
+        """Cache a fresh summary and build the trimmed message list"""
+        from .ai_services import FALLBACK_RESPONSE
+
+        if summary == FALLBACK_RESPONSE:
+            # Summarization failed; drop the old turns rather than overflow the context
+            logger.warning(f"Could not summarize conversation {key}; truncating history")
+            return system + turns[fold_count:]
+
+        if summarized:
+            cache.set(key, {'count': fold_count, 'summary': summary, 'digest': history_digest(turns[:fold_count])},
+                      self.cache_timeout)
+
+        summary_message = {"role": "system", "content": f"{SUMMARY_PREFIX}{summary}"}
+        return system + [summary_message] + turns[fold_count:]
+
+    def fit(self, user, messages, conversation_id=None):
+        """Return ``messages`` trimmed to the token budget"""
+        from .ai_services import AIService
+
+        key, system, turns, fold_count, summary, to_summarize = self.plan(user, messages, conversation_id)
+        if fold_count == 0:
+            return messages
+
+        if to_summarize is not None:
+            prompt = self.build_summary_prompt(summary, to_summarize)
+            summary = AIService.generate_response(prompt, max_tokens=self.summary_tokens, user=user,
+                                                   request_type='copilot')
+        return self.assemble(key, system, turns, fold_count, summary, to_summarize is not None)
+
+    async def afit(self, user, messages, conversation_id=None):
+        """Async version of fit"""
+        from .ai_services import AIService
+
+        key, system, turns, fold_count, summary, to_summarize = await sync_to_async(self.plan)(
+            user, messages, conversation_id
+        )
+        if fold_count == 0:
+            return messages
+
+        if to_summarize is not None:
+            prompt = self.build_summary_prompt(summary, to_summarize)
+            summary = await AIService.agenerate_response(prompt, max_tokens=self.summary_tokens, user=user,
+                                                          request_type='copilot')
+        return await sync_to_async(self.assemble)(key, system, turns, fold_count, summary, to_summarize is not None)
+
+
+context_manager = ConversationContextManager()
@@ -0,0 +1,103 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .ai_cache import LRUCache
+from .models import Conversation, Message
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def build_system_prompt(customer_type, product_type):
+    """Build the co-pilot system prompt for a conversation"""
+    return (
+        "You are an AI sales assistant helping a GroMo Partner (GP) sell financial products in India. "
+        f"The GP is currently talking to a {customer_type} customer about a {product_type} product. "
+        "Provide real-time sales suggestions, objection handling tips, and product information to help the GP close the sale. "
+        "Keep suggestions brief, practical, and tailored to the Indian market context."
+    )
+
+
+class CopilotSessionStore:
+    """
+    Server-held co-pilot conversations
+
+    The Conversation and Message rows are the source of truth. Message
+    history is kept in an in-process hot cache, stamped with the
+    conversation's ``last_updated`` so that a cached copy is only used if no
+    other worker has appended to the conversation since.
+    """
+
+    def __init__(self, max_sessions=500, ttl=60 * 60 * 6):
+        self.ttl = ttl
+        self.history = LRUCache(max_sessions)
+
+    def create(self, user, customer_type, product_type, title=None):
+        """Start a new co-pilot session"""
+        conversation = Conversation.objects.create(
+            user=user,
+            customer_type=customer_type,
+            product_type=product_type,
+            title=title or f"{product_type.replace('_', ' ').title()} conversation - {timezone.now().strftime('%Y-%m-%d')}"
+        )
+        self.history.set(conversation.id, (conversation.last_updated, ()), self.ttl)
+        return conversation
+
+    def get(self, user, session_id):
+        """Return the user's conversation for a session id, or None"""
+        return Conversation.objects.filter(id=session_id, user=user).first()
+
+    def get_history(self, conversation):
+        """Return the conversation's turns as message dictionaries"""
+        cached = self.history.get(conversation.id)
+        if cached is not None and cached[0] == conversation.last_updated:
+            return list(cached[1])
+
+        turns = tuple(
+            {'role': role, 'content': content}
+            for role, content in conversation.messages.exclude(role='system').values_list('role', 'content')
+        )
+        self.history.set(conversation.id, (conversation.last_updated, turns), self.ttl)
+        return list(turns)
+
+    def build_messages(self, conversation):
+        """Return the full prompt for the conversation, system message first"""
+        system = {'role': 'system',
+                  'content': build_system_prompt(conversation.customer_type, conversation.product_type)}
+        return [system] + self.get_history(conversation)
+
+    def append(self, conversation, role, content):
+        """Store a new turn and refresh the hot cache"""
+        turns = self.get_history(conversation)
+        Message.objects.create(conversation=conversation, role=role, content=content)
+
+        # Bump last_updated so other workers know their cached history is stale
+        conversation.save(update_fields=['last_updated'])
+
+        turns.append({'role': role, 'content': content})
+        self.history.set(conversation.id, (conversation.last_updated, tuple(turns)), self.ttl)
+
+    async def acreate(self, user, customer_type, product_type, title=None):
+        """Async version of create"""
+        return await sync_to_async(self.create)(user, customer_type, product_type, title)
+
+    async def aget(self, user, session_id):
+        """Async version of get"""
+        return await Conversation.objects.filter(id=session_id, user=user).afirst()
+
+    async def abuild_messages(self, conversation):
+        """Async version of build_messages"""
+        return await sync_to_async(self.build_messages)(conversation)
+
+    async def aappend(self, conversation, role, content):
+        """Async version of append"""
+        await sync_to_async(self.append)(conversation, role, content)
+
+
+copilot_sessions = CopilotSessionStore(
+    max_sessions=getattr(settings, 'AI_COPILOT_SESSION_CACHE_SIZE', 500),
+    ttl=getattr(settings, 'AI_COPILOT_SESSION_TTL', 60 * 60 * 6)
+)
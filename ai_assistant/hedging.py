@@ -0,0 +1,216 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+
+from django.conf import settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling latency samples per request type"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key, pct):
+        """Return the ``pct`` percentile for ``key``, or None until there are enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class HedgeBudget:
+    """
+    Cap hedged calls to a fraction of recent calls
+
+    With a ratio of 0.05 at most one call in twenty is duplicated, so
+    hedging adds at most about 5% to upstream token spend.
+    """
+
+    def __init__(self, ratio=0.05, window=200):
+        self.ratio = ratio
+        self._calls = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self._calls.append(False)
+
+    def try_spend(self):
+        """Mark the latest call as hedged if the budget allows it"""
+        with self._lock:
+            if not self._calls or sum(self._calls) + 1 > self.ratio * len(self._calls):
+                return False
+            self._calls[-1] = True
+            return True
+
+
+class Hedger:
+    """
+    Send a second identical call when the first is slower than usual
+
+    If the first call has not answered within the observed p95 latency for
+    its request type, a duplicate is started and whichever succeeds first
+    wins. The loser of an async race is cancelled; a sync loser runs to
+    completion in the background and is discarded.
+
+    Sync legs run on a pool of ``max_workers`` threads, but never wait for
+    one: when every worker is busy the call runs inline on the caller's
+    thread, unhedged, so the pool never caps concurrent upstream calls. The
+    hedge delay is measured from when the primary leg starts.
+    """
+
+    def __init__(self, tracker, budget, percentile=95, max_workers=8):
+        self.tracker = tracker
+        self.budget = budget
+        self.percentile = percentile
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._workers = threading.BoundedSemaphore(max_workers)
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ai-hedge')
+            return self._executor
+
+    def hedge_delay(self, key):
+        return self.tracker.percentile(key, self.percentile)
+
+    def _timed(self, fn, key):
+        started = time.monotonic()
+        result = fn()
+        self.tracker.record(key, time.monotonic() - started)
+        return result
+
+    def _submit(self, fn, key, started=None):
+        """Start a leg on a free worker; returns its future, or None if every worker is busy"""
+        if not self._workers.acquire(blocking=False):
+            return None
+
+        def leg():
+            try:
+                if started is not None:
+                    started.set()
+                return self._timed(fn, key)
+            finally:
+                self._workers.release()
+
+        # Each leg runs in a copy of the caller's context so it sees the request deadline
+        return self.executor.submit(contextvars.copy_context().run, leg)
+
+    def call(self, fn, key):
+        """
+        Call ``fn()``, hedging it if it is slow
+
+        Args:
+            fn (callable): Makes one upstream call and returns its result
+            key (str): Request type the latency is tracked under
+
+        Returns:
+            The result of the first leg to succeed
+        """
+        self.budget.record_call()
+        self.stats['calls'] += 1
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return self._timed(fn, key)
+
+        started = threading.Event()
+        primary = self._submit(fn, key, started)
+        if primary is None:
+            return self._timed(fn, key)
+
+        started.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.budget.try_spend():
+            return primary.result()
+
+        hedge = self._submit(fn, key)
+        if hedge is None:
+            return primary.result()
+        self.stats['hedged'] += 1
+        logger.info(f"Hedging slow {key} call after {delay:.2f}s")
+        for future in as_completed([primary, hedge]):
+            if future.exception() is None:
+                if future is hedge:
+                    self.stats['hedge_wins'] += 1
+                return future.result()
+        # Both legs failed; report the original error
+        return primary.result()
+
+    async def acall(self, coro_fn, key):
+        """Async version of call; ``coro_fn()`` returns a new coroutine per leg"""
+        self.budget.record_call()
+        self.stats['calls'] += 1
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return await self._atimed(coro_fn, key)
+
+        primary = asyncio.ensure_future(self._atimed(coro_fn, key))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done or not self.budget.try_spend():
+                return await primary
+
+            self.stats['hedged'] += 1
+            logger.info(f"Hedging slow {key} call after {delay:.2f}s")
+            hedge = asyncio.ensure_future(self._atimed(coro_fn, key))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats['hedge_wins'] += 1
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _atimed(self, coro_fn, key):
+        started = time.monotonic()
+        result = await coro_fn()
+        self.tracker.record(key, time.monotonic() - started)
+        return result
+
+
+def should_hedge(request_type, hedge=None):
+    """Hedge if asked to, or by default for the request types in AI_HEDGE_REQUEST_TYPES"""
+    if hedge is not None:
+        return hedge
+    return request_type in getattr(settings, 'AI_HEDGE_REQUEST_TYPES', ())
+
+
+hedger = Hedger(
+    LatencyTracker(
+        window=getattr(settings, 'AI_HEDGE_WINDOW', 200),
+        min_samples=getattr(settings, 'AI_HEDGE_MIN_SAMPLES', 20)
+    ),
+    HedgeBudget(
+        ratio=getattr(settings, 'AI_HEDGE_BUDGET_RATIO', 0.05),
+        window=getattr(settings, 'AI_HEDGE_WINDOW', 200)
+    ),
+    percentile=getattr(settings, 'AI_HEDGE_PERCENTILE', 95),
+    max_workers=getattr(settings, 'AI_HEDGE_MAX_WORKERS', 32)
+)
@@ -0,0 +1,187 @@
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .blob_store import blob_store
+from .models import AIResponse
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Queued by close() to wake the writer thread
+_STOP = object()
+
+
+class InteractionLogBuffer:
+    """
+    Write-behind buffer for AIResponse rows
+
+    Requests only put records on a bounded in-memory queue; a background
+    thread writes them with bulk_create once ``batch_size`` records are
+    waiting or ``flush_interval`` seconds have passed. A batch that cannot
+    be written (e.g. "database is locked") is retried ``retries`` times with
+    exponential backoff and then put back on the queue, at most
+    ``max_requeues`` times per record. Records are only dropped, and counted,
+    when the queue is full. Whatever is left is flushed when the process exits.
+    """
+
+    def __init__(self, max_size=10000, batch_size=200, flush_interval=2.0, retries=3, retry_delay=0.2,
+                 max_requeues=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_requeues = max_requeues
+        self._queue = queue.Queue(maxsize=max_size)
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'retried': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, counter, amount=1):
+        with self._stats_lock:
+            self.stats[counter] += amount
+            return self.stats[counter]
+
+    def record(self, user, request_type, prompt, response):
+        """Queue an interaction for logging; never blocks"""
+        entry = AIResponse(
+            user=user,
+            request_type=request_type,
+            prompt=json.dumps(prompt) if isinstance(prompt, list) else prompt,
+            response=response
+        )
+        if not self._put(entry):
+            return
+        self._count('queued')
+        self._ensure_thread()
+
+    def _put(self, entry):
+        """Queue a record, dropping it if the queue is full; returns whether it was queued"""
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            dropped = self._count('dropped')
+            if dropped % 100 == 1:
+                logger.warning(f"AI interaction log buffer full; {dropped} records dropped so far")
+            return False
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='ai-interaction-log', daemon=True)
+                self._thread.start()
+
+    def _take_batch(self, timeout):
+        """Collect up to batch_size records, waiting at most ``timeout`` seconds for them"""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                break
+            batch.append(entry)
+        return batch
+
+    def _write_once(self, batch):
+        """Write a batch in one transaction; on failure leave the records as they were"""
+        bodies = [(entry.prompt, entry.response) for entry in batch]
+        try:
+            with transaction.atomic():
+                # Prompts and responses are stored once each, compressed
+                blob_store.attach(batch)
+                AIResponse.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            # Blob ids remembered during the rolled back transaction may not exist
+            blob_store.known.clear()
+            for entry, (prompt, response) in zip(batch, bodies):
+                entry.prompt, entry.response = prompt, response
+                entry.prompt_blob_id = entry.response_blob_id = None
+            raise
+
+    def _write(self, batch, final=False):
+        """
+        Write a batch, retrying with backoff and then re-queueing it
+
+        ``final`` writes are made once, on shutdown, when there is neither
+        time to back off nor a writer left to take re-queued records.
+        """
+        if not batch:
+            return
+        with self._write_lock:
+            retries = 0 if final else self.retries
+            for attempt in range(retries + 1):
+                try:
+                    self._write_once(batch)
+                    self._count('written', len(batch))
+                    return
+                except Exception as e:
+                    error = e
+                if attempt < retries:
+                    self._count('retried')
+                    time.sleep(self.retry_delay * 2 ** attempt)
+
+        logger.error(f"Error logging AI interactions: {str(error)}")
+        for entry in batch:
+            entry._log_requeues = getattr(entry, '_log_requeues', 0) + 1
+            if final or entry._log_requeues > self.max_requeues:
+                self._count('failed')
+            else:
+                self._put(entry)
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                self._write(self._take_batch(self.flush_interval))
+        finally:
+            connection.close()
+
+    def flush(self, final=False):
+        """Write everything that is currently queued"""
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                return
+            self._write(batch, final)
+
+    def close(self):
+        """Stop the background writer and flush the remaining records"""
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                pass
+            self._thread.join(self.flush_interval + 5)
+        self.flush(final=True)
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats, pending=self._queue.qsize())
+
+
+interaction_log = InteractionLogBuffer(
+    max_size=getattr(settings, 'AI_LOG_BUFFER_SIZE', 10000),
+    batch_size=getattr(settings, 'AI_LOG_BATCH_SIZE', 200),
+    flush_interval=getattr(settings, 'AI_LOG_FLUSH_INTERVAL', 2.0),
+    retries=getattr(settings, 'AI_LOG_RETRIES', 3),
+    retry_delay=getattr(settings, 'AI_LOG_RETRY_DELAY', 0.2)
+)
+
+atexit.register(interaction_log.close)
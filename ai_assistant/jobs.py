@@ -0,0 +1,312 @@
+import random
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import AIJob
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# job_type -> callable(job) returning a JSON-serializable result
+JOB_HANDLERS = {}
+
+
+class JobError(Exception):
+    """Raised by a handler when its AI call did not produce a usable result"""
+    pass
+
+
+def job_handler(job_type):
+    """Register a function as the handler for a job type"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def visibility_timeout():
+    return getattr(settings, 'AI_JOB_VISIBILITY_TIMEOUT', 300)
+
+
+def enqueue(job_type, payload=None, user=None, dedup_key=None, max_attempts=None):
+    """
+    Queue a job for the AI workers
+
+    Args:
+        job_type (str): A registered job type
+        payload (dict): JSON-serializable arguments for the handler
+        user (User): User the job runs for
+        dedup_key (str): If a queued or running job has the same key, that
+            job is returned instead of creating a new one
+        max_attempts (int): Attempts before the job is marked failed
+
+    Returns:
+        AIJob: The new or existing job
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    if dedup_key:
+        existing = AIJob.objects.filter(dedup_key=dedup_key, status__in=['queued', 'running']).first()
+        if existing is not None:
+            return existing
+
+    try:
+        with transaction.atomic():
+            return AIJob.objects.create(
+                user=user,
+                job_type=job_type,
+                payload=payload or {},
+                dedup_key=dedup_key or None,
+                max_attempts=max_attempts or getattr(settings, 'AI_JOB_MAX_ATTEMPTS', 3)
+            )
+    except IntegrityError:
+        # Another request queued the same job first
+        return AIJob.objects.get(dedup_key=dedup_key, status__in=['queued', 'running'])
+
+
+def claim_next(worker_id):
+    """
+    Claim the next runnable job for ``worker_id``
+
+    A job is runnable if it is queued and due, or if it is running but its
+    worker's visibility timeout has passed (the worker is assumed dead).
+    Claiming is a conditional UPDATE, so two workers can never claim the
+    same job.
+
+    Returns:
+        AIJob or None
+    """
+    now = timezone.now()
+    runnable = AIJob.objects.filter(
+        Q(status='queued', available_at__lte=now) | Q(status='running', locked_until__lt=now)
+    ).order_by('available_at', 'id')
+
+    for job in runnable.only('id', 'status', 'locked_until')[:10]:
+        claimed = AIJob.objects.filter(
+            id=job.id, status=job.status, locked_until=job.locked_until
+        ).update(
+            status='running',
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=visibility_timeout()),
+            attempts=F('attempts') + 1,
+            updated_at=now
+        )
+        if claimed:
+            job = AIJob.objects.get(id=job.id)
+            if job.attempts > job.max_attempts:
+                # The last attempt timed out without reporting back
+                _finish(job, worker_id, 'failed', error='Visibility timeout expired on final attempt')
+                continue
+            return job
+    return None
+
+
+def _finish(job, worker_id, status, result=None, error=''):
+    """Record the outcome, unless another worker has since reclaimed the job"""
+    now = timezone.now()
+    return AIJob.objects.filter(id=job.id, status='running', locked_by=worker_id).update(
+        status=status, result=result, error=error, locked_until=None, finished_at=now, updated_at=now
+    )
+
+
+def _retry_later(job, worker_id, error):
+    delay = getattr(settings, 'AI_JOB_RETRY_DELAY', 30) * (2 ** (job.attempts - 1))
+    now = timezone.now()
+    return AIJob.objects.filter(id=job.id, status='running', locked_by=worker_id).update(
+        status='queued',
+        error=error,
+        available_at=now + timedelta(seconds=random.uniform(delay / 2, delay)),
+        locked_until=None,
+        updated_at=now
+    )
+
+
+def run_job(job, worker_id):
+    """Run a claimed job and record its outcome"""
+    handler = JOB_HANDLERS.get(job.job_type)
+    if handler is None:
+        _finish(job, worker_id, 'failed', error=f"No handler for job type {job.job_type}")
+        return
+
+    try:
+        result = handler(job)
+    except Exception as e:
+        logger.error(f"Error running AI job {job.id} ({job.job_type}): {str(e)}")
+        if job.attempts < job.max_attempts:
+            _retry_later(job, worker_id, str(e))
+        else:
+            _finish(job, worker_id, 'failed', error=str(e))
+        return
+
+    _finish(job, worker_id, 'succeeded', result=result)
+
+
+def job_status(job):
+    """Return the status of a job as a JSON-serializable dictionary"""
+    data = {
+        'job_id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+    }
+    if job.status == 'succeeded':
+        data['result'] = job.result
+    elif job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+
+def schedule_outreach_prefetch(user):
+    """
+    Queue drafts for the user's top leads if any are missing and budget is left
+
+    Cheap enough to call on every page view: it only reads the budget, the
+    top leads and their stored drafts, and queues at most one prefetch job
+    per user at a time.
+
+    Returns:
+        AIJob: The queued job, or None if nothing needs prefetching
+    """
+    from .outreach import outreach_batcher
+
+    try:
+        if outreach_batcher.remaining_prefetch(user.id) <= 0:
+            return None
+        leads = outreach_batcher.prefetch_candidates(user)
+        if not leads:
+            return None
+        return enqueue(
+            'outreach_prefetch',
+            {'lead_ids': [lead['id'] for lead in leads]},
+            user=user,
+            dedup_key=f"outreach_prefetch:{user.id}",
+            # Speculative work is not worth retrying
+            max_attempts=1
+        )
+    except Exception as e:
+        logger.error(f"Error scheduling outreach prefetch: {str(e)}")
+        return None
+
+
+def schedule_quiz_replenish(product_type, skill_level):
+    """Queue a top-up of a quiz question pool, at most one per pool at a time"""
+    try:
+        return enqueue(
+            'quiz_bank_replenish',
+            {'product_type': product_type, 'skill_level': skill_level},
+            dedup_key=f"quiz_bank_replenish:{product_type}:{skill_level}"
+        )
+    except Exception as e:
+        logger.error(f"Error scheduling quiz bank top-up: {str(e)}")
+        return None
+
+
+def _require_success(result):
+    """Turn a failed service call into a job error so the job is retried"""
+    from .ai_services import FALLBACK_RESPONSE
+
+    if result['status'] != 'success':
+        raise JobError(result.get('message', 'AI service error'))
+    if result.get('response', result.get('insight')) == FALLBACK_RESPONSE:
+        raise JobError('AI service unavailable')
+    return result
+
+
+@job_handler('learning_content')
+def generate_learning_content_job(job):
+    """Give the user the catalog module for a product and level, generating it on a miss"""
+    from .learning_catalog import learning_catalog, CatalogUnavailable
+
+    try:
+        entry = learning_catalog.get_or_generate(job.payload['product_type'], job.payload['skill_level'], job.user)
+    except CatalogUnavailable as e:
+        raise JobError(str(e))
+    learning_content = learning_catalog.assign(job.user, entry)
+
+    return {
+        'content_id': learning_content.id,
+        'url': reverse('ai_assistant:learning_content_detail', kwargs={'content_id': learning_content.id})
+    }
+
+
+@job_handler('lead_analysis')
+def analyze_leads_job(job):
+    """Analyze the user's active leads and store the analysis as an insight"""
+    from dashboard.models import AIInsight, CustomerLead
+    from .ai_services import LeadService
+
+    leads = CustomerLead.objects.filter(id__in=job.payload['lead_ids'], user=job.user)
+
+    # Prepare lead data
+    lead_data = []
+    for lead in leads:
+        lead_data.append({
+            'id': lead.id,
+            'name': lead.name,
+            'interest': lead.interest,
+            'status': lead.status,
+            'lead_source': lead.lead_source,
+            'notes': lead.notes,
+            'created_at': lead.created_at.strftime('%Y-%m-%d')
+        })
+
+    result = _require_success(LeadService.analyze_leads(job.user, lead_data))
+
+    # Create insight
+    insight = AIInsight.objects.create(
+        user=job.user,
+        insight_text=result['response'],
+        category='lead'
+    )
+
+    return {'analysis': result['response'], 'insight_id': insight.id}
+
+
+@job_handler('performance_insight')
+def generate_insight_job(job):
+    """Generate a performance insight from the given sales data"""
+    from dashboard.models import AIInsight
+    from .ai_services import PerformanceInsightService
+
+    result = PerformanceInsightService.generate_insight(job.user, job.payload['sales_data'])
+    try:
+        _require_success(result)
+    except JobError:
+        # Don't leave the fallback text behind as an insight
+        if 'insight_id' in result:
+            AIInsight.objects.filter(id=result['insight_id']).delete()
+        raise
+    return {'insight': result['insight'], 'insight_id': result['insight_id']}
+
+
+@job_handler('outreach_prefetch')
+def prefetch_outreach_job(job):
+    """Write and store outreach drafts for the user's top leads, within the daily budget"""
+    from .ai_services import LeadService
+    from .outreach import outreach_batcher
+
+    # Leads may have been messaged, closed or drafted since the job was queued
+    leads = outreach_batcher.prefetch_candidates(job.user, lead_ids=job.payload['lead_ids'])
+    granted = outreach_batcher.reserve_prefetch(job.user_id, len(leads)) if leads else 0
+    if not granted:
+        return {'prefetched': 0}
+
+    result = LeadService.generate_outreach_messages(job.user, leads[:granted])
+    if result['status'] != 'success':
+        raise JobError(result.get('message', 'AI service error'))
+    return {'prefetched': len(result['messages'])}
+
+
+@job_handler('quiz_bank_replenish')
+def replenish_quiz_bank_job(job):
+    """Top up one quiz question pool"""
+    from .question_bank import question_bank
+
+    added = question_bank.replenish(job.payload['product_type'], job.payload['skill_level'])
+    return {'added': added}
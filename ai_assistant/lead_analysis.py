@@ -0,0 +1,213 @@
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import LeadEvaluation
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+STATUS_WEIGHTS = {'interested': 3.0, 'contacted': 2.0, 'new': 1.0}
+SOURCE_WEIGHTS = {'referral': 1.5, 'campaign': 1.0, 'ai_suggested': 1.0, 'manual': 0.5}
+
+
+def lead_fingerprint(lead):
+    """Hash of everything the analysis sees about a lead"""
+    return hashlib.sha256(json.dumps(lead, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def pre_rank_score(lead):
+    """Cheap local score used to order and cap leads before any AI call"""
+    score = STATUS_WEIGHTS.get(lead.get('status'), 0) + SOURCE_WEIGHTS.get(lead.get('lead_source'), 0)
+    if lead.get('interest') not in (None, '', 'undecided'):
+        score += 1.0
+    if lead.get('notes'):
+        score += 0.5
+    try:
+        age = (timezone.now().date() - datetime.strptime(lead['created_at'], '%Y-%m-%d').date()).days
+        score += max(0.0, 1.0 - age / 90)
+    except (KeyError, TypeError, ValueError):
+        pass
+    return score
+
+
+class LeadAnalysisPipeline:
+    """
+    Map-reduce analysis for large lead pipelines
+
+    Leads are pre-ranked locally and capped. Leads whose data changed since
+    their last evaluation are scored by the model in parallel chunks (map);
+    unchanged leads reuse their stored LeadEvaluation. The best scored leads
+    are then sent to a final call that writes the analysis (reduce).
+    """
+
+    def __init__(self, chunk_size=20, shortlist_size=10, max_leads=300, parallelism=4, notes_chars=300):
+        self.chunk_size = chunk_size
+        self.shortlist_size = shortlist_size
+        self.max_leads = max_leads
+        self.parallelism = parallelism
+        self.notes_chars = notes_chars
+
+    def prepare(self, leads_data):
+        """Trim notes, pre-rank and cap the leads"""
+        leads = []
+        for lead in leads_data:
+            lead = dict(lead)
+            if lead.get('notes') and len(lead['notes']) > self.notes_chars:
+                lead['notes'] = lead['notes'][:self.notes_chars] + '...'
+            leads.append(lead)
+        leads.sort(key=pre_rank_score, reverse=True)
+        return leads[:self.max_leads]
+
+    def plan(self, leads):
+        """
+        Split leads into those with a current evaluation and those to re-analyze
+
+        Returns:
+            tuple: (evaluations by lead id, chunks of leads to analyze, fingerprints by lead id)
+        """
+        fingerprints = {lead['id']: lead_fingerprint(lead) for lead in leads}
+        evaluations = {
+            evaluation.lead_id: evaluation
+            for evaluation in LeadEvaluation.objects.filter(lead_id__in=fingerprints)
+            if evaluation.fingerprint == fingerprints[evaluation.lead_id]
+        }
+        stale = [lead for lead in leads if lead['id'] not in evaluations]
+        chunks = [stale[i:i + self.chunk_size] for i in range(0, len(stale), self.chunk_size)]
+        return evaluations, chunks, fingerprints
+
+    @staticmethod
+    def build_map_prompt(chunk):
+        """Build the prompt that scores one chunk of leads"""
+        return [
+            {"role": "system",
+             "content": "You are an AI sales assistant helping a financial agent analyze customer leads to identify the most promising ones."},
+            {"role": "user",
+             "content": "Score each of these leads from 0 to 100 for how likely they are to convert, with a one-sentence reason. "
+                        "Respond only with a JSON array of objects with the keys id, score and reason: "
+                        f"{json.dumps(chunk)}"}
+        ]
+
+    @staticmethod
+    def parse_scores(response, chunk):
+        """Return {lead id: (score, reason)} for the chunk's leads found in the response"""
+        ids = {lead['id'] for lead in chunk}
+        match = re.search(r'\[.*\]', response, re.DOTALL)
+        try:
+            items = json.loads(match.group(0) if match else response)
+        except (json.JSONDecodeError, TypeError):
+            logger.warning("Could not parse lead scores from model response")
+            return {}
+
+        scores = {}
+        for item in items if isinstance(items, list) else []:
+            try:
+                lead_id = int(item['id'])
+                if lead_id in ids:
+                    scores[lead_id] = (float(item['score']), str(item.get('reason', '')))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return scores
+
+    @staticmethod
+    def save(scores, fingerprints):
+        """Store fresh evaluations so unchanged leads are skipped next time"""
+        for lead_id, (score, reason) in scores.items():
+            LeadEvaluation.objects.update_or_create(
+                lead_id=lead_id,
+                defaults={'fingerprint': fingerprints[lead_id], 'score': score, 'reason': reason}
+            )
+
+    def shortlist(self, leads, evaluations, scores):
+        """Merge stored and fresh scores and return the best leads with their reasons"""
+        merged = {lead_id: (evaluation.score, evaluation.reason) for lead_id, evaluation in evaluations.items()}
+        merged.update(scores)
+
+        # Leads the model could not score keep their local pre-rank order, after the scored ones
+        ranked = sorted(leads, key=lambda lead: (lead['id'] in merged, merged.get(lead['id'], (0,))[0]),
+                        reverse=True)
+        shortlist = []
+        for lead in ranked[:self.shortlist_size]:
+            entry = dict(lead)
+            if lead['id'] in merged:
+                entry['score'], entry['reason'] = merged[lead['id']]
+            shortlist.append(entry)
+        return shortlist
+
+    @staticmethod
+    def build_reduce_prompt(shortlist, total):
+        """Build the prompt that turns the merged shortlist into the final analysis"""
+        return [
+            {"role": "system",
+             "content": "You are an AI sales assistant helping a financial agent analyze customer leads to identify the most promising ones."},
+            {"role": "user",
+             "content": f"These are the highest scoring of {total} leads, each with a score and reason from a first pass. "
+                        "Identify the 3 most promising ones with specific reasons for each. Also provide 1 general tip for improving lead conversion: "
+                        f"{json.dumps(shortlist)}"}
+        ]
+
+    def run(self, service, user, leads_data):
+        """
+        Analyze the leads, calling the model in parallel for changed leads
+
+        Returns:
+            tuple: (reduce prompt, analysis text)
+        """
+        leads = self.prepare(leads_data)
+        evaluations, chunks, fingerprints = self.plan(leads)
+
+        def analyze_chunk(chunk):
+            prompt = self.build_map_prompt(chunk)
+            response = service.generate_response(prompt, max_tokens=60 * len(chunk), user=user, request_type='lead')
+            service.log_interaction(user, 'lead', prompt, response)
+            return self.parse_scores(response, chunk)
+
+        scores = {}
+        if chunks:
+            with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+                for chunk_scores in executor.map(analyze_chunk, chunks):
+                    scores.update(chunk_scores)
+            self.save(scores, fingerprints)
+
+        prompt = self.build_reduce_prompt(self.shortlist(leads, evaluations, scores), len(leads_data))
+        return prompt, service.generate_response(prompt, max_tokens=700, user=user, request_type='lead')
+
+    async def arun(self, service, user, leads_data):
+        """Async version of run"""
+        leads = self.prepare(leads_data)
+        evaluations, chunks, fingerprints = await sync_to_async(self.plan)(leads)
+        semaphore = asyncio.Semaphore(self.parallelism)
+
+        async def analyze_chunk(chunk):
+            prompt = self.build_map_prompt(chunk)
+            async with semaphore:
+                response = await service.agenerate_response(prompt, max_tokens=60 * len(chunk), user=user,
+                                                            request_type='lead')
+            await service.alog_interaction(user, 'lead', prompt, response)
+            return self.parse_scores(response, chunk)
+
+        scores = {}
+        for chunk_scores in await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks)):
+            scores.update(chunk_scores)
+        if scores:
+            await sync_to_async(self.save)(scores, fingerprints)
+
+        prompt = self.build_reduce_prompt(self.shortlist(leads, evaluations, scores), len(leads_data))
+        return prompt, await service.agenerate_response(prompt, max_tokens=700, user=user, request_type='lead')
+
+
+lead_pipeline = LeadAnalysisPipeline(
+    chunk_size=getattr(settings, 'AI_LEAD_ANALYSIS_CHUNK_SIZE', 20),
+    shortlist_size=getattr(settings, 'AI_LEAD_ANALYSIS_SHORTLIST_SIZE', 10),
+    max_leads=getattr(settings, 'AI_LEAD_ANALYSIS_MAX_LEADS', 300),
+    parallelism=getattr(settings, 'AI_LEAD_ANALYSIS_PARALLELISM', 4),
+    notes_chars=getattr(settings, 'AI_LEAD_ANALYSIS_NOTES_CHARS', 300)
+)
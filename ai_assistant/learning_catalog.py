@@ -0,0 +1,110 @@
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import LearningCatalogEntry, LearningContent
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+PRODUCT_TYPES = [value for value, _ in LearningCatalogEntry._meta.get_field('product_type').choices]
+DIFFICULTY_LEVELS = [value for value, _ in LearningCatalogEntry._meta.get_field('difficulty_level').choices]
+
+
+class CatalogUnavailable(Exception):
+    """Raised when a missing catalog entry could not be generated"""
+    pass
+
+
+def summarize(content):
+    """First paragraph of a learning module, used as its summary"""
+    return content.split('\n\n')[0] if '\n\n' in content else content[:100] + '...'
+
+
+class LearningCatalog:
+    """
+    Shared learning content, one module per product type, level and version
+
+    The learning prompt depends only on the product type and skill level,
+    so the generated module is stored once and every partner's
+    LearningContent row points at it. Entries are normally created ahead of
+    time by the warm_learning_catalog command; a missing entry is generated
+    live on first request and stored for everyone after.
+    """
+
+    def __init__(self, version=1):
+        self.version = version
+
+    def get(self, product_type, difficulty_level):
+        """Return the current entry, or None if it hasn't been generated yet"""
+        return LearningCatalogEntry.objects.filter(
+            product_type=product_type, difficulty_level=difficulty_level, version=self.version
+        ).first()
+
+    def generate(self, product_type, difficulty_level, user=None):
+        """
+        Generate the module with the model and store it in the catalog
+
+        Args:
+            product_type (str): Product the module teaches
+            difficulty_level (str): beginner, intermediate or advanced
+            user (User): Partner waiting for it, or None when warming
+
+        Returns:
+            LearningCatalogEntry: The stored entry
+        """
+        from .ai_services import LearningService, FALLBACK_RESPONSE
+
+        result = LearningService.generate_learning_content(user, product_type, difficulty_level)
+        if result['status'] != 'success' or result['response'] == FALLBACK_RESPONSE:
+            raise CatalogUnavailable(result.get('message', 'AI service unavailable'))
+
+        content = result['response']
+        try:
+            with transaction.atomic():
+                return LearningCatalogEntry.objects.create(
+                    product_type=product_type,
+                    difficulty_level=difficulty_level,
+                    version=self.version,
+                    topic=f"Selling {product_type.replace('_', ' ').title()} Products",
+                    content=content,
+                    summary=summarize(content)
+                )
+        except IntegrityError:
+            # Generated concurrently by another worker; keep the stored one
+            return self.get(product_type, difficulty_level)
+
+    def get_or_generate(self, product_type, difficulty_level, user=None):
+        """Return the current entry, generating it on a miss"""
+        entry = self.get(product_type, difficulty_level)
+        if entry is None:
+            entry = self.generate(product_type, difficulty_level, user)
+        return entry
+
+    @staticmethod
+    def assign(user, entry):
+        """Give a partner their own LearningContent row for a catalog entry"""
+        from accounts.models import LearningProgress
+
+        learning_content = LearningContent.objects.create(
+            user=user,
+            catalog_entry=entry,
+            product_type=entry.product_type,
+            topic=entry.topic,
+            difficulty_level=entry.difficulty_level
+        )
+
+        # Update learning progress
+        LearningProgress.objects.get_or_create(
+            user=user,
+            module_name=f"{entry.product_type.replace('_', ' ').title()} Basics",
+            defaults={
+                'completion_percentage': 0,
+                'completed': False
+            }
+        )
+        return learning_content
+
+
+learning_catalog = LearningCatalog(version=getattr(settings, 'AI_LEARNING_CATALOG_VERSION', 1))
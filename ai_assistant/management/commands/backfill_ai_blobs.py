@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ai_assistant.blob_store import blob_store
+from ai_assistant.models import AIResponse
+
+
+class Command(BaseCommand):
+    help = 'Moves AIResponse prompt and response bodies into compressed, deduplicated blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows converted per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = AIResponse.objects.filter(prompt_blob__isnull=True).order_by('id')
+        total = pending.count()
+        self.stdout.write(f'Backfilling {total} AI responses...')
+
+        last_id = 0
+        done = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id).only('id', 'prompt', 'response')[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                blob_store.attach(batch)
+                AIResponse.objects.bulk_update(batch, ['prompt', 'response', 'prompt_blob', 'response_blob'])
+
+            last_id = batch[-1].id
+            done += len(batch)
+            self.stdout.write(f'  {done}/{total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {done} AI responses'))
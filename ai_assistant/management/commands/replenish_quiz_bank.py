@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from ai_assistant.learning_catalog import PRODUCT_TYPES, DIFFICULTY_LEVELS
+from ai_assistant.question_bank import question_bank
+
+
+class Command(BaseCommand):
+    help = 'Tops up quiz question pools that are below their target size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product-type', action='append', choices=PRODUCT_TYPES,
+                            help='Only top up this product type (can be repeated)')
+        parser.add_argument('--level', action='append', choices=DIFFICULTY_LEVELS,
+                            help='Only top up this difficulty level (can be repeated)')
+        parser.add_argument('--max-batches', type=int, default=5,
+                            help='Most generation calls per pool')
+
+    def handle(self, *args, **options):
+        total = 0
+        for product_type in options['product_type'] or PRODUCT_TYPES:
+            for level in options['level'] or DIFFICULTY_LEVELS:
+                size = question_bank.pool_size(product_type, level)
+                if size >= question_bank.target_pool:
+                    continue
+                added = question_bank.replenish(product_type, level, max_batches=options['max_batches'])
+                total += added
+                self.stdout.write(f'  {product_type} / {level}: {size} -> {size + added}')
+
+        self.stdout.write(self.style.SUCCESS(f'Added {total} quiz questions'))
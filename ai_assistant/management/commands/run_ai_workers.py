@@ -0,0 +1,67 @@
+import os
+import time
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from ai_assistant.jobs import claim_next, run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs a pool of worker threads that process queued AI jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'AI_JOB_WORKERS', 4),
+                            help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'AI_JOB_POLL_INTERVAL', 2.0),
+                            help='Seconds an idle worker waits before looking for new jobs')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        threads = []
+        for index in range(options['workers']):
+            thread = threading.Thread(
+                target=self.work,
+                args=(f"{prefix}:{index}", options['poll_interval'], options['once']),
+                name=f"ai-worker-{index}"
+            )
+            thread.start()
+            threads.append(thread)
+
+        self.stdout.write(f"Started {len(threads)} AI workers")
+        for thread in threads:
+            # Join with a timeout so signals are still delivered to the main thread
+            while thread.is_alive():
+                thread.join(1)
+        self.stdout.write(self.style.SUCCESS('AI workers stopped'))
+
+    def stop(self, signum, frame):
+        self.stdout.write('Stopping AI workers after their current jobs...')
+        self.stopping.set()
+
+    def work(self, worker_id, poll_interval, once):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                job = claim_next(worker_id)
+                if job is None:
+                    if once:
+                        return
+                    self.stopping.wait(poll_interval)
+                    continue
+
+                started = time.monotonic()
+                run_job(job, worker_id)
+                self.stdout.write(f"[{worker_id}] {job.job_type} #{job.id} done in {time.monotonic() - started:.1f}s")
+        finally:
+            connection.close()
@@ -0,0 +1,212 @@
+import re
+import json
+import math
+import time
+import uuid
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+SAMPLE_QUIZ = [
+    {
+        'question': f"Sample question {number} about this product?",
+        'options': ['Option A', 'Option B', 'Option C', 'Option D'],
+        'correct_answer': number % 4
+    }
+    for number in range(1, 6)
+]
+
+# Injected failures: (HTTP status, OpenAI error type, message)
+ERRORS = [
+    (429, 'rate_limit_exceeded', 'Rate limit reached (fake server)'),
+    (500, 'server_error', 'The server had an error while processing your request (fake server)'),
+    (503, 'server_error', 'The server is overloaded (fake server)'),
+]
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+# Distinctive instruction of each structured prompt
+LEAD_SCORES = 'JSON array of objects with the keys id, score and reason'
+OUTREACH_MESSAGES = 'JSON array of objects with the keys id and message'
+QUIZ_QUESTIONS = 'JSON array of objects with the keys question, options'
+
+
+def prompt_items(prompt, instruction):
+    """The JSON list the prompt appends after its instruction, or an empty list"""
+    payload = prompt[prompt.index(instruction) + len(instruction):]
+    start, end = payload.find('['), payload.rfind(']')
+    try:
+        items = json.loads(payload[start:end + 1]) if start != -1 else []
+    except json.JSONDecodeError:
+        return []
+    return [item for item in items if isinstance(item, dict) and 'id' in item]
+
+
+def fake_reply(messages):
+    """Build a plausible reply for a chat prompt, in the shape structured prompts ask for"""
+    prompt = ' '.join(message.get('content') or '' for message in messages)
+    if LEAD_SCORES in prompt:
+        return json.dumps([
+            {'id': lead['id'], 'score': random.randint(20, 95), 'reason': f"Sample reason for {lead.get('name')}."}
+            for lead in prompt_items(prompt, LEAD_SCORES)
+        ])
+    if OUTREACH_MESSAGES in prompt:
+        return json.dumps([
+            {'id': lead['id'], 'message': f"Hi {lead.get('name')}, this is a sample message. "
+                                          "Can we talk tomorrow about your options?"}
+            for lead in prompt_items(prompt, OUTREACH_MESSAGES)
+        ])
+    if QUIZ_QUESTIONS in prompt:
+        count = re.search(r'Create (\d+) multiple-choice questions', prompt)
+        return json.dumps([
+            {**SAMPLE_QUIZ[number % len(SAMPLE_QUIZ)], 'question': f"Sample question {number + 1} about this product?"}
+            for number in range(int(count.group(1)) if count else len(SAMPLE_QUIZ))
+        ])
+    last = (messages[-1].get('content') or '') if messages else ''
+    return (
+        "This is a simulated response from the local stand-in server.\n\n"
+        f"You asked about: {last[:200]}\n\n"
+        "1. Understand the customer's needs before recommending a product.\n"
+        "2. Explain the key benefits in simple terms.\n"
+        "3. Agree on a clear next step."
+    )
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Serves /chat/completions in the OpenAI wire format"""
+
+    server_version = 'FakeOpenAI/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self.send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            return self.send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+
+        options = self.server.options
+        time.sleep(self.server.sample_latency())
+
+        if random.random() < options['error_rate']:
+            status, error_type, message = random.choice(ERRORS)
+            return self.send_json(status, {'error': {'message': message, 'type': error_type}})
+
+        model = body.get('model', 'gpt-3.5-turbo')
+        messages = body.get('messages', [])
+        content = fake_reply(messages)
+        if body.get('max_tokens'):
+            content = content[:body['max_tokens'] * 4]
+
+        if body.get('stream'):
+            return self.send_stream(model, content)
+
+        prompt_tokens = sum(estimate_tokens(message.get('content') or '') + 4 for message in messages)
+        completion_tokens = estimate_tokens(content)
+        self.send_json(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def send_json(self, status, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, model, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = content.split(' ')
+        for index, word in enumerate(words):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': word if index == 0 else ' ' + word},
+                             'finish_reason': None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.server.options['chunk_delay'])
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options, verbose=False):
+        super().__init__(address, FakeOpenAIHandler)
+        self.options = options
+        self.verbose = verbose
+        # Log-normal latency with the given median and 99th percentile
+        median, p99 = options['median_latency'], max(options['p99_latency'], options['median_latency'])
+        self.mu = math.log(median) if median > 0 else None
+        self.sigma = math.log(p99 / median) / 2.326 if median > 0 else 0
+
+    def sample_latency(self):
+        if self.mu is None:
+            return 0
+        return random.lognormvariate(self.mu, self.sigma)
+
+
+class Command(BaseCommand):
+    help = 'Runs a local stand-in for the OpenAI ChatCompletion API, for load tests and offline development'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--median-latency', type=float, default=0.8,
+                            help='Median response latency in seconds (0 disables latency)')
+        parser.add_argument('--p99-latency', type=float, default=4.0,
+                            help='99th percentile response latency in seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests answered with a 429, 500 or 503 error')
+        parser.add_argument('--chunk-delay', type=float, default=0.03,
+                            help='Seconds between streamed chunks')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+
+        server = FakeOpenAIServer((options['host'], options['port']), options, verbose=options['verbose'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake OpenAI API listening on http://{options['host']}:{options['port']}/v1 "
+            f"(median {options['median_latency']}s, p99 {options['p99_latency']}s, "
+            f"error rate {options['error_rate']:.0%})"
+        ))
+        self.stdout.write(f"Set OPENAI_API_BASE=http://{options['host']}:{options['port']}/v1 to use it")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
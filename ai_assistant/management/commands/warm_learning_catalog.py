@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from ai_assistant.learning_catalog import learning_catalog, CatalogUnavailable, PRODUCT_TYPES, DIFFICULTY_LEVELS
+
+
+class Command(BaseCommand):
+    help = 'Generates the shared learning catalog modules that are missing for the current catalog version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product-type', action='append', choices=PRODUCT_TYPES,
+                            help='Only warm this product type (can be repeated)')
+        parser.add_argument('--level', action='append', choices=DIFFICULTY_LEVELS,
+                            help='Only warm this difficulty level (can be repeated)')
+
+    def handle(self, *args, **options):
+        product_types = options['product_type'] or PRODUCT_TYPES
+        levels = options['level'] or DIFFICULTY_LEVELS
+        self.stdout.write(f'Warming learning catalog version {learning_catalog.version}...')
+
+        generated = failed = 0
+        for product_type in product_types:
+            for level in levels:
+                if learning_catalog.get(product_type, level) is not None:
+                    continue
+                try:
+                    learning_catalog.generate(product_type, level)
+                    generated += 1
+                    self.stdout.write(f'  {product_type} / {level}')
+                except CatalogUnavailable as e:
+                    failed += 1
+                    self.stderr.write(f'  {product_type} / {level} failed: {e}')
+
+        total = len(product_types) * len(levels)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {generated} modules; {total - generated - failed} were already in the catalog'
+        ))
+        if failed:
+            self.stderr.write(self.style.ERROR(f'{failed} modules could not be generated'))
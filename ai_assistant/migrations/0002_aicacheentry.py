@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AICacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('cache_type', models.CharField(max_length=30)),
+                ('response', models.TextField()),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'AI cache entries',
+            },
+        ),
+    ]
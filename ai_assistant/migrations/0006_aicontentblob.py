@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0005_aijob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIContentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('data', models.BinaryField()),
+                ('size', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='prompt',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='response',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='airesponse',
+            name='prompt_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ai_assistant.aicontentblob'),
+        ),
+        migrations.AddField(
+            model_name='airesponse',
+            name='response_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ai_assistant.aicontentblob'),
+        ),
+    ]
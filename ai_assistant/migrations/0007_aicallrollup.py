@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0006_aicontentblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AICallRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('request_type', models.CharField(max_length=20)),
+                ('model', models.CharField(max_length=50)),
+                ('requests', models.IntegerField(default=0)),
+                ('cache_hits', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('upstream_calls', models.IntegerField(default=0)),
+                ('prompt_tokens', models.BigIntegerField(default=0)),
+                ('completion_tokens', models.BigIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('latency_total', models.FloatField(default=0)),
+                ('latency_histogram', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'unique_together': {('period_start', 'request_type', 'model')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0007_aicallrollup'),
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadEvaluation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('score', models.FloatField(default=0)),
+                ('reason', models.TextField(blank=True)),
+                ('analyzed_at', models.DateTimeField(auto_now=True)),
+                ('lead', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_evaluation', to='dashboard.customerlead')),
+            ],
+        ),
+    ]
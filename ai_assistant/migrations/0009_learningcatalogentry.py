@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0008_leadevaluation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='learningcontent',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='learningcontent',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='LearningCatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_type', models.CharField(choices=[('insurance', 'Insurance'), ('credit_card', 'Credit Card'), ('loan', 'Loan'), ('savings', 'Savings Account'), ('demat', 'Demat Account'), ('investment', 'Investment')], max_length=20)),
+                ('difficulty_level', models.CharField(choices=[('beginner', 'Beginner'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced')], max_length=20)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('topic', models.CharField(max_length=100)),
+                ('content', models.TextField()),
+                ('summary', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Learning catalog entries',
+                'constraints': [models.UniqueConstraint(fields=('product_type', 'difficulty_level', 'version'), name='unique_learning_catalog_entry')],
+            },
+        ),
+        migrations.AddField(
+            model_name='learningcontent',
+            name='catalog_entry',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='assignments', to='ai_assistant.learningcatalogentry'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0009_learningcatalogentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_type', models.CharField(max_length=20)),
+                ('difficulty_level', models.CharField(max_length=20)),
+                ('question', models.TextField()),
+                ('options', models.JSONField()),
+                ('correct_answer', models.PositiveSmallIntegerField()),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product_type', 'difficulty_level', 'fingerprint'), name='unique_quiz_question')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuizQuestionServed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('served_at', models.DateTimeField()),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='served', to='ai_assistant.quizquestion')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='served_quiz_questions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'question'), name='unique_quiz_question_served')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0010_quizquestion_quizquestionserved'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='learningcontent',
+            index=models.Index(fields=['user', 'product_type', 'created_at'], name='ai_assistan_user_id_ab214c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='ai_assistan_convers_8f1a44_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0011_hot_query_indexes'),
+        ('dashboard', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutreachDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('message', models.TextField()),
+                ('written_at', models.DateTimeField(auto_now=True)),
+                ('lead', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outreach_draft', to='dashboard.customerlead')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0013_outreachprefetchbudget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIRateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('level', models.FloatField()),
+                ('updated', models.FloatField()),
+            ],
+        ),
+    ]
@@ -52,6 +52,25 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at']),
+        ]
+
+
+class AIContentBlob(models.Model):
+    """Compressed prompt or response body, stored once per distinct content"""
+    digest = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.size} chars)"
+
+    @property
+    def text(self):
+        from .blob_store import decompress
+        return decompress(self.data)
 
 
 class AIResponse(models.Model):
@@ -66,17 +85,269 @@ class AIResponse(models.Model):
             ('message', 'Customer Message')
         ]
     )
-    prompt = models.TextField()
-    response = models.TextField()
+    # Bodies live in AIContentBlob; these text fields only hold rows not yet backfilled
+    prompt = models.TextField(blank=True)
+    response = models.TextField(blank=True)
+    prompt_blob = models.ForeignKey(AIContentBlob, on_delete=models.PROTECT, related_name='+', blank=True, null=True)
+    response_blob = models.ForeignKey(AIContentBlob, on_delete=models.PROTECT, related_name='+', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.request_type} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
 
+    @property
+    def prompt_text(self):
+        return self.prompt_blob.text if self.prompt_blob_id else self.prompt
+
+    @property
+    def response_text(self):
+        return self.response_blob.text if self.response_blob_id else self.response
+
+
+class AICacheEntry(models.Model):
+    """Persistent tier of the AI response cache"""
+    key = models.CharField(max_length=64, unique=True)
+    cache_type = models.CharField(max_length=30)
+    response = models.TextField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.cache_type} - {self.key[:12]} - expires {self.expires_at.strftime('%Y-%m-%d %H:%M')}"
+
+    class Meta:
+        verbose_name_plural = 'AI cache entries'
+
+
+class AIRequestLock(models.Model):
+    """Cross-process lock so only one worker generates a given prompt at a time"""
+    key = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key[:12]} - {self.owner}"
+
+
+class AIRateLimitBucket(models.Model):
+    """Token bucket of the OpenAI rate governor, shared by every process"""
+    name = models.CharField(max_length=50, unique=True)
+    level = models.FloatField()
+    # Unix time the level was last refilled to
+    updated = models.FloatField()
+
+    def __str__(self):
+        return f"{self.name} - {self.level:.0f}"
+
+
+class CircuitBreakerState(models.Model):
+    """Last known state of an upstream circuit breaker"""
+    name = models.CharField(max_length=50, unique=True)
+    state = models.CharField(
+        max_length=10,
+        choices=[
+            ('closed', 'Closed'),
+            ('open', 'Open'),
+            ('half_open', 'Half Open')
+        ],
+        default='closed'
+    )
+    failure_count = models.IntegerField(default=0)
+    opened_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.get_state_display()}"
+
+
+class AIJob(models.Model):
+    """Background AI generation job, claimed and run by run_ai_workers"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_jobs', blank=True, null=True)
+    job_type = models.CharField(max_length=30)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(blank=True, null=True)
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            ('queued', 'Queued'),
+            ('running', 'Running'),
+            ('succeeded', 'Succeeded'),
+            ('failed', 'Failed')
+        ],
+        default='queued'
+    )
+    dedup_key = models.CharField(max_length=255, blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.job_type} #{self.id} - {self.get_status_display()}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+        constraints = [
+            # Only one live job per deduplication key
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_ai_job_dedup_key'
+            ),
+        ]
+
+
+class AICallRollup(models.Model):
+    """Hourly AI call metrics per request type and model"""
+    period_start = models.DateTimeField()
+    request_type = models.CharField(max_length=20)
+    model = models.CharField(max_length=50)
+    requests = models.IntegerField(default=0)
+    cache_hits = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    upstream_calls = models.IntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    latency_total = models.FloatField(default=0)
+    latency_histogram = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"{self.request_type} - {self.model} - {self.period_start.strftime('%Y-%m-%d %H:00')}"
+
+    class Meta:
+        ordering = ['-period_start']
+        unique_together = ['period_start', 'request_type', 'model']
+
+
+class LeadEvaluation(models.Model):
+    """Latest AI evaluation of a lead, reused until the lead's data changes"""
+    lead = models.OneToOneField('dashboard.CustomerLead', on_delete=models.CASCADE, related_name='ai_evaluation')
+    fingerprint = models.CharField(max_length=64)
+    score = models.FloatField(default=0)
+    reason = models.TextField(blank=True)
+    analyzed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.lead.name} - {self.score:.0f}"
+
+
+class OutreachDraft(models.Model):
+    """Latest outreach message written for a lead, reused until the lead's data changes"""
+    lead = models.OneToOneField('dashboard.CustomerLead', on_delete=models.CASCADE, related_name='outreach_draft')
+    fingerprint = models.CharField(max_length=64)
+    message = models.TextField()
+    written_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.lead.name} - {self.written_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class OutreachPrefetchBudget(models.Model):
+    """Outreach drafts prefetched for a partner on one day, counted against their daily budget"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outreach_prefetch_budgets')
+    date = models.DateField()
+    used = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date} - {self.used}"
+
+    class Meta:
+        unique_together = ['user', 'date']
+
+
+class LearningCatalogEntry(models.Model):
+    """Canonical learning module for a product and level, shared by all partners"""
+    product_type = models.CharField(
+        max_length=20,
+        choices=[
+            ('insurance', 'Insurance'),
+            ('credit_card', 'Credit Card'),
+            ('loan', 'Loan'),
+            ('savings', 'Savings Account'),
+            ('demat', 'Demat Account'),
+            ('investment', 'Investment')
+        ]
+    )
+    difficulty_level = models.CharField(
+        max_length=20,
+        choices=[
+            ('beginner', 'Beginner'),
+            ('intermediate', 'Intermediate'),
+            ('advanced', 'Advanced')
+        ]
+    )
+    # Bumped through AI_LEARNING_CATALOG_VERSION when the content should be regenerated
+    version = models.PositiveIntegerField(default=1)
+    topic = models.CharField(max_length=100)
+    content = models.TextField()
+    summary = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Learning catalog entries'
+        constraints = [
+            models.UniqueConstraint(fields=['product_type', 'difficulty_level', 'version'],
+                                    name='unique_learning_catalog_entry')
+        ]
+
+    def __str__(self):
+        return f"{self.product_type} - {self.difficulty_level} - v{self.version}"
+
+
+class QuizQuestion(models.Model):
+    """Validated multiple-choice question in the shared quiz bank"""
+    product_type = models.CharField(max_length=20)
+    difficulty_level = models.CharField(max_length=20)
+    question = models.TextField()
+    options = models.JSONField()
+    correct_answer = models.PositiveSmallIntegerField()
+    # Hash of the normalized question text, so the same question is stored once per pool
+    fingerprint = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_type', 'difficulty_level', 'fingerprint'],
+                                    name='unique_quiz_question')
+        ]
+
+    def __str__(self):
+        return f"{self.product_type} - {self.difficulty_level} - {self.question[:50]}"
+
+
+class QuizQuestionServed(models.Model):
+    """When a partner was last shown a bank question, so quizzes don't repeat"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='served_quiz_questions')
+    question = models.ForeignKey(QuizQuestion, on_delete=models.CASCADE, related_name='served')
+    served_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_quiz_question_served')
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.question_id}"
+
 
 class LearningContent(models.Model):
     """Model to store AI-generated learning content"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='learning_content')
+    # Text comes from the shared catalog; content and summary only hold rows written before it
+    catalog_entry = models.ForeignKey(LearningCatalogEntry, on_delete=models.PROTECT, related_name='assignments',
+                                      blank=True, null=True)
     product_type = models.CharField(
         max_length=20,
         choices=[
@@ -89,8 +360,8 @@ class LearningContent(models.Model):
         ]
     )
     topic = models.CharField(max_length=100)
-    content = models.TextField()
-    summary = models.TextField()
+    content = models.TextField(blank=True)
+    summary = models.TextField(blank=True)
     difficulty_level = models.CharField(
         max_length=20,
         choices=[
@@ -106,6 +377,19 @@ class LearningContent(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product_type} - {self.topic}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'product_type', 'created_at']),
+        ]
+
+    @property
+    def content_text(self):
+        return self.catalog_entry.content if self.catalog_entry_id else self.content
+
+    @property
+    def summary_text(self):
+        return self.catalog_entry.summary if self.catalog_entry_id else self.summary
+
 
 class SalesTemplate(models.Model):
     """Model to store AI-generated sales templates"""
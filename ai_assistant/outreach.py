@@ -0,0 +1,247 @@
+import re
+import json
+import asyncio
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from dashboard.models import CustomerLead
+from .lead_analysis import lead_fingerprint
+from .models import OutreachDraft, OutreachPrefetchBudget
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('new', 'contacted', 'interested')
+
+
+def outreach_lead_data(lead):
+    """Lead fields an outreach message is written from"""
+    return {
+        'id': lead.id,
+        'name': lead.name,
+        'interest': lead.interest,
+        'status': lead.status,
+        'notes': lead.notes
+    }
+
+
+class OutreachBatcher:
+    """
+    Outreach messages for many leads at once
+
+    Leads are grouped by product interest and packed several to a prompt
+    that asks for a JSON array of messages; packs run concurrently. Leads
+    the model leaves out of a pack's answer are retried on their own.
+    Messages are stored per lead as an OutreachDraft with a fingerprint of
+    the lead's data, and reused for ``cache_timeout`` seconds; a change to
+    its status or notes makes the stored message stale and the next request
+    writes a new one.
+
+    Drafts for a partner's top ``prefetch_top_k`` leads by priority can be
+    written ahead of time by a job worker, at most ``prefetch_daily_budget``
+    a day per partner, so clicking "Generate Message" in any web process is
+    served from the stored draft.
+    """
+
+    def __init__(self, pack_size=5, parallelism=4, cache_timeout=60 * 60 * 24,
+                 prefetch_top_k=3, prefetch_daily_budget=20):
+        self.pack_size = pack_size
+        self.parallelism = parallelism
+        self.cache_timeout = cache_timeout
+        self.prefetch_top_k = prefetch_top_k
+        self.prefetch_daily_budget = prefetch_daily_budget
+
+    def cached(self, leads):
+        """Return {lead id: message} for the leads with a current stored message"""
+        fingerprints = {lead['id']: lead_fingerprint(lead) for lead in leads}
+        drafts = OutreachDraft.objects.filter(
+            lead_id__in=fingerprints,
+            written_at__gte=timezone.now() - timedelta(seconds=self.cache_timeout)
+        ).only('lead_id', 'fingerprint', 'message')
+        return {draft.lead_id: draft.message for draft in drafts
+                if draft.fingerprint == fingerprints[draft.lead_id]}
+
+    def store(self, messages, leads):
+        """Store freshly generated messages, replacing the leads' previous drafts"""
+        by_id = {lead['id']: lead for lead in leads}
+        for lead_id, message in messages.items():
+            try:
+                OutreachDraft.objects.update_or_create(
+                    lead_id=lead_id,
+                    defaults={'fingerprint': lead_fingerprint(by_id[lead_id]), 'message': message}
+                )
+            except Exception as e:
+                # The lead may have been deleted meanwhile; the message is still returned
+                logger.error(f"Error storing outreach draft: {str(e)}")
+
+    def packs(self, leads):
+        """Group leads by product interest and split the groups into packs"""
+        groups = {}
+        for lead in leads:
+            groups.setdefault(lead.get('interest'), []).append(lead)
+        return [group[i:i + self.pack_size]
+                for group in groups.values() for i in range(0, len(group), self.pack_size)]
+
+    @staticmethod
+    def build_pack_prompt(pack):
+        """Build the prompt that writes messages for one pack of leads"""
+        product_type = pack[0].get('interest')
+        return [
+            {"role": "system",
+             "content": f"You are an AI assistant helping a financial agent create personalized outreach messages for potential {product_type} customers in India."},
+            {"role": "user",
+             "content": f"Create a short, personalized WhatsApp or SMS message for each of these leads interested in {product_type}. "
+                        "Each message should be friendly, concise, and include a clear next step. "
+                        "Respond only with a JSON array of objects with the keys id and message: "
+                        f"{json.dumps(pack)}"}
+        ]
+
+    @staticmethod
+    def parse_messages(response, pack):
+        """Return {lead id: message} for the pack's leads found in the response"""
+        ids = {lead['id'] for lead in pack}
+        match = re.search(r'\[.*\]', response, re.DOTALL)
+        try:
+            items = json.loads(match.group(0) if match else response)
+        except (json.JSONDecodeError, TypeError):
+            logger.warning("Could not parse outreach messages from model response")
+            return {}
+
+        messages = {}
+        for item in items if isinstance(items, list) else []:
+            try:
+                lead_id = int(item['id'])
+                message = str(item['message']).strip()
+            except (KeyError, TypeError, ValueError):
+                continue
+            if lead_id in ids and message:
+                messages[lead_id] = message
+        return messages
+
+    def _request(self, service, pack):
+        """Return (prompt, max_tokens) for a pack; single leads use the one-lead prompt"""
+        if len(pack) == 1:
+            return service.build_outreach_prompt(pack[0], pack[0].get('interest')), 300
+        return self.build_pack_prompt(pack), 200 * len(pack)
+
+    def _parse(self, response, pack):
+        from .ai_services import FALLBACK_RESPONSE
+
+        if response == FALLBACK_RESPONSE:
+            return {}
+        if len(pack) == 1:
+            return {pack[0]['id']: response}
+        return self.parse_messages(response, pack)
+
+    @staticmethod
+    def leftovers(packs, messages):
+        """Leads a multi-lead pack's answer left out, each as a pack of its own"""
+        return [[lead] for pack in packs if len(pack) > 1 for lead in pack if lead['id'] not in messages]
+
+    def run(self, service, user, leads):
+        """
+        Write outreach messages for the leads, calling the model in parallel
+
+        Args:
+            service: LeadService, used for the model calls and logging
+            user (User): Agent the messages are written for
+            leads (list): Lead dictionaries with id, name, interest, status and notes
+
+        Returns:
+            dict: {lead id: message} for every lead a message could be written for
+        """
+        messages = self.cached(leads)
+        pending = [lead for lead in leads if lead['id'] not in messages]
+
+        def write_pack(pack):
+            prompt, max_tokens = self._request(service, pack)
+            response = service.generate_response(prompt, max_tokens=max_tokens, user=user, request_type='lead')
+            service.log_interaction(user, 'lead', prompt, response)
+            return self._parse(response, pack)
+
+        packs = self.packs(pending)
+        fresh = {}
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            for pack_messages in executor.map(write_pack, packs):
+                fresh.update(pack_messages)
+            for pack_messages in executor.map(write_pack, self.leftovers(packs, fresh)):
+                fresh.update(pack_messages)
+
+        self.store(fresh, pending)
+        messages.update(fresh)
+        return messages
+
+    async def arun(self, service, user, leads):
+        """Async version of run"""
+        messages = await sync_to_async(self.cached)(leads)
+        pending = [lead for lead in leads if lead['id'] not in messages]
+        semaphore = asyncio.Semaphore(self.parallelism)
+
+        async def write_pack(pack):
+            prompt, max_tokens = self._request(service, pack)
+            async with semaphore:
+                response = await service.agenerate_response(prompt, max_tokens=max_tokens, user=user,
+                                                            request_type='lead')
+            await service.alog_interaction(user, 'lead', prompt, response)
+            return self._parse(response, pack)
+
+        packs = self.packs(pending)
+        fresh = {}
+        for pack_messages in await asyncio.gather(*(write_pack(pack) for pack in packs)):
+            fresh.update(pack_messages)
+        for pack_messages in await asyncio.gather(*(write_pack(pack) for pack in self.leftovers(packs, fresh))):
+            fresh.update(pack_messages)
+
+        await sync_to_async(self.store)(fresh, pending)
+        messages.update(fresh)
+        return messages
+
+    def prefetch_candidates(self, user, lead_ids=None):
+        """Return the user's top-K active leads, as lead dictionaries, that have no current message"""
+        leads = CustomerLead.objects.filter(user=user, status__in=ACTIVE_STATUSES)
+        if lead_ids is not None:
+            leads = leads.filter(id__in=lead_ids)
+        leads = [outreach_lead_data(lead) for lead in leads.order_by('-priority_score')[:self.prefetch_top_k]]
+        cached = self.cached(leads)
+        return [lead for lead in leads if lead['id'] not in cached]
+
+    def remaining_prefetch(self, user_id):
+        """Drafts the user can still have prefetched today"""
+        used = OutreachPrefetchBudget.objects.filter(
+            user_id=user_id, date=timezone.localdate()
+        ).values_list('used', flat=True).first()
+        return max(0, self.prefetch_daily_budget - (used or 0))
+
+    def reserve_prefetch(self, user_id, count):
+        """
+        Take up to ``count`` drafts from the user's daily prefetch budget
+
+        The budget row is updated only if nobody else changed it since it
+        was read, so workers reserving at the same time never exceed it.
+
+        Returns:
+            int: Number of drafts granted
+        """
+        budget, _ = OutreachPrefetchBudget.objects.get_or_create(user_id=user_id, date=timezone.localdate())
+        while True:
+            granted = max(0, min(count, self.prefetch_daily_budget - budget.used))
+            if not granted:
+                return 0
+            if OutreachPrefetchBudget.objects.filter(id=budget.id, used=budget.used).update(
+                    used=budget.used + granted):
+                return granted
+            budget.refresh_from_db(fields=['used'])
+
+
+outreach_batcher = OutreachBatcher(
+    pack_size=getattr(settings, 'AI_OUTREACH_PACK_SIZE', 5),
+    parallelism=getattr(settings, 'AI_OUTREACH_PARALLELISM', 4),
+    cache_timeout=getattr(settings, 'AI_OUTREACH_CACHE_TIMEOUT', 60 * 60 * 24),
+    prefetch_top_k=getattr(settings, 'AI_OUTREACH_PREFETCH_TOP_K', 3),
+    prefetch_daily_budget=getattr(settings, 'AI_OUTREACH_PREFETCH_DAILY_BUDGET', 20)
+)
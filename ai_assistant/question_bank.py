@@ -0,0 +1,194 @@
+import re
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery, Window, F
+from django.utils import timezone
+
+from .models import QuizQuestion, QuizQuestionServed
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+OPTION_COUNT = 4
+ANSWER_LETTERS = 'ABCD'
+
+# "A) ", "b. ", "C: " and the like in front of an option
+OPTION_PREFIX = re.compile(r'^[A-Da-d][).:]\s+')
+
+
+def question_fingerprint(text):
+    """Hash of a question's text, ignoring case and whitespace"""
+    normalized = ' '.join(text.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def validate_question(item):
+    """
+    Check and normalize one generated question
+
+    Returns:
+        dict: question, options and correct_answer (0-based index), or None if the item is unusable
+    """
+    if not isinstance(item, dict):
+        return None
+
+    question = str(item.get('question') or '').strip()
+    options = item.get('options')
+    if not question or not isinstance(options, list) or len(options) != OPTION_COUNT:
+        return None
+    options = [OPTION_PREFIX.sub('', str(option).strip()) for option in options]
+    if not all(options) or len({option.lower() for option in options}) != OPTION_COUNT:
+        return None
+
+    answer = item.get('correct_answer', item.get('answer'))
+    index = None
+    if isinstance(answer, int) and not isinstance(answer, bool):
+        index = answer
+    elif isinstance(answer, str):
+        answer = answer.strip()
+        if answer.isdigit():
+            index = int(answer)
+        elif len(answer) == 1 and answer.upper() in ANSWER_LETTERS:
+            index = ANSWER_LETTERS.index(answer.upper())
+        elif OPTION_PREFIX.sub('', answer) in options:
+            index = options.index(OPTION_PREFIX.sub('', answer))
+    if index is None or not 0 <= index < OPTION_COUNT:
+        return None
+
+    return {'question': question, 'options': options, 'correct_answer': index}
+
+
+class QuestionBank:
+    """
+    Persistent pools of quiz questions per product type and skill level
+
+    Generated questions are validated once when they are ingested, and
+    duplicates are dropped. A quiz is a random sample from the pool that
+    prefers questions the partner has never seen, then those seen longest
+    ago, drawn in one query. Pools that are small or that a partner has
+    exhausted are topped up by a background job.
+    """
+
+    def __init__(self, quiz_size=5, batch_size=10, target_pool=50, max_pool=200):
+        self.quiz_size = quiz_size
+        self.batch_size = batch_size
+        self.target_pool = target_pool
+        self.max_pool = max_pool
+
+    def ingest(self, product_type, skill_level, items):
+        """
+        Validate generated questions and add the new ones to the pool
+
+        Returns:
+            int: Number of questions added
+        """
+        questions = {}
+        for item in items if isinstance(items, list) else []:
+            question = validate_question(item)
+            if question is None:
+                continue
+            fingerprint = question_fingerprint(question['question'])
+            questions[fingerprint] = QuizQuestion(
+                product_type=product_type,
+                difficulty_level=skill_level,
+                fingerprint=fingerprint,
+                **question
+            )
+
+        rejected = (len(items) if isinstance(items, list) else 0) - len(questions)
+        if rejected:
+            logger.warning(f"Rejected {rejected} invalid or duplicate quiz questions for {product_type}/{skill_level}")
+
+        before = self.pool_size(product_type, skill_level)
+        QuizQuestion.objects.bulk_create(questions.values(), ignore_conflicts=True)
+        return self.pool_size(product_type, skill_level) - before
+
+    @staticmethod
+    def pool_size(product_type, skill_level):
+        return QuizQuestion.objects.filter(product_type=product_type, difficulty_level=skill_level).count()
+
+    def _avoid(self, product_type, skill_level):
+        """Recent question texts to keep the model from repeating itself"""
+        return list(QuizQuestion.objects.filter(product_type=product_type, difficulty_level=skill_level)
+                    .order_by('-created_at').values_list('question', flat=True)[:self.batch_size * 2])
+
+    def fill(self, product_type, skill_level, user=None):
+        """Generate one batch of questions into the pool; returns the number added"""
+        from .ai_services import LearningService
+
+        result = LearningService.generate_quiz_questions(user, product_type, skill_level, self.batch_size,
+                                                         self._avoid(product_type, skill_level))
+        if result['status'] != 'success':
+            return 0
+        return self.ingest(product_type, skill_level, result['questions'])
+
+    async def afill(self, product_type, skill_level, user=None):
+        """Async version of fill"""
+        from .ai_services import LearningService
+
+        avoid = await sync_to_async(self._avoid)(product_type, skill_level)
+        result = await LearningService.agenerate_quiz_questions(user, product_type, skill_level, self.batch_size,
+                                                                avoid)
+        if result['status'] != 'success':
+            return 0
+        return await sync_to_async(self.ingest)(product_type, skill_level, result['questions'])
+
+    def replenish(self, product_type, skill_level, max_batches=5):
+        """
+        Top a pool up to the target size, adding at least one batch while under the maximum
+
+        Returns:
+            int: Number of questions added
+        """
+        added = 0
+        for batch in range(max_batches):
+            size = self.pool_size(product_type, skill_level)
+            if size >= self.max_pool or (batch > 0 and size >= self.target_pool):
+                break
+            new = self.fill(product_type, skill_level)
+            if not new:
+                # The model is failing or only repeating itself; try again on the next top-up
+                break
+            added += new
+        return added
+
+    def draw(self, user, product_type, skill_level):
+        """
+        Pick a quiz for a partner and remember what they were shown
+
+        Returns:
+            tuple: (list of question dictionaries, whether the pool needs topping up)
+        """
+        last_served = QuizQuestionServed.objects.filter(user=user, question=OuterRef('pk')).values('served_at')[:1]
+        questions = list(
+            QuizQuestion.objects.filter(product_type=product_type, difficulty_level=skill_level)
+            .annotate(last_served=Subquery(last_served), pool_size=Window(Count('id')))
+            .order_by(F('last_served').asc(nulls_first=True), '?')[:self.quiz_size]
+        )
+        if not questions:
+            return [], True
+
+        now = timezone.now()
+        QuizQuestionServed.objects.bulk_create(
+            [QuizQuestionServed(user=user, question=question, served_at=now) for question in questions],
+            update_conflicts=True, unique_fields=['user', 'question'], update_fields=['served_at']
+        )
+
+        # Top up when the pool is small or this partner has started seeing repeats
+        low = questions[0].pool_size < self.target_pool or any(question.last_served for question in questions)
+        return [
+            {'id': question.id, 'question': question.question, 'options': question.options,
+             'correct_answer': question.correct_answer}
+            for question in questions
+        ], low
+
+
+question_bank = QuestionBank(
+    quiz_size=getattr(settings, 'AI_QUIZ_SIZE', 5),
+    batch_size=getattr(settings, 'AI_QUIZ_BANK_BATCH_SIZE', 10),
+    target_pool=getattr(settings, 'AI_QUIZ_BANK_TARGET_POOL', 50),
+    max_pool=getattr(settings, 'AI_QUIZ_BANK_MAX_POOL', 200)
+)
@@ -0,0 +1,335 @@
+import time
+import asyncio
+import logging
+import threading
+import itertools
+from collections import OrderedDict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Highest priority first
+PRIORITIES = ('interactive', 'standard', 'batch')
+
+# How long an async waiter sleeps between checks of the queue
+ASYNC_POLL_INTERVAL = 0.05
+
+# Conditional updates of a shared bucket tried before backing off
+SHARED_BUCKET_ATTEMPTS = 5
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call could not be admitted before its wait limit"""
+    pass
+
+
+class TokenBucket:
+    """Bucket that refills continuously up to ``capacity`` over ``period`` seconds"""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount):
+        """Seconds until ``amount`` is available (0 if it already is)"""
+        self.refill()
+        # A single request larger than the bucket is admitted once it is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount):
+        self.refill()
+        self.level -= min(amount, self.capacity)
+
+    def take(self, amount):
+        """Consume ``amount`` if it is available; returns 0, or the seconds until it will be"""
+        delay = self.time_until(amount)
+        if delay == 0.0:
+            self.consume(amount)
+        return delay
+
+    def refund(self, amount):
+        self.refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def available(self):
+        self.refill()
+        return self.level
+
+
+class SharedTokenBucket:
+    """
+    TokenBucket kept in an AIRateLimitBucket row, so every process draws from one budget
+
+    The row holds the level and the wall-clock time it was refilled to.
+    Each change is a conditional update on the values that were read, and is
+    retried if another process got there first, so concurrent takes never
+    overdraw the bucket.
+    """
+
+    def __init__(self, name, capacity, period=60.0):
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+
+    def _row(self):
+        from .models import AIRateLimitBucket
+        row, _ = AIRateLimitBucket.objects.get_or_create(
+            name=self.name, defaults={'level': self.capacity, 'updated': time.time()}
+        )
+        return row
+
+    def _change(self, change):
+        """
+        Apply ``change(level)`` -> (new level or None, result) to the refilled level
+
+        Returns:
+            The result of the change that was stored, or of the last attempt
+        """
+        from .models import AIRateLimitBucket
+        row = self._row()
+        for _ in range(SHARED_BUCKET_ATTEMPTS):
+            now = time.time()
+            level = min(self.capacity, row.level + max(0.0, now - row.updated) * self.rate)
+            new_level, result = change(level)
+            if new_level is None:
+                return result
+            if AIRateLimitBucket.objects.filter(id=row.id, level=row.level, updated=row.updated).update(
+                    level=new_level, updated=now):
+                return result
+            row.refresh_from_db(fields=['level', 'updated'])
+        # Heavily contended; report a short wait rather than spin
+        return ASYNC_POLL_INTERVAL
+
+    def take(self, amount):
+        """Consume ``amount`` if it is available; returns 0, or the seconds until it will be"""
+        # A single request larger than the bucket is admitted once it is full
+        amount = min(amount, self.capacity)
+
+        def change(level):
+            if level >= amount:
+                return level - amount, 0.0
+            return None, (amount - level) / self.rate
+
+        return self._change(change)
+
+    def refund(self, amount):
+        self._change(lambda level: (min(self.capacity, level + amount), None))
+
+    def available(self):
+        return self._change(lambda level: (None, level))
+
+
+class _Ticket:
+    """A caller waiting for admission"""
+
+    def __init__(self, seq, user_key, priority, tokens):
+        self.seq = seq
+        self.user_key = user_key
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+
+
+class RateGovernor:
+    """
+    Admission control for OpenAI calls
+
+    Every call must fit in a requests-per-minute and a tokens-per-minute
+    budget. Waiting callers are queued by priority class, and within a class
+    each user has their own queue that is served round-robin, so a single busy
+    user cannot starve everyone else.
+
+    With a ``shared_name`` the budgets are SharedTokenBucket rows that all
+    processes draw from, so the organisation's limits hold however many
+    workers run; queueing and fair sharing stay within each process.
+    Without one, the budgets apply to this process only.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_wait=30.0, shared_name=None):
+        if shared_name:
+            self.requests = SharedTokenBucket(f"{shared_name}:requests", requests_per_minute)
+            self.tokens = SharedTokenBucket(f"{shared_name}:tokens", tokens_per_minute)
+        else:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute)
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._wait_stats = {priority: {'admitted': 0, 'rejected': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+                            for priority in PRIORITIES}
+
+    def _enqueue(self, user_key, priority, tokens):
+        if priority not in self._queues:
+            priority = 'standard'
+        ticket = _Ticket(next(self._seq), user_key, priority, tokens)
+        self._queues[priority].setdefault(user_key, deque()).append(ticket)
+        return ticket
+
+    def _remove(self, ticket):
+        users = self._queues[ticket.priority]
+        queue = users.get(ticket.user_key)
+        if queue is None:
+            return
+        queue.remove(ticket)
+        if queue:
+            # Round-robin: this user goes to the back of the line
+            users.move_to_end(ticket.user_key)
+        else:
+            del users[ticket.user_key]
+
+    def _next_ticket(self):
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            if users:
+                return users[next(iter(users))][0]
+        return None
+
+    def _try_admit(self, ticket):
+        """Admit the ticket if it is next in line and the budgets allow; else return the delay"""
+        if self._next_ticket() is not ticket:
+            return None
+
+        try:
+            delay = self.requests.take(1)
+            if delay > 0:
+                return delay
+            delay = self.tokens.take(ticket.tokens)
+            if delay > 0:
+                self.requests.refund(1)
+                return delay
+        except Exception as e:
+            # Without the shared budget, admit rather than fail; the upstream still enforces its limits
+            logger.error(f"Error reading AI rate limit budget: {str(e)}")
+
+        self._remove(ticket)
+        self._record(ticket, admitted=True)
+        self._cond.notify_all()
+        return 0.0
+
+    def _reject(self, ticket):
+        self._remove(ticket)
+        self._record(ticket, admitted=False)
+        self._cond.notify_all()
+        logger.warning(f"AI rate limit: rejected {ticket.priority} call for {ticket.user_key} "
+                       f"after {time.monotonic() - ticket.enqueued:.1f}s")
+        return RateLimitExceeded(f"Timed out waiting for AI capacity ({ticket.priority})")
+
+    def _record(self, ticket, admitted):
+        waited = time.monotonic() - ticket.enqueued
+        stats = self._wait_stats[ticket.priority]
+        stats['admitted' if admitted else 'rejected'] += 1
+        if admitted:
+            stats['total_wait'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+
+    def acquire(self, user_key, priority='standard', tokens=0, max_wait=None):
+        """
+        Block until the call may proceed
+
+        Args:
+            user_key: Identifies the caller for fair sharing
+            priority (str): One of PRIORITIES
+            tokens (int): Estimated prompt plus completion tokens
+            max_wait (float): Seconds to wait before giving up
+
+        Raises:
+            RateLimitExceeded: If the call was not admitted in time
+        """
+        deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+        with self._cond:
+            ticket = self._enqueue(user_key, priority, tokens)
+            while True:
+                delay = self._try_admit(ticket)
+                if delay == 0.0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._reject(ticket)
+                self._cond.wait(min(remaining, delay) if delay is not None else remaining)
+
+    async def aacquire(self, user_key, priority='standard', tokens=0, max_wait=None):
+        """Async version of acquire"""
+        deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+        with self._cond:
+            ticket = self._enqueue(user_key, priority, tokens)
+        try:
+            while True:
+                delay = await sync_to_async(self._admit_step)(ticket)
+                if delay == 0.0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._cond:
+                        raise self._reject(ticket)
+                await asyncio.sleep(min(remaining, delay or ASYNC_POLL_INTERVAL, ASYNC_POLL_INTERVAL * 10))
+        except asyncio.CancelledError:
+            with self._cond:
+                self._remove(ticket)
+                self._cond.notify_all()
+            raise
+
+    def _admit_step(self, ticket):
+        with self._cond:
+            return self._try_admit(ticket)
+
+    def refund(self, tokens):
+        """Return unused tokens once the real usage of a call is known"""
+        if tokens <= 0:
+            return
+        with self._cond:
+            try:
+                self.tokens.refund(tokens)
+            except Exception as e:
+                logger.error(f"Error refunding AI rate limit budget: {str(e)}")
+            self._cond.notify_all()
+
+    async def arefund(self, tokens):
+        """Async version of refund"""
+        if tokens > 0:
+            await sync_to_async(self.refund)(tokens)
+
+    def get_metrics(self):
+        """Return queue depth and wait time metrics per priority class"""
+        with self._cond:
+            metrics = {
+                'requests_available': int(self.requests.available()),
+                'tokens_available': int(self.tokens.available()),
+                'priorities': {}
+            }
+            for priority in PRIORITIES:
+                stats = self._wait_stats[priority]
+                metrics['priorities'][priority] = {
+                    'queue_depth': sum(len(queue) for queue in self._queues[priority].values()),
+                    'admitted': stats['admitted'],
+                    'rejected': stats['rejected'],
+                    'avg_wait': stats['total_wait'] / stats['admitted'] if stats['admitted'] else 0.0,
+                    'max_wait': stats['max_wait'],
+                }
+        return metrics
+
+
+def priority_for(request_type):
+    """Map an AIResponse request type to its priority class"""
+    return getattr(settings, 'AI_RATE_LIMIT_PRIORITIES', {}).get(request_type, 'standard')
+
+
+rate_governor = RateGovernor(
+    requests_per_minute=getattr(settings, 'AI_RATE_LIMIT_RPM', 3500),
+    tokens_per_minute=getattr(settings, 'AI_RATE_LIMIT_TPM', 90000),
+    max_wait=getattr(settings, 'AI_RATE_LIMIT_MAX_WAIT', 30),
+    shared_name=getattr(settings, 'AI_RATE_LIMIT_SHARED_BUCKET', 'openai')
+)
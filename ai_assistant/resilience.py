@@ -0,0 +1,291 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CircuitBreakerState
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Upstream errors that are worth retrying and that count against the breaker
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    openai.error.APIError,
+    asyncio.TimeoutError,
+)
+
+# Monotonic time by which the current request must have its AI work done
+_request_deadline = contextvars.ContextVar('ai_request_deadline', default=None)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open"""
+    pass
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request has no time budget left for another call"""
+    pass
+
+
+def set_request_deadline(seconds):
+    """Start the AI time budget for the current request"""
+    _request_deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def clear_request_deadline():
+    _request_deadline.set(None)
+
+
+def get_request_deadline():
+    """The current request's deadline, to carry into work that outlives the view, e.g. a stream"""
+    return _request_deadline.get()
+
+
+def restore_request_deadline(deadline):
+    """Reinstate a deadline taken with get_request_deadline"""
+    _request_deadline.set(deadline)
+
+
+def remaining_budget():
+    """Seconds left in the current request's budget, or None outside a request"""
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the upstream is unhealthy
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    calls are rejected for ``recovery_timeout`` seconds. It then lets a
+    single trial call through (half-open); success closes it again, failure
+    re-opens it. State changes are mirrored to CircuitBreakerState so they
+    can be seen in the admin.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = None
+        self.last_error = ''
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless a call may go upstream now
+
+        Returns:
+            bool: True if the state changed and should be persisted
+        """
+        with self._lock:
+            changed = False
+            if self.state == self.CLOSED:
+                return changed
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    raise CircuitOpenError(f"Circuit '{self.name}' is open")
+                changed = self._transition(self.HALF_OPEN)
+            if self._trial_in_flight:
+                raise CircuitOpenError(f"Circuit '{self.name}' is half-open; trial call in flight")
+            self._trial_in_flight = True
+            return changed
+
+    def record_success(self):
+        with self._lock:
+            self._trial_in_flight = False
+            self.failure_count = 0
+            return self.state != self.CLOSED and self._transition(self.CLOSED)
+
+    def record_failure(self, error):
+        with self._lock:
+            self._trial_in_flight = False
+            self.failure_count += 1
+            self.last_error = str(error)[:500]
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                and self.failure_count >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                return self._transition(self.OPEN)
+            return False
+
+    def release(self):
+        """Give up a half-open trial slot without an upstream result"""
+        with self._lock:
+            self._trial_in_flight = False
+            return False
+
+    def record(self, error=None):
+        """Record the outcome of a call; returns True if the state changed"""
+        if error is None or isinstance(error, openai.error.OpenAIError) and not isinstance(error, RETRYABLE_ERRORS):
+            # Upstream answered (a client error still means it is healthy)
+            return self.record_success()
+        if isinstance(error, RETRYABLE_ERRORS):
+            return self.record_failure(error)
+        return self.release()
+
+    def _transition(self, state):
+        logger.warning(f"Circuit '{self.name}' {self.state} -> {state}")
+        self.state = state
+        return True
+
+    def persist(self):
+        """Mirror the current state to CircuitBreakerState"""
+        try:
+            CircuitBreakerState.objects.update_or_create(
+                name=self.name,
+                defaults={
+                    'state': self.state,
+                    'failure_count': self.failure_count,
+                    'opened_at': timezone.now() if self.state == self.OPEN else None,
+                    'last_error': self.last_error,
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error saving circuit breaker state: {str(e)}")
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        """Delay before retry number ``attempt`` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class ResilientCaller:
+    """
+    Run upstream calls with a deadline, bounded retries and a circuit breaker
+
+    Each attempt gets a timeout of at most ``call_timeout`` seconds, further
+    capped by whatever is left of the current request's budget. The timeout
+    starts once ``admit`` (the rate governor) has let the attempt through,
+    so time spent queued is not taken from the upstream call. A retry is
+    only made if the backoff still leaves time for it.
+    """
+
+    def __init__(self, breaker, retry_policy, call_timeout=20.0):
+        self.breaker = breaker
+        self.retry_policy = retry_policy
+        self.call_timeout = call_timeout
+
+    def timeout_for_call(self):
+        remaining = remaining_budget()
+        if remaining is None:
+            return self.call_timeout
+        if remaining <= 0:
+            raise DeadlineExceeded("AI request budget exhausted")
+        return min(self.call_timeout, remaining)
+
+    def _should_retry(self, error, attempt):
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.retry_policy.max_attempts:
+            return None
+        delay = self.retry_policy.backoff(attempt)
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= delay:
+            return None
+        logger.warning(f"Retrying AI call (attempt {attempt + 1}) in {delay:.2f}s after: {str(error)}")
+        return delay
+
+    def call(self, fn, admit=None):
+        """Call ``fn(timeout)`` with retries, each attempt after ``admit()``; returns its result"""
+        attempt = 0
+        while True:
+            attempt += 1
+            # Fail fast if the budget is already gone, before queueing for admission
+            self.timeout_for_call()
+            if self.breaker.before_call():
+                self.breaker.persist()
+            try:
+                if admit is not None:
+                    admit()
+                result = fn(self.timeout_for_call())
+            except Exception as e:
+                if self.breaker.record(e):
+                    self.breaker.persist()
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Interrupted without an upstream result; a half-open trial slot must not stay taken
+                self.breaker.release()
+                raise
+
+            if self.breaker.record():
+                self.breaker.persist()
+            return result
+
+    async def acall(self, coro_fn, admit=None):
+        """Async version of call, enforcing the timeout with asyncio"""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.timeout_for_call()
+            if self.breaker.before_call():
+                await sync_to_async(self.breaker.persist)()
+            try:
+                if admit is not None:
+                    await admit()
+                timeout = self.timeout_for_call()
+                result = await asyncio.wait_for(coro_fn(timeout), timeout)
+            except Exception as e:
+                if self.breaker.record(e):
+                    await sync_to_async(self.breaker.persist)()
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (client gone, losing hedge leg, failed gather sibling); free a half-open trial slot
+                self.breaker.release()
+                raise
+
+            if self.breaker.record():
+                await sync_to_async(self.breaker.persist)()
+            return result
+
+
+openai_breaker = CircuitBreaker(
+    'openai',
+    failure_threshold=getattr(settings, 'AI_BREAKER_FAILURE_THRESHOLD', 5),
+    recovery_timeout=getattr(settings, 'AI_BREAKER_RECOVERY_TIMEOUT', 30)
+)
+
+openai_caller = ResilientCaller(
+    openai_breaker,
+    RetryPolicy(
+        max_attempts=getattr(settings, 'AI_RETRY_MAX_ATTEMPTS', 3),
+        base_delay=getattr(settings, 'AI_RETRY_BASE_DELAY', 0.5),
+        max_delay=getattr(settings, 'AI_RETRY_MAX_DELAY', 8.0)
+    ),
+    call_timeout=getattr(settings, 'AI_CALL_TIMEOUT', 20)
+)
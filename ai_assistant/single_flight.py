@@ -0,0 +1,217 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import AIRequestLock
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight call that followers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _LeaderCancelled(Exception):
+    """The caller running a coalesced call was cancelled before it finished"""
+    pass
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls within one process
+
+    The first caller for a key runs the function; callers that arrive while
+    it is running wait for it and receive the same result (or exception).
+    If an async leader is cancelled, e.g. because its client disconnected,
+    its followers are not: the first of them to resume becomes the new
+    leader and runs the call itself.
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if not call.event.wait(self.timeout):
+                # The leader is taking too long; don't hold this caller hostage
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key, coro_fn):
+        """Async version of do, coalescing callers on the same event loop"""
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        while True:
+            future = self._async_calls.get(loop_key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # The leader's request was aborted; try again, possibly as the new leader
+                continue
+
+        future = loop.create_future()
+        self._async_calls[loop_key] = future
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._async_calls[loop_key]
+
+
+class LockTable:
+    """
+    Cross-process lock backed by AIRequestLock rows
+
+    Only one worker process can hold the row for a key. Rows expire after
+    ``ttl`` seconds so a crashed holder cannot block the key forever.
+    """
+
+    def __init__(self, ttl=60, poll_interval=0.25):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+    def acquire(self, key):
+        """Try to take the lock; returns an owner token or None"""
+        now = timezone.now()
+        owner = uuid.uuid4().hex
+        try:
+            AIRequestLock.objects.filter(key=key, expires_at__lte=now).delete()
+            with transaction.atomic():
+                AIRequestLock.objects.create(key=key, owner=owner, expires_at=now + timedelta(seconds=self.ttl))
+            return owner
+        except IntegrityError:
+            return None
+        except Exception as e:
+            # If the lock table is unavailable, fall back to uncoordinated calls
+            logger.error(f"Error acquiring AI request lock: {str(e)}")
+            return owner
+
+    def release(self, key, owner):
+        try:
+            AIRequestLock.objects.filter(key=key, owner=owner).delete()
+        except Exception as e:
+            logger.error(f"Error releasing AI request lock: {str(e)}")
+
+    def is_held(self, key):
+        return AIRequestLock.objects.filter(key=key, expires_at__gt=timezone.now()).exists()
+
+    def wait_for(self, lookup, key):
+        """Poll ``lookup`` until another process publishes a result or the lock expires"""
+        deadline = time.monotonic() + self.ttl
+        while time.monotonic() < deadline:
+            result = lookup(key)
+            if result is not None:
+                return result
+            if not self.is_held(key):
+                # Holder finished without publishing (e.g. an upstream error); check once more
+                return lookup(key)
+            time.sleep(self.poll_interval)
+        return None
+
+    async def await_for(self, alookup, key):
+        """Async version of wait_for"""
+        deadline = time.monotonic() + self.ttl
+        while time.monotonic() < deadline:
+            result = await alookup(key)
+            if result is not None:
+                return result
+            if not await sync_to_async(self.is_held)(key):
+                return await alookup(key)
+            await asyncio.sleep(self.poll_interval)
+        return None
+
+
+request_coalescer = SingleFlight(timeout=getattr(settings, 'AI_SINGLE_FLIGHT_TIMEOUT', 60))
+lock_table = LockTable(ttl=getattr(settings, 'AI_SINGLE_FLIGHT_TIMEOUT', 60))
+
+
+def coalesce(key, produce, lookup):
+    """
+    Run ``produce`` once for identical concurrent requests
+
+    Threads in this process share one call through the SingleFlight table.
+    The thread that wins then takes the cross-process lock; if another process
+    already holds it, we wait for that process to publish its result where
+    ``lookup`` can see it and only generate ourselves if it never appears.
+    """
+    def leader():
+        owner = lock_table.acquire(key)
+        if owner is None:
+            result = lock_table.wait_for(lookup, key)
+            if result is not None:
+                return result
+            return produce()
+
+        try:
+            return produce()
+        finally:
+            lock_table.release(key, owner)
+
+    return request_coalescer.do(key, leader)
+
+
+async def acoalesce(key, aproduce, alookup):
+    """Async version of coalesce"""
+    async def leader():
+        owner = await sync_to_async(lock_table.acquire)(key)
+        if owner is None:
+            result = await lock_table.await_for(alookup, key)
+            if result is not None:
+                return result
+            return await aproduce()
+
+        try:
+            return await aproduce()
+        finally:
+            await sync_to_async(lock_table.release)(key, owner)
+
+    return await request_coalescer.ado(key, leader)
@@ -0,0 +1,212 @@
+import time
+import atexit
+import bisect
+import logging
+import threading
+from decimal import Decimal
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AICallRollup
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds; the last bucket is open-ended
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+OUTCOMES = ('success', 'cache_hit', 'error')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram that can be merged and stored as a list of counts"""
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+
+    def percentile(self, pct):
+        """Estimate a percentile by interpolating within its bucket"""
+        total = sum(self.counts)
+        if not total:
+            return None
+        rank = total * pct / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0
+                if index == len(LATENCY_BUCKETS):
+                    return lower
+                return lower + (LATENCY_BUCKETS[index] - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-1]
+
+
+def price_for(model):
+    """Return the (prompt, completion) price per 1K tokens for a model name"""
+    prices = getattr(settings, 'AI_MODEL_PRICES', {})
+    # Dated snapshots such as gpt-3.5-turbo-0613 use their base model's price
+    matches = [name for name in prices if model.startswith(name)]
+    if not matches:
+        return Decimal('0'), Decimal('0')
+    price = prices[max(matches, key=len)]
+    return Decimal(str(price['prompt'])), Decimal(str(price['completion']))
+
+
+class _Bucket:
+    """Counters for one request type and model within one rollup period"""
+
+    def __init__(self):
+        self.requests = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.upstream_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = Decimal('0')
+        self.latency_total = 0.0
+        self.latency = Histogram()
+
+
+class TelemetryCollector:
+    """
+    In-memory AI call metrics, flushed periodically to AICallRollup
+
+    Requests record wall time, cache hit status and outcome; every upstream
+    call records its token usage and cost. Counters are kept per hour,
+    request type and model, and a background thread merges them into the
+    rollup table every ``flush_interval`` seconds and at exit.
+    """
+
+    def __init__(self, flush_interval=60.0):
+        self.flush_interval = flush_interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def _period(now=None):
+        return (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+    def _bucket(self, request_type, model):
+        key = (self._period(), request_type or 'other', model)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    def record_request(self, request_type, model, seconds, outcome):
+        """Record one generate_response call"""
+        with self._lock:
+            bucket = self._bucket(request_type, model)
+            bucket.requests += 1
+            bucket.latency_total += seconds
+            bucket.latency.add(seconds)
+            if outcome == 'cache_hit':
+                bucket.cache_hits += 1
+            elif outcome == 'error':
+                bucket.errors += 1
+        self._ensure_thread()
+
+    def record_usage(self, request_type, model, response_model, prompt_tokens, completion_tokens):
+        """Record the token usage of one upstream call"""
+        prompt_price, completion_price = price_for(response_model or model)
+        cost = (prompt_price * prompt_tokens + completion_price * completion_tokens) / 1000
+        with self._lock:
+            bucket = self._bucket(request_type, model)
+            bucket.upstream_calls += 1
+            bucket.prompt_tokens += prompt_tokens
+            bucket.completion_tokens += completion_tokens
+            bucket.cost += cost
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ai-telemetry', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Merge the in-memory counters into AICallRollup"""
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+
+        for (period, request_type, model), bucket in buckets.items():
+            try:
+                with transaction.atomic():
+                    rollup, _ = AICallRollup.objects.select_for_update().get_or_create(
+                        period_start=period, request_type=request_type, model=model
+                    )
+                    latency = Histogram(rollup.latency_histogram)
+                    latency.merge(bucket.latency)
+                    AICallRollup.objects.filter(id=rollup.id).update(
+                        requests=F('requests') + bucket.requests,
+                        cache_hits=F('cache_hits') + bucket.cache_hits,
+                        errors=F('errors') + bucket.errors,
+                        upstream_calls=F('upstream_calls') + bucket.upstream_calls,
+                        prompt_tokens=F('prompt_tokens') + bucket.prompt_tokens,
+                        completion_tokens=F('completion_tokens') + bucket.completion_tokens,
+                        cost=F('cost') + bucket.cost,
+                        latency_total=F('latency_total') + bucket.latency_total,
+                        latency_histogram=latency.counts
+                    )
+            except Exception as e:
+                logger.error(f"Error saving AI telemetry: {str(e)}")
+
+    def summary(self, days=7):
+        """
+        Per request type totals and latency percentiles
+
+        Returns:
+            list: One dictionary per request type, most expensive first
+        """
+        self.flush()
+        since = self._period(timezone.now() - timedelta(days=days))
+        totals = {}
+        for rollup in AICallRollup.objects.filter(period_start__gte=since):
+            row = totals.setdefault(rollup.request_type, {
+                'request_type': rollup.request_type,
+                'requests': 0, 'cache_hits': 0, 'errors': 0, 'upstream_calls': 0,
+                'prompt_tokens': 0, 'completion_tokens': 0, 'cost': Decimal('0'),
+                'latency': Histogram()
+            })
+            for field in ('requests', 'cache_hits', 'errors', 'upstream_calls', 'prompt_tokens',
+                          'completion_tokens', 'cost'):
+                row[field] += getattr(rollup, field)
+            row['latency'].merge(Histogram(rollup.latency_histogram))
+
+        rows = []
+        for row in totals.values():
+            latency = row.pop('latency')
+            row['p50'] = latency.percentile(50)
+            row['p95'] = latency.percentile(95)
+            row['p99'] = latency.percentile(99)
+            row['cache_hit_rate'] = row['cache_hits'] / row['requests'] * 100 if row['requests'] else 0
+            row['cost_per_day'] = row['cost'] / days
+            rows.append(row)
+        return sorted(rows, key=lambda r: r['cost'], reverse=True)
+
+
+telemetry = TelemetryCollector(flush_interval=getattr(settings, 'AI_TELEMETRY_FLUSH_INTERVAL', 60))
+
+atexit.register(telemetry.flush)
@@ -1,3 +1,1073 @@
-from django.test import TestCase
+import io
+import json
+import asyncio
+import time
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import openai
+from django.contrib.auth.models import User
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.utils import timezone
+
+from .admin import AIJobAdmin
+from .hedging import Hedger, HedgeBudget, LatencyTracker
+from .resilience import (CircuitBreaker, CircuitOpenError, ResilientCaller, RetryPolicy, remaining_budget)
+from dashboard.models import CustomerLead
+from .ai_cache import LRUCache, TieredResponseCache, make_cache_key
+from .ai_services import LearningService, LeadService
+from .blob_store import BlobStore, blob_store, content_digest
+from .context_manager import SUMMARY_PREFIX, ConversationContextManager
+from .copilot_sessions import CopilotSessionStore
+from .interaction_log import InteractionLogBuffer
+from .jobs import claim_next, _finish, schedule_outreach_prefetch, prefetch_outreach_job
+from .lead_analysis import LeadAnalysisPipeline, lead_fingerprint
+from .learning_catalog import CatalogUnavailable, LearningCatalog
+from .management.commands.run_fake_openai import fake_reply
+from .models import AICallRollup, AIContentBlob, AIJob, AIResponse, LeadEvaluation, LearningCatalogEntry, OutreachDraft, QuizQuestion, QuizQuestionServed
+from .outreach import OutreachBatcher, outreach_batcher, outreach_lead_data
+from .question_bank import QuestionBank, validate_question
+from .rate_limiter import RateGovernor, RateLimitExceeded, SharedTokenBucket
+from .single_flight import SingleFlight
+from .telemetry import LATENCY_BUCKETS, Histogram, TelemetryCollector, price_for
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_run(self):
+        flight = SingleFlight(timeout=5)
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('key', fn)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('key', fn))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 4)
+
+    def test_leader_error_reaches_followers(self):
+        flight = SingleFlight(timeout=5)
+        started, release = threading.Event(), threading.Event()
+        errors = []
+
+        def fn():
+            started.set()
+            release.wait(5)
+            raise ValueError('upstream failed')
+
+        def call():
+            try:
+                flight.do('key', fn)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=call))
+        threads[1].start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(errors), 2)
+
+    async def test_async_calls_share_one_run(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        results = await asyncio.gather(*(flight.ado('key', fn) for _ in range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 5)
+
+    async def test_cancelled_leader_hands_over_to_follower(self):
+        flight = SingleFlight()
+        calls = []
+        started = asyncio.Event()
+
+        async def fn():
+            calls.append(1)
+            started.set()
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        leader = asyncio.ensure_future(flight.ado('key', fn))
+        await started.wait()
+        followers = [asyncio.ensure_future(flight.ado('key', fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        self.assertEqual(await asyncio.gather(*followers), ['result'] * 3)
+        self.assertTrue(leader.cancelled())
+        # One follower took over and ran the call once more for the rest
+        self.assertEqual(len(calls), 2)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=30)
+
+    def open_breaker(self):
+        for _ in range(2):
+            self.breaker.before_call()
+            self.breaker.record(openai.error.APIConnectionError('down'))
+
+    def expire_recovery(self):
+        self.breaker.opened_at -= self.breaker.recovery_timeout
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.before_call()
+        self.breaker.record(openai.error.Timeout('slow'))
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.breaker.before_call()
+        self.assertTrue(self.breaker.record(openai.error.Timeout('slow')))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_success_resets_failure_count(self):
+        self.breaker.before_call()
+        self.breaker.record(openai.error.Timeout('slow'))
+        self.breaker.before_call()
+        self.breaker.record()
+        self.breaker.before_call()
+        self.breaker.record(openai.error.Timeout('slow'))
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_errors_do_not_count(self):
+        for _ in range(3):
+            self.breaker.before_call()
+            self.breaker.record(openai.error.InvalidRequestError('bad prompt', None))
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_allows_one_trial_and_success_closes(self):
+        self.open_breaker()
+        self.expire_recovery()
+
+        self.assertTrue(self.breaker.before_call())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.assertTrue(self.breaker.record())
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(self.breaker.before_call())
+
+    def test_half_open_failure_reopens(self):
+        self.open_breaker()
+        self.expire_recovery()
+
+        self.breaker.before_call()
+        self.breaker.record(openai.error.ServiceUnavailableError('down'))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_unrelated_error_releases_trial(self):
+        self.open_breaker()
+        self.expire_recovery()
+
+        self.breaker.before_call()
+        self.breaker.record(ValueError('not an upstream error'))
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.before_call()
+
+
+class ResilientCallerTests(SimpleTestCase):
+    def make_caller(self, call_timeout):
+        return ResilientCaller(CircuitBreaker('test'), RetryPolicy(max_attempts=1), call_timeout=call_timeout)
+
+    async def test_admission_wait_is_not_counted_against_the_timeout(self):
+        caller = self.make_caller(call_timeout=0.2)
+
+        async def admit():
+            await asyncio.sleep(0.15)
+
+        async def attempt(timeout):
+            await asyncio.sleep(0.1)
+            return timeout
+
+        self.assertEqual(await caller.acall(attempt, admit), 0.2)
+
+    def test_sync_timeout_is_taken_after_admission(self):
+        caller = self.make_caller(call_timeout=5)
+        order = []
+        result = caller.call(lambda timeout: order.append('call') or timeout, lambda: order.append('admit'))
+        self.assertEqual(order, ['admit', 'call'])
+        self.assertEqual(result, 5)
+
+    async def test_cancelled_half_open_trial_frees_the_slot(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=30)
+        caller = ResilientCaller(breaker, RetryPolicy(max_attempts=1))
+        breaker.before_call()
+        breaker.record(openai.error.APIConnectionError('down'))
+        breaker.opened_at -= breaker.recovery_timeout
+
+        started = asyncio.Event()
+
+        async def hang(timeout):
+            started.set()
+            await asyncio.sleep(10)
+
+        async def answer(timeout):
+            return 'ok'
+
+        with mock.patch.object(breaker, 'persist'):
+            trial = asyncio.ensure_future(caller.acall(hang))
+            await started.wait()
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+
+            self.assertEqual(await caller.acall(answer), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_interrupted_sync_trial_frees_the_slot(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=30)
+        caller = ResilientCaller(breaker, RetryPolicy(max_attempts=1))
+        breaker.before_call()
+        breaker.record(openai.error.APIConnectionError('down'))
+        breaker.opened_at -= breaker.recovery_timeout
+
+        def interrupted(timeout):
+            raise KeyboardInterrupt
+
+        with mock.patch.object(breaker, 'persist'):
+            with self.assertRaises(KeyboardInterrupt):
+                caller.call(interrupted)
+            self.assertEqual(caller.call(lambda timeout: 'ok'), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class StreamDeadlineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+
+    def test_stream_runs_under_the_request_deadline(self):
+        async def fake_stream(user, messages, conversation_id=None):
+            yield str(remaining_budget())
+
+        with mock.patch('ai_assistant.views.SalesCopilotService.astream_sales_suggestion', fake_stream):
+            response = self.client.post('/ai-assistant/stream-suggestion/',
+                                        json.dumps({'messages': [{'role': 'user', 'content': 'Hi'}]}),
+                                        content_type='application/json')
+
+            async def consume():
+                return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+            body = asyncio.run(consume())
+
+        token = json.loads(body.split('data: ')[1].split('\n')[0])['token']
+        self.assertNotEqual(token, 'None')
+        self.assertGreater(float(token), 0)
+
+
+class HedgerTests(SimpleTestCase):
+    def make_hedger(self, max_workers=4, delay=0.05):
+        tracker = LatencyTracker(min_samples=1)
+        tracker.record('copilot', delay)
+        budget = HedgeBudget(ratio=1.0)
+        return Hedger(tracker, budget, max_workers=max_workers)
+
+    def test_slow_primary_is_hedged(self):
+        hedger = self.make_hedger()
+        calls = []
+        release_primary = threading.Event()
+
+        def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                release_primary.wait(5)
+                return 'primary'
+            return 'hedge'
+
+        try:
+            self.assertEqual(hedger.call(fn, 'copilot'), 'hedge')
+        finally:
+            release_primary.set()
+        self.assertEqual(hedger.stats['hedge_wins'], 1)
+
+    def test_busy_pool_runs_inline_without_queueing(self):
+        hedger = self.make_hedger(max_workers=1)
+        running, release = threading.Event(), threading.Event()
+
+        def hold_worker():
+            running.set()
+            release.wait(5)
+
+        busy = threading.Thread(target=hedger.call, args=(hold_worker, 'copilot'))
+        busy.start()
+        try:
+            running.wait(5)
+            caller = threading.current_thread()
+            self.assertIs(hedger.call(lambda: threading.current_thread(), 'copilot'), caller)
+        finally:
+            release.set()
+            busy.join(5)
+
+    def test_no_samples_runs_inline(self):
+        hedger = Hedger(LatencyTracker(min_samples=20), HedgeBudget())
+        caller = threading.current_thread()
+        self.assertIs(hedger.call(lambda: threading.current_thread(), 'copilot'), caller)
+
+
+class JobQueueTests(TestCase):
+    def test_each_job_is_claimed_once(self):
+        jobs = [AIJob.objects.create(job_type='lead_analysis') for _ in range(3)]
+        claimed = [claim_next(worker) for worker in ('a', 'b', 'a', 'b')]
+
+        self.assertEqual(sorted(job.id for job in claimed[:3]), sorted(job.id for job in jobs))
+        self.assertIsNone(claimed[3])
+        self.assertEqual(set(AIJob.objects.values_list('attempts', flat=True)), {1})
+
+    def test_running_job_is_not_claimed_before_its_timeout(self):
+        AIJob.objects.create(job_type='lead_analysis')
+        self.assertIsNotNone(claim_next('a'))
+        self.assertIsNone(claim_next('b'))
+
+    def test_expired_job_is_reclaimed_and_old_worker_cannot_finish_it(self):
+        job = AIJob.objects.create(job_type='lead_analysis')
+        claim_next('a')
+        AIJob.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        reclaimed = claim_next('b')
+        self.assertEqual(reclaimed.id, job.id)
+        self.assertEqual(reclaimed.locked_by, 'b')
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertEqual(_finish(job, 'a', 'succeeded'), 0)
+        self.assertEqual(_finish(job, 'b', 'succeeded'), 1)
+
+    def test_expired_final_attempt_fails_the_job(self):
+        job = AIJob.objects.create(job_type='lead_analysis', max_attempts=1, status='running', attempts=1,
+                                   locked_by='a', locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(claim_next('b'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_requeue_skips_jobs_whose_dedup_key_is_live(self):
+        live = AIJob.objects.create(job_type='lead_analysis', dedup_key='shared')
+        blocked = AIJob.objects.create(job_type='lead_analysis', dedup_key='shared', status='failed', attempts=3)
+        duplicate = AIJob.objects.create(job_type='lead_analysis', dedup_key='other', status='failed', attempts=3)
+        second = AIJob.objects.create(job_type='lead_analysis', dedup_key='other', status='failed', attempts=3)
+
+        job_admin = AIJobAdmin(AIJob, admin.site)
+        with mock.patch.object(job_admin, 'message_user') as message_user:
+            job_admin.requeue_jobs(RequestFactory().post('/'), AIJob.objects.filter(status='failed'))
+
+        statuses = dict(AIJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[live.id], 'queued')
+        self.assertEqual(statuses[blocked.id], 'failed')
+        self.assertEqual(statuses[duplicate.id], 'queued')
+        self.assertEqual(statuses[second.id], 'failed')
+        self.assertEqual(message_user.call_count, 2)
+
+
+class FakeOpenAIReplyTests(SimpleTestCase):
+    leads = [{'id': lead_id, 'name': f'Lead {lead_id}', 'interest': 'loan', 'status': 'new', 'notes': ''}
+             for lead_id in (3, 7, 11)]
+
+    def test_lead_map_prompt_gets_a_score_per_lead(self):
+        prompt = LeadAnalysisPipeline.build_map_prompt(self.leads)
+        scores = LeadAnalysisPipeline.parse_scores(fake_reply(prompt), self.leads)
+        self.assertEqual(set(scores), {3, 7, 11})
+
+    def test_outreach_pack_prompt_gets_a_message_per_lead(self):
+        prompt = OutreachBatcher.build_pack_prompt(self.leads)
+        messages = OutreachBatcher.parse_messages(fake_reply(prompt), self.leads)
+        self.assertEqual(set(messages), {3, 7, 11})
+
+    def test_quiz_prompt_gets_the_requested_questions(self):
+        prompt = LearningService.build_quiz_prompt('loan', 'beginner', count=3, avoid=['Old question?'])
+        questions = LearningService.parse_quiz_questions(fake_reply(prompt))
+        self.assertEqual(len(questions), 3)
+        self.assertTrue(all(len(question['options']) == 4 for question in questions))
+
+
+class OutreachPrefetchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.leads = [CustomerLead.objects.create(user=self.user, name=f'Lead {i}', phone='9999999999',
+                                                  interest='loan', status='interested', priority_score=1 - i / 10)
+                      for i in range(3)]
+
+    def test_prefetched_draft_is_served_without_a_model_call(self):
+        job = schedule_outreach_prefetch(self.user)
+        with mock.patch.object(LeadService, 'generate_response',
+                               side_effect=lambda prompt, **kwargs: fake_reply(prompt)):
+            self.assertEqual(prefetch_outreach_job(job), {'prefetched': 3})
+        drafts = dict(OutreachDraft.objects.values_list('lead_id', 'message'))
+
+        with mock.patch.object(LeadService, 'agenerate_response', new_callable=mock.AsyncMock) as agenerate:
+            response = self.client.post('/ai-assistant/generate-lead-messages/',
+                                        json.dumps({'lead_ids': [lead.id for lead in self.leads]}),
+                                        content_type='application/json')
+        agenerate.assert_not_called()
+        self.assertEqual({int(lead_id): message for lead_id, message in response.json()['messages'].items()}, drafts)
+        self.assertIsNone(schedule_outreach_prefetch(self.user))
+
+    def test_changed_lead_draft_is_not_reused(self):
+        lead = self.leads[0]
+        outreach_batcher.store({lead.id: 'Old draft'}, [outreach_lead_data(lead)])
+        lead.notes = 'Wants a lower EMI'
+        lead.save()
+        lead.refresh_from_db()
+        self.assertEqual(outreach_batcher.cached([outreach_lead_data(lead)]), {})
+
+    def test_daily_budget_is_never_exceeded(self):
+        budget = outreach_batcher.prefetch_daily_budget
+        self.assertEqual(outreach_batcher.reserve_prefetch(self.user.id, budget - 2), budget - 2)
+        self.assertEqual(outreach_batcher.reserve_prefetch(self.user.id, 5), 2)
+        self.assertEqual(outreach_batcher.reserve_prefetch(self.user.id, 1), 0)
+        self.assertEqual(outreach_batcher.remaining_prefetch(self.user.id), 0)
+
+
+class ResponseCacheTests(TestCase):
+    def test_key_ignores_whitespace_only_differences(self):
+        messages = [{'role': 'user', 'content': 'Explain term insurance'}]
+        key = make_cache_key('gpt-3.5-turbo', [{'role': 'user', 'content': 'Explain  term\ninsurance'}], 100)
+        self.assertEqual(key, make_cache_key('gpt-3.5-turbo', messages, 100))
+        self.assertNotEqual(key, make_cache_key('gpt-3.5-turbo', messages, 200))
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')
+        cache.set('c', 3, 60)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = LRUCache()
+        cache.set('a', 1, 60)
+        with mock.patch('ai_assistant.ai_cache.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            self.assertIsNone(cache.get('a'))
+
+    def test_persistent_tier_serves_other_processes(self):
+        TieredResponseCache(ttls={'learning': 60}).set('key', 'Stored response', 'learning')
+        # A fresh instance stands in for another process with an empty in-memory tier
+        other = TieredResponseCache(ttls={'learning': 60})
+        self.assertEqual(other.get('key'), 'Stored response')
+        self.assertEqual(other.get_stats()['persistent_hits'], 1)
+        self.assertEqual(other.get('key'), 'Stored response')
+        self.assertEqual(other.get_stats()['memory_hits'], 1)
+
+    def test_uncacheable_types_are_not_stored(self):
+        cache = TieredResponseCache(ttls={'learning': 60})
+        cache.set('key', 'Response', 'copilot')
+        self.assertIsNone(cache.get('key'))
+
+
+class RateGovernorTests(SimpleTestCase):
+    def make_governor(self):
+        # 20 requests a second once the bucket is drained, so waiters queue up
+        governor = RateGovernor(requests_per_minute=1200, tokens_per_minute=10 ** 6, max_wait=5)
+        governor.requests.level = 0
+        return governor
+
+    async def admission_order(self, governor, callers):
+        order = []
+
+        async def call(user_key, priority):
+            await governor.aacquire(user_key, priority)
+            order.append(f'{user_key}:{priority}')
+
+        await asyncio.gather(*(call(user_key, priority) for user_key, priority in callers))
+        return order
+
+    async def test_interactive_calls_go_before_batch(self):
+        order = await self.admission_order(self.make_governor(), [
+            ('a', 'batch'), ('b', 'batch'), ('c', 'standard'), ('d', 'interactive')
+        ])
+        self.assertEqual(order, ['d:interactive', 'c:standard', 'a:batch', 'b:batch'])
+
+    async def test_users_in_a_class_are_served_round_robin(self):
+        order = await self.admission_order(self.make_governor(), [
+            ('a', 'standard'), ('a', 'standard'), ('a', 'standard'), ('b', 'standard'), ('c', 'standard')
+        ])
+        self.assertEqual(order, ['a:standard', 'b:standard', 'c:standard', 'a:standard', 'a:standard'])
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        governor = self.make_governor()
+        waiter = asyncio.ensure_future(governor.aacquire('a', 'standard'))
+        await asyncio.sleep(0.01)
+        self.assertEqual(governor.get_metrics()['priorities']['standard']['queue_depth'], 1)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(governor.get_metrics()['priorities']['standard']['queue_depth'], 0)
+        await governor.aacquire('b', 'standard')
+
+    def test_timed_out_call_is_rejected_and_counted(self):
+        governor = self.make_governor()
+        with self.assertRaises(RateLimitExceeded):
+            governor.acquire('a', 'batch', max_wait=0.01)
+        governor.acquire('a', 'interactive', max_wait=1)
+
+        metrics = governor.get_metrics()['priorities']
+        self.assertEqual((metrics['batch']['admitted'], metrics['batch']['rejected']), (0, 1))
+        self.assertEqual((metrics['interactive']['admitted'], metrics['interactive']['rejected']), (1, 0))
+        self.assertGreater(metrics['interactive']['max_wait'], 0)
+
+    def test_token_budget_and_refund(self):
+        governor = RateGovernor(requests_per_minute=100, tokens_per_minute=60, max_wait=0)
+        governor.acquire('a', tokens=50)
+        with self.assertRaises(RateLimitExceeded):
+            governor.acquire('a', tokens=50)
+        governor.refund(40)
+        governor.acquire('a', tokens=50)
+
+
+class SharedRateBudgetTests(TestCase):
+    def test_processes_draw_from_one_budget(self):
+        # Two governors stand in for two worker processes
+        first = RateGovernor(requests_per_minute=3, tokens_per_minute=10 ** 6, max_wait=0, shared_name='test')
+        second = RateGovernor(requests_per_minute=3, tokens_per_minute=10 ** 6, max_wait=0, shared_name='test')
+        first.acquire('a')
+        second.acquire('b')
+        first.acquire('a')
+        with self.assertRaises(RateLimitExceeded):
+            second.acquire('b')
+        self.assertEqual(first.get_metrics()['requests_available'], 0)
+
+    def test_take_never_overdraws_and_refund_is_capped(self):
+        bucket = SharedTokenBucket('test:tokens', 100)
+        self.assertEqual(bucket.take(70), 0.0)
+        self.assertGreater(bucket.take(70), 0)
+        self.assertAlmostEqual(bucket.available(), 30, delta=1)
+        bucket.refund(500)
+        self.assertAlmostEqual(bucket.available(), 100)
+
+
+class InteractionLogBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        # Blob ids remembered from earlier tests point at rows the flush between tests removed
+        blob_store.known.clear()
+
+    def record(self, buffer, count):
+        for i in range(count):
+            buffer.record(self.user, 'copilot', [{'role': 'user', 'content': f'Question {i}'}], f'Answer {i}')
+
+    def wait_for_rows(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while AIResponse.objects.count() < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return AIResponse.objects.count()
+
+    def test_full_batch_is_written_without_waiting_for_the_interval(self):
+        buffer = InteractionLogBuffer(batch_size=3, flush_interval=60)
+        self.addCleanup(buffer.close)
+        self.record(buffer, 3)
+        self.assertEqual(self.wait_for_rows(3, timeout=30), 3)
+        self.assertEqual(AIResponse.objects.first().response_text.startswith('Answer'), True)
+
+    def test_partial_batch_is_written_after_the_interval(self):
+        buffer = InteractionLogBuffer(batch_size=100, flush_interval=0.1)
+        self.addCleanup(buffer.close)
+        self.record(buffer, 2)
+        self.assertEqual(self.wait_for_rows(2), 2)
+        self.assertEqual(buffer.get_stats()['written'], 2)
+
+    def test_close_flushes_what_is_queued(self):
+        buffer = InteractionLogBuffer(batch_size=100, flush_interval=60)
+        self.record(buffer, 5)
+        buffer.close()
+        self.assertEqual(AIResponse.objects.count(), 5)
+        self.assertEqual(buffer.get_stats()['pending'], 0)
+
+    def test_records_beyond_the_queue_are_dropped_and_counted(self):
+        buffer = InteractionLogBuffer(max_size=2, batch_size=100, flush_interval=60)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            self.record(buffer, 3)
+        self.assertEqual((buffer.stats['queued'], buffer.stats['dropped']), (2, 1))
+        buffer.close()
+        self.assertEqual(AIResponse.objects.count(), 2)
+
+    def locked_once(self, failures):
+        bulk_create = AIResponse.objects.bulk_create
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError('database is locked')
+            return bulk_create(*args, **kwargs)
+
+        return mock.patch.object(AIResponse.objects, 'bulk_create', side_effect=flaky)
+
+    def test_locked_database_is_retried(self):
+        buffer = InteractionLogBuffer(batch_size=100, flush_interval=60, retry_delay=0.01)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            self.record(buffer, 3)
+        with self.locked_once(failures=2):
+            buffer.flush()
+        self.assertEqual(buffer.get_stats()['written'], 3)
+        self.assertEqual(buffer.get_stats()['retried'], 2)
+        self.assertEqual(sorted(row.prompt_text for row in AIResponse.objects.all()),
+                         [json.dumps([{'role': 'user', 'content': f'Question {i}'}]) for i in range(3)])
+
+    def test_batch_is_requeued_when_retries_run_out(self):
+        buffer = InteractionLogBuffer(batch_size=100, flush_interval=60, retries=0, max_requeues=1)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            self.record(buffer, 3)
+        with self.locked_once(failures=1):
+            buffer.flush()
+        self.assertEqual(AIResponse.objects.count(), 3)
+        self.assertEqual(buffer.get_stats()['failed'], 0)
+
+        with mock.patch.object(buffer, '_ensure_thread'):
+            self.record(buffer, 1)
+        with self.locked_once(failures=2):
+            buffer.flush()
+        self.assertEqual(buffer.get_stats()['failed'], 1)
+
+
+class QuestionBankTests(TestCase):
+    OPTIONS = ['Alpha', 'Beta', 'Gamma', 'Delta']
+
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.bank = QuestionBank(quiz_size=3, target_pool=5)
+
+    def item(self, question='What is covered?', **fields):
+        return dict({'question': question, 'options': list(self.OPTIONS), 'correct_answer': 1}, **fields)
+
+    def test_malformed_items_are_rejected(self):
+        for item in ['not a dict', self.item(question=' '), self.item(options=self.OPTIONS[:3]),
+                     self.item(options='Alpha, Beta'), self.item(options=['Alpha', 'alpha', 'Gamma', 'Delta']),
+                     self.item(options=['Alpha', '', 'Gamma', 'Delta']), self.item(correct_answer=4),
+                     self.item(correct_answer=True), self.item(correct_answer='E'),
+                     self.item(correct_answer='Epsilon'), self.item(correct_answer=None)]:
+            with self.subTest(item=item):
+                self.assertIsNone(validate_question(item))
+
+    def test_answer_formats_normalize_to_an_index(self):
+        for answer in [2, '2', 'C', 'c', 'Gamma', 'C) Gamma']:
+            with self.subTest(answer=answer):
+                self.assertEqual(validate_question(self.item(correct_answer=answer))['correct_answer'], 2)
+
+        question = validate_question(self.item(options=['A) Alpha', 'b. Beta', 'C: Gamma', 'Delta'], answer='b'))
+        self.assertEqual(question, {'question': 'What is covered?', 'options': self.OPTIONS, 'correct_answer': 1})
+
+    def test_ingest_drops_invalid_and_duplicate_questions(self):
+        items = [self.item('What is a premium?'), self.item('what is  a PREMIUM?'), self.item(correct_answer=9),
+                 self.item('What is a claim?')]
+        self.assertEqual(self.bank.ingest('insurance', 'beginner', items), 2)
+        self.assertEqual(self.bank.ingest('insurance', 'beginner', [self.item('What is a premium? ')]), 0)
+        self.assertEqual(self.bank.ingest('insurance', 'advanced', [self.item('What is a premium?')]), 1)
+        self.assertEqual(self.bank.ingest('insurance', 'beginner', 'not a list'), 0)
+
+    def make_pool(self, size):
+        self.bank.ingest('insurance', 'beginner', [self.item(f'Question {i}?') for i in range(size)])
+
+    def test_draw_prefers_unseen_then_least_recently_seen(self):
+        self.make_pool(6)
+        first, low = self.bank.draw(self.user, 'insurance', 'beginner')
+        self.assertFalse(low)
+        second, low = self.bank.draw(self.user, 'insurance', 'beginner')
+        self.assertFalse(low)
+        self.assertFalse({q['id'] for q in first} & {q['id'] for q in second})
+
+        # Everything has been seen now; the first quiz was seen longest ago
+        QuizQuestionServed.objects.filter(question_id__in=[q['id'] for q in first]).update(
+            served_at=timezone.now() - timedelta(days=1))
+        third, low = self.bank.draw(self.user, 'insurance', 'beginner')
+        self.assertTrue(low)
+        self.assertEqual({q['id'] for q in third}, {q['id'] for q in first})
+        self.assertEqual(QuizQuestionServed.objects.filter(user=self.user).count(), 6)
+
+    def test_draw_is_per_partner(self):
+        self.make_pool(6)
+        self.bank.draw(self.user, 'insurance', 'beginner')
+        other = User.objects.create_user('other', password='secret')
+        _, low = self.bank.draw(other, 'insurance', 'beginner')
+        self.assertFalse(low)
+
+    def test_small_or_empty_pool_is_low(self):
+        self.assertEqual(self.bank.draw(self.user, 'insurance', 'beginner'), ([], True))
+        self.make_pool(4)
+        questions, low = self.bank.draw(self.user, 'insurance', 'beginner')
+        self.assertEqual(len(questions), 3)
+        self.assertTrue(low)
+        self.assertEqual(QuizQuestion.objects.count(), 4)
+
+
+class ConversationContextTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('agent', password='secret')
+        # Every turn is 14 estimated tokens, so 10 turns need folding and the last 5 fit
+        self.manager = ConversationContextManager(max_tokens=100, recent_turns=2, summary_tokens=20)
+
+    def chat(self, count, topic='term insurance'):
+        turns = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'{topic} turn {i}'.ljust(40, '.')}
+                 for i in range(count)]
+        return [{'role': 'system', 'content': 'sys'}] + turns
+
+    def fit(self, messages, summary='Customer wants cover', conversation_id=None):
+        with mock.patch('ai_assistant.ai_services.AIService.generate_response', return_value=summary) as generate:
+            return self.manager.fit(self.user, messages, conversation_id), generate
+
+    def test_messages_under_budget_are_sent_as_is(self):
+        messages = self.chat(4)
+        fitted, generate = self.fit(messages)
+        self.assertEqual(fitted, messages)
+        generate.assert_not_called()
+
+    def test_old_turns_are_folded_into_a_summary(self):
+        messages = self.chat(10)
+        self.assertEqual(self.manager.required_fold_count(messages[:1], messages[1:]), 5)
+
+        fitted, generate = self.fit(messages)
+        generate.assert_called_once()
+        # Folded down to the recent window, not just to the budget
+        self.assertIn('turn 7', generate.call_args.args[0][1]['content'])
+        self.assertNotIn('turn 8', generate.call_args.args[0][1]['content'])
+        self.assertEqual(fitted, messages[:1] + [{'role': 'system', 'content': f'{SUMMARY_PREFIX}Customer wants cover'}]
+                         + messages[-2:])
+
+    def test_latest_turn_is_kept_even_if_over_budget(self):
+        messages = self.chat(2) + [{'role': 'user', 'content': 'x' * 1000}]
+        self.assertEqual(self.manager.required_fold_count(messages[:1], messages[1:]), 2)
+
+    def test_summary_is_reused_until_the_window_is_used_up(self):
+        self.fit(self.chat(10), conversation_id=7)
+        fitted, generate = self.fit(self.chat(11), summary='unused', conversation_id=7)
+        generate.assert_not_called()
+        self.assertEqual(fitted[1]['content'], f'{SUMMARY_PREFIX}Customer wants cover')
+        self.assertEqual(fitted[2:], self.chat(11)[-3:])
+
+        # Past the window only the newly dropped turns are summarized, on top of the old summary
+        fitted, generate = self.fit(self.chat(20), summary='Customer wants more cover', conversation_id=7)
+        prompt = generate.call_args.args[0][1]['content']
+        self.assertIn(f'{SUMMARY_PREFIX}Customer wants cover', prompt)
+        self.assertNotIn('turn 7', prompt)
+        self.assertIn('turn 8', prompt)
+        self.assertEqual(fitted[1]['content'], f'{SUMMARY_PREFIX}Customer wants more cover')
+
+    def test_chats_with_the_same_opening_do_not_share_a_summary(self):
+        first = self.chat(2) + self.chat(8, topic='health insurance')[1:]
+        second = self.chat(2) + self.chat(8, topic='mutual funds')[1:]
+        self.fit(first, summary='Health cover')
+
+        fitted, generate = self.fit(second, summary='Mutual funds')
+        generate.assert_called_once()
+        self.assertIn('mutual funds', generate.call_args.args[0][1]['content'])
+        self.assertEqual(fitted[1]['content'], f'{SUMMARY_PREFIX}Mutual funds')
+
+    def test_failed_summary_truncates_and_is_not_cached(self):
+        from .ai_services import FALLBACK_RESPONSE
+
+        messages = self.chat(10)
+        fitted, _ = self.fit(messages, summary=FALLBACK_RESPONSE)
+        self.assertEqual(fitted, messages[:1] + messages[-2:])
+        _, generate = self.fit(messages)
+        generate.assert_called_once()
+
+
+class CopilotSessionStoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.store = CopilotSessionStore()
+        self.conversation = self.store.create(self.user, 'new', 'term_insurance')
+
+    def test_session_is_only_visible_to_its_owner(self):
+        other = User.objects.create_user('other', password='secret')
+        self.assertEqual(self.store.get(self.user, self.conversation.id), self.conversation)
+        self.assertIsNone(self.store.get(other, self.conversation.id))
+        self.assertEqual(self.conversation.title[:25], 'Term Insurance conversati')
+
+    def test_turns_are_stored_and_served_from_the_hot_cache(self):
+        self.store.append(self.conversation, 'user', 'Customer says the premium is high')
+        self.store.append(self.conversation, 'assistant', 'Compare it with the cover amount')
+
+        with self.assertNumQueries(0):
+            messages = self.store.build_messages(self.conversation)
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertIn('new customer about a term_insurance product', messages[0]['content'])
+        self.assertEqual(messages[1:], [{'role': 'user', 'content': 'Customer says the premium is high'},
+                                        {'role': 'assistant', 'content': 'Compare it with the cover amount'}])
+        self.assertEqual(list(self.conversation.messages.values_list('role', flat=True)), ['user', 'assistant'])
+
+    def test_history_appended_by_another_worker_is_reloaded(self):
+        self.store.append(self.conversation, 'user', 'First question')
+        other_worker = CopilotSessionStore()
+        conversation = other_worker.get(self.user, self.conversation.id)
+        other_worker.append(conversation, 'assistant', 'First answer')
+
+        # A stale copy of the conversation row still trusts the hot cache
+        self.assertEqual(len(self.store.get_history(self.conversation)), 1)
+        fresh = self.store.get(self.user, self.conversation.id)
+        self.assertEqual(self.store.get_history(fresh), [{'role': 'user', 'content': 'First question'},
+                                                         {'role': 'assistant', 'content': 'First answer'}])
+
+    async def test_async_append_and_build(self):
+        conversation = await self.store.aget(self.user, self.conversation.id)
+        await self.store.aappend(conversation, 'user', 'Any tax benefit?')
+        messages = await self.store.abuild_messages(conversation)
+        self.assertEqual(messages[1:], [{'role': 'user', 'content': 'Any tax benefit?'}])
+
+
+class BlobStoreTests(TestCase):
+    SYSTEM = json.dumps([{'role': 'system', 'content': 'You are a sales assistant. ' * 20}])
+
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.store = BlobStore()
+        blob_store.known.clear()
+
+    def test_each_distinct_body_is_stored_once_and_compressed(self):
+        ids = self.store.store_many([self.SYSTEM, 'Reply one', self.SYSTEM])
+        self.assertEqual(len(ids), 2)
+        blob = AIContentBlob.objects.get(id=ids[content_digest(self.SYSTEM)])
+        self.assertEqual(blob.size, len(self.SYSTEM))
+        self.assertLess(len(bytes(blob.data)), blob.size)
+        self.assertEqual(blob.text, self.SYSTEM)
+
+        # Known digests cost no queries; digests stored by another writer are looked up, not duplicated
+        with self.assertNumQueries(0):
+            self.assertEqual(self.store.store_many([self.SYSTEM]), {content_digest(self.SYSTEM): blob.id})
+        self.assertEqual(BlobStore().store_many([self.SYSTEM, 'Reply one']), ids)
+        self.assertEqual(AIContentBlob.objects.count(), 2)
+
+    def test_attached_bodies_round_trip(self):
+        entries = [AIResponse(user=self.user, request_type='copilot', prompt=self.SYSTEM, response=f'Reply {i}')
+                   for i in range(3)]
+        AIResponse.objects.bulk_create(self.store.attach(entries))
+        self.assertEqual(AIContentBlob.objects.count(), 4)
+
+        rows = AIResponse.objects.select_related('prompt_blob', 'response_blob').order_by('id')
+        self.assertEqual([(row.prompt, row.response) for row in rows], [('', '')] * 3)
+        self.assertEqual([(row.prompt_text, row.response_text) for row in rows],
+                         [(self.SYSTEM, f'Reply {i}') for i in range(3)])
+        self.assertEqual(len({row.prompt_blob_id for row in rows}), 1)
+
+    def test_backfill_moves_inline_bodies_into_blobs(self):
+        AIResponse.objects.bulk_create([
+            AIResponse(user=self.user, request_type='copilot', prompt=self.SYSTEM, response=f'Reply {i % 2}')
+            for i in range(5)
+        ])
+        AIResponse.objects.bulk_create(blob_store.attach([
+            AIResponse(user=self.user, request_type='lead', prompt='Already moved', response='Done')
+        ]))
+
+        out = io.StringIO()
+        call_command('backfill_ai_blobs', batch_size=2, stdout=out)
+        self.assertIn('Backfilled 5 AI responses', out.getvalue())
+        self.assertFalse(AIResponse.objects.filter(prompt_blob__isnull=True).exists())
+        self.assertFalse(AIResponse.objects.exclude(prompt='', response='').exists())
+        self.assertEqual(AIContentBlob.objects.count(), 5)
+        self.assertEqual(sorted(row.response_text for row in AIResponse.objects.filter(request_type='copilot')),
+                         ['Reply 0'] * 3 + ['Reply 1'] * 2)
+
+        call_command('backfill_ai_blobs', stdout=out)
+        self.assertIn('Backfilled 0 AI responses', out.getvalue())
+
+
+class HistogramTests(SimpleTestCase):
+    def test_values_land_in_the_bucket_they_do_not_exceed(self):
+        histogram = Histogram()
+        for seconds in (0, 0.1, 0.11, 1, 1.5, 32, 90):
+            histogram.add(seconds)
+        self.assertEqual(len(histogram.counts), len(LATENCY_BUCKETS) + 1)
+        self.assertEqual(histogram.counts, [2, 1, 0, 1, 1, 0, 0, 0, 1, 1])
+
+    def test_merge_adds_counts(self):
+        first, second = Histogram(), Histogram([1] * (len(LATENCY_BUCKETS) + 1))
+        first.add(0.3)
+        first.merge(second)
+        self.assertEqual(first.counts, [1, 1, 2, 1, 1, 1, 1, 1, 1, 1])
+
+    def test_percentiles_interpolate_within_a_bucket(self):
+        self.assertIsNone(Histogram().percentile(50))
+
+        histogram = Histogram()
+        for _ in range(10):
+            histogram.add(0.75)
+        # All ten in (0.5, 1]: the median sits halfway through that bucket
+        self.assertAlmostEqual(histogram.percentile(50), 0.75)
+        self.assertAlmostEqual(histogram.percentile(100), 1)
+
+        histogram.add(60)
+        self.assertEqual(histogram.percentile(99), LATENCY_BUCKETS[-1])
+
+
+class TelemetryTests(TestCase):
+    def setUp(self):
+        self.collector = TelemetryCollector()
+        patcher = mock.patch.object(self.collector, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(AI_MODEL_PRICES={'gpt-3.5-turbo': {'prompt': 0.0005, 'completion': 0.0015},
+                                        'gpt-3.5-turbo-16k': {'prompt': 0.003, 'completion': 0.004}})
+    def test_price_uses_the_longest_matching_model_name(self):
+        self.assertEqual(price_for('gpt-3.5-turbo-0613'), (Decimal('0.0005'), Decimal('0.0015')))
+        self.assertEqual(price_for('gpt-3.5-turbo-16k-0613'), (Decimal('0.003'), Decimal('0.004')))
+        self.assertEqual(price_for('gpt-4'), (Decimal('0'), Decimal('0')))
+
+    @override_settings(AI_MODEL_PRICES={'gpt-3.5-turbo': {'prompt': 0.0005, 'completion': 0.0015}})
+    def test_flushes_merge_into_one_hourly_rollup(self):
+        self.collector.record_request('copilot', 'gpt-3.5-turbo', 0.4, 'success')
+        self.collector.record_request('copilot', 'gpt-3.5-turbo', 0.05, 'cache_hit')
+        self.collector.record_usage('copilot', 'gpt-3.5-turbo', 'gpt-3.5-turbo-0613', 1000, 500)
+        self.collector.flush()
+        self.collector.record_request('copilot', 'gpt-3.5-turbo', 3, 'error')
+        self.collector.record_usage('copilot', 'gpt-3.5-turbo', None, 200, 0)
+        self.collector.flush()
+
+        rollup = AICallRollup.objects.get()
+        self.assertEqual((rollup.requests, rollup.cache_hits, rollup.errors, rollup.upstream_calls),
+                         (3, 1, 1, 2))
+        self.assertEqual((rollup.prompt_tokens, rollup.completion_tokens), (1200, 500))
+        # (1000 * 0.0005 + 500 * 0.0015) / 1000 + 200 * 0.0005 / 1000
+        self.assertEqual(rollup.cost, Decimal('0.00135'))
+        self.assertAlmostEqual(rollup.latency_total, 3.45)
+        self.assertEqual(rollup.latency_histogram, [1, 0, 1, 0, 0, 1, 0, 0, 0, 0])
+        self.assertEqual(rollup.period_start, timezone.now().replace(minute=0, second=0, microsecond=0))
+
+    def test_summary_totals_request_types_across_hours(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for period, model, requests, hits, cost in [(hour, 'gpt-3.5-turbo', 6, 3, '0.7'),
+                                                    (hour - timedelta(hours=5), 'gpt-4', 2, 0, '0.7'),
+                                                    (hour - timedelta(days=9), 'gpt-4', 50, 0, '9')]:
+            latency = Histogram()
+            for _ in range(requests):
+                latency.add(0.75)
+            AICallRollup.objects.create(period_start=period, request_type='copilot', model=model,
+                                        requests=requests, cache_hits=hits, cost=Decimal(cost),
+                                        latency_histogram=latency.counts)
+        AICallRollup.objects.create(period_start=hour, request_type='lead', model='gpt-3.5-turbo', requests=1,
+                                    cost=Decimal('0.1'))
+
+        copilot, lead = self.collector.summary(days=7)
+        self.assertEqual(copilot['request_type'], 'copilot')
+        self.assertEqual(copilot['requests'], 8)
+        self.assertEqual(copilot['cost'], Decimal('1.4'))
+        self.assertEqual(copilot['cost_per_day'], Decimal('0.2'))
+        self.assertEqual(copilot['cache_hit_rate'], 37.5)
+        self.assertAlmostEqual(copilot['p50'], 0.75)
+        self.assertIsNone(lead['p95'])
+
+
+class LeadAnalysisTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.leads = [CustomerLead.objects.create(user=self.user, name=f'Lead {i}', phone='9999999999',
+                                                  status='interested', interest='term_insurance')
+                      for i in range(5)]
+        self.pipeline = LeadAnalysisPipeline(chunk_size=2, shortlist_size=3)
+
+    def lead_data(self):
+        return [{'id': lead.id, 'name': lead.name, 'status': lead.status, 'notes': lead.notes}
+                for lead in CustomerLead.objects.order_by('id')]
+
+    def test_parse_scores_keeps_only_valid_items_for_the_chunk(self):
+        chunk = [{'id': 1}, {'id': 2}, {'id': 3}]
+        response = ('Here are the scores:\n[{"id": 1, "score": 80, "reason": "Asked for a quote"}, '
+                    '{"id": "2", "score": "55.5"}, {"id": 9, "score": 99}, {"id": 3, "score": "high"}, '
+                    '{"score": 10}, "junk"]\nGood luck!')
+        self.assertEqual(LeadAnalysisPipeline.parse_scores(response, chunk),
+                         {1: (80.0, 'Asked for a quote'), 2: (55.5, '')})
+        self.assertEqual(LeadAnalysisPipeline.parse_scores('No scores today', chunk), {})
+        self.assertEqual(LeadAnalysisPipeline.parse_scores('{"id": 1, "score": 80}', chunk), {})
+
+    def test_shortlist_ranks_scored_leads_first(self):
+        leads = [{'id': lead_id} for lead_id in (1, 2, 3, 4, 5)]
+        evaluations = {4: LeadEvaluation(score=90, reason='Stored'), 2: LeadEvaluation(score=10, reason='Old')}
+        shortlist = self.pipeline.shortlist(leads, evaluations, {2: (60.0, 'Fresh'), 5: (30.0, 'New')})
+        self.assertEqual(shortlist, [{'id': 4, 'score': 90, 'reason': 'Stored'},
+                                     {'id': 2, 'score': 60.0, 'reason': 'Fresh'},
+                                     {'id': 5, 'score': 30.0, 'reason': 'New'}])
+
+        # Unscored leads follow in their pre-rank order
+        self.assertEqual(self.pipeline.shortlist(leads, {}, {3: (5.0, '')})[1:], [{'id': 1}, {'id': 2}])
+
+    def run_pipeline(self):
+        service = mock.Mock()
+        service.generate_response.side_effect = lambda prompt, **kwargs: fake_reply(prompt)
+        self.pipeline.run(service, self.user, self.lead_data())
+        # The last call writes the analysis; the others score chunks of leads
+        return [call.args[0] for call in service.generate_response.call_args_list[:-1]]
+
+    def test_unchanged_leads_reuse_their_evaluation(self):
+        self.assertEqual(len(self.run_pipeline()), 3)
+        self.assertEqual(LeadEvaluation.objects.count(), 5)
+
+        self.assertEqual(self.run_pipeline(), [])
+
+        changed = self.leads[2]
+        CustomerLead.objects.filter(id=changed.id).update(notes='Wants a callback on Monday')
+        map_prompts = self.run_pipeline()
+        self.assertEqual(len(map_prompts), 1)
+        self.assertIn(f'"id": {changed.id},', map_prompts[0][1]['content'])
+        self.assertEqual(LeadEvaluation.objects.get(lead=changed).fingerprint,
+                         lead_fingerprint(next(lead for lead in self.lead_data() if lead['id'] == changed.id)))
+
+
+class LearningCatalogTests(TestCase):
+    CONTENT = 'Term cover basics.\n\nExplain the sum assured first.'
+
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='secret')
+        self.catalog = LearningCatalog(version=2)
+
+    def generate(self, **kwargs):
+        result = dict({'status': 'success', 'response': self.CONTENT}, **kwargs)
+        return mock.patch.object(LearningService, 'generate_learning_content', return_value=result)
+
+    def test_miss_generates_once_and_later_requests_hit(self):
+        with self.generate() as generate:
+            entry = self.catalog.get_or_generate('insurance', 'beginner', self.user)
+            self.assertEqual(self.catalog.get_or_generate('insurance', 'beginner', self.user), entry)
+        generate.assert_called_once_with(self.user, 'insurance', 'beginner')
+        self.assertEqual((entry.version, entry.topic, entry.summary),
+                         (2, 'Selling Insurance Products', 'Term cover basics.'))
+
+    def test_entry_stored_by_a_concurrent_worker_wins(self):
+        def other_worker_finishes_first(user, product_type, difficulty_level):
+            LearningCatalogEntry.objects.create(product_type=product_type, difficulty_level=difficulty_level,
+                                                version=2, topic='Stored first', content='Theirs', summary='Theirs')
+            return {'status': 'success', 'response': self.CONTENT}
+
+        with mock.patch.object(LearningService, 'generate_learning_content', side_effect=other_worker_finishes_first):
+            entry = self.catalog.get_or_generate('insurance', 'beginner', self.user)
+        self.assertEqual(entry.topic, 'Stored first')
+        self.assertEqual(LearningCatalogEntry.objects.count(), 1)
+        # The IntegrityError was contained in a savepoint, so the request's transaction is still usable
+        self.assertEqual(self.catalog.assign(self.user, entry).catalog_entry, entry)
+
+    def test_failed_generation_is_not_stored(self):
+        from .ai_services import FALLBACK_RESPONSE
+
+        for result in ({'status': 'error', 'message': 'Rate limited'}, {'response': FALLBACK_RESPONSE}):
+            with self.subTest(result=result), self.generate(**result):
+                with self.assertRaises(CatalogUnavailable):
+                    self.catalog.get_or_generate('insurance', 'beginner', self.user)
+        self.assertFalse(LearningCatalogEntry.objects.exists())
@@ -0,0 +1,122 @@
+import os
+import json
+import logging
+
+import openai
+from openai.openai_object import OpenAIObject
+from django.conf import settings
+
+from .ai_cache import make_cache_key
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Characters per chunk when a recorded response is replayed as a stream
+REPLAY_CHUNK_SIZE = 16
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when no recording exists for a request"""
+    pass
+
+
+class Cassette:
+    """
+    Record and replay ChatCompletion responses
+
+    In ``record`` mode every real response is saved as a JSON file named by
+    the hash of its request; in ``replay`` mode responses are served from
+    those files and no API call is made. Requests are matched on model,
+    messages, max_tokens and whether the response is streamed.
+    """
+
+    def __init__(self, mode=None, path=None):
+        self.mode = mode
+        self.path = path
+
+    def _file(self, kwargs):
+        key = make_cache_key(kwargs['model'], kwargs['messages'], kwargs.get('max_tokens'))
+        suffix = '-stream' if kwargs.get('stream') else ''
+        return os.path.join(self.path, f"{key}{suffix}.json")
+
+    def load(self, kwargs):
+        filename = self._file(kwargs)
+        try:
+            with open(filename, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise CassetteMiss(f"No recorded response in {filename}")
+
+    def save(self, kwargs, recording):
+        os.makedirs(self.path, exist_ok=True)
+        recording['request'] = {'model': kwargs['model'], 'messages': kwargs['messages'],
+                                'max_tokens': kwargs.get('max_tokens')}
+        with open(self._file(kwargs), 'w', encoding='utf-8') as f:
+            json.dump(recording, f, indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def to_recording(response):
+        return {
+            'model': response.model,
+            'content': response.choices[0].message.content,
+            'usage': dict(response.usage),
+        }
+
+    @staticmethod
+    def to_response(recording):
+        return OpenAIObject.construct_from({
+            'model': recording['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': recording['content']},
+                         'finish_reason': 'stop'}],
+            'usage': recording['usage'],
+        })
+
+    @staticmethod
+    async def replay_stream(recording):
+        content = recording['content']
+        for start in range(0, len(content), REPLAY_CHUNK_SIZE):
+            yield OpenAIObject.construct_from({
+                'choices': [{'index': 0, 'delta': {'content': content[start:start + REPLAY_CHUNK_SIZE]}}]
+            })
+
+    async def record_stream(self, kwargs, response):
+        parts = []
+        async for chunk in response:
+            delta = chunk.choices[0].delta.get('content')
+            if delta:
+                parts.append(delta)
+            yield chunk
+        self.save(kwargs, {'model': kwargs['model'], 'content': ''.join(parts), 'usage': {}})
+
+
+def chat_completion(**kwargs):
+    """openai.ChatCompletion.create, through the cassette if one is configured"""
+    if cassette.mode == 'replay':
+        return Cassette.to_response(cassette.load(kwargs))
+
+    response = openai.ChatCompletion.create(**kwargs)
+    if cassette.mode == 'record':
+        cassette.save(kwargs, Cassette.to_recording(response))
+    return response
+
+
+async def achat_completion(**kwargs):
+    """openai.ChatCompletion.acreate, through the cassette if one is configured"""
+    if cassette.mode == 'replay':
+        recording = cassette.load(kwargs)
+        if kwargs.get('stream'):
+            return Cassette.replay_stream(recording)
+        return Cassette.to_response(recording)
+
+    response = await openai.ChatCompletion.acreate(**kwargs)
+    if cassette.mode == 'record':
+        if kwargs.get('stream'):
+            return cassette.record_stream(kwargs, response)
+        cassette.save(kwargs, Cassette.to_recording(response))
+    return response
+
+
+cassette = Cassette(
+    mode=getattr(settings, 'AI_CASSETTE_MODE', None),
+    path=getattr(settings, 'AI_CASSETTE_PATH', None)
+)
@@ -6,7 +6,9 @@ app_name = 'ai_assistant'
 urlpatterns = [
     # Sales Co-Pilot
     path('copilot/', views.copilot_view, name='copilot'),
+    path('copilot/session/', views.start_copilot_session_view, name='start_copilot_session'),
     path('generate-suggestion/', views.generate_suggestion_view, name='generate_suggestion'),
+    path('stream-suggestion/', views.stream_suggestion_view, name='stream_suggestion'),
     path('save-conversation/', views.save_conversation_view, name='save_conversation'),
     path('conversation/<int:conversation_id>/', views.conversation_detail_view, name='conversation_detail'),
 
@@ -24,8 +26,12 @@ urlpatterns = [
     path('add-lead/', views.add_lead_view, name='add_lead'),
     path('update-lead-status/<int:lead_id>/', views.update_lead_status_view, name='update_lead_status'),
     path('generate-lead-message/<int:lead_id>/', views.generate_lead_message_view, name='generate_lead_message'),
+    path('generate-lead-messages/', views.generate_lead_messages_view, name='generate_lead_messages'),
     path('analyze-leads/', views.analyze_leads_view, name='analyze_leads'),
 
+    # Background jobs
+    path('jobs/<int:job_id>/', views.job_status_view, name='job_status'),
+
     # Insights
     path('check-insights/', views.check_insights_view, name='check_insights'),
     path('insights/', views.insights_view, name='insights'),
@@ -1,14 +1,23 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse, Http404
+from django.urls import reverse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 import json
-import random
 
-from .models import Conversation, Message, AIResponse, LearningContent, SalesTemplate
-from .ai_services import SalesCopilotService, LearningService, LeadService, PerformanceInsightService
+from .models import Conversation, Message, AIResponse, AIJob, LearningContent, SalesTemplate
+from .ai_services import SalesCopilotService, LeadService, PerformanceInsightService, FALLBACK_RESPONSE
+from .copilot_sessions import copilot_sessions
+from .resilience import get_request_deadline, restore_request_deadline, clear_request_deadline
+from .jobs import enqueue, job_status, schedule_outreach_prefetch, schedule_quiz_replenish
+from .outreach import outreach_lead_data
+from .learning_catalog import learning_catalog
+from .question_bank import question_bank
+from dashboard.dashboard_cache import dashboard_cache
 from dashboard.models import SalesPerformance, AIInsight, CustomerLead
 from accounts.models import Skill, LearningProgress
 
@@ -50,35 +59,136 @@ def copilot_view(request):
     return render(request, 'ai_assistant/copilot.html', context)
 
 
+@login_required
+def start_copilot_session_view(request):
+    """API view for starting a server-held co-pilot session"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            customer_type = data.get('customer_type')
+            product_type = data.get('product_type')
+
+            conversation = copilot_sessions.create(request.user, customer_type, product_type, data.get('title'))
+
+            return JsonResponse({'session_id': conversation.id})
+
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+
+async def _load_copilot_messages(user, data):
+    """
+    Resolve the prompt for a suggestion request
+
+    Session requests carry only the new utterance, which is stored before the
+    full history is rebuilt server-side. Requests without a session id send
+    the whole conversation as before.
+
+    Returns:
+        tuple: (conversation or None, messages)
+    """
+    session_id = data.get('session_id')
+    if not session_id:
+        return None, data.get('messages', [])
+
+    conversation = await copilot_sessions.aget(user, session_id)
+    if conversation is None:
+        raise Http404('Co-pilot session not found')
+
+    await copilot_sessions.aappend(conversation, 'user', data.get('message', ''))
+    return conversation, await copilot_sessions.abuild_messages(conversation)
+
+
 @login_required
 @csrf_exempt
-def generate_suggestion_view(request):
+async def generate_suggestion_view(request):
     """API view for generating sales suggestions"""
     if request.method == 'POST':
         try:
+            user = await request.auser()
             data = json.loads(request.body)
-            messages = data.get('messages', [])
+            conversation, messages = await _load_copilot_messages(user, data)
+            conversation_id = conversation.id if conversation else None
 
             # Generate suggestion
-            result = SalesCopilotService.generate_sales_suggestion(request.user, messages)
+            result = await SalesCopilotService.agenerate_sales_suggestion(user, messages, conversation_id)
 
             if result['status'] == 'success':
+                # The fallback apology is shown to the agent but is not part of the conversation
+                if conversation and result['response'] != FALLBACK_RESPONSE:
+                    await copilot_sessions.aappend(conversation, 'assistant', result['response'])
                 return JsonResponse({'response': result['response']})
             else:
                 return JsonResponse({'error': result.get('message', 'An error occurred')}, status=500)
 
+        except Http404 as e:
+            return JsonResponse({'error': str(e)}, status=404)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
+@login_required
+@csrf_exempt
+async def stream_suggestion_view(request):
+    """API view for streaming sales suggestions as Server-Sent Events"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        user = await request.auser()
+        data = json.loads(request.body)
+        conversation, messages = await _load_copilot_messages(user, data)
+        conversation_id = conversation.id if conversation else None
+    except Http404 as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # AIDeadlineMiddleware clears the deadline as the response is returned, before the stream runs
+    deadline = get_request_deadline()
+
+    async def event_stream():
+        restore_request_deadline(deadline)
+        try:
+            chunks = []
+            async for token in SalesCopilotService.astream_sales_suggestion(user, messages, conversation_id):
+                chunks.append(token)
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            reply = ''.join(chunks).strip()
+            if conversation and reply != FALLBACK_RESPONSE:
+                await copilot_sessions.aappend(conversation, 'assistant', reply)
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            clear_request_deadline()
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+
 @login_required
 def save_conversation_view(request):
     """View for saving a conversation"""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
+
+            # Session conversations are already stored turn by turn
+            session_id = data.get('session_id')
+            if session_id:
+                conversation = get_object_or_404(Conversation, id=session_id, user=request.user)
+                if data.get('title'):
+                    conversation.title = data['title']
+                    conversation.save(update_fields=['title', 'last_updated'])
+                return JsonResponse({'success': True, 'conversation_id': conversation.id})
+
             customer_type = data.get('customer_type')
             product_type = data.get('product_type')
             messages = data.get('messages', [])
@@ -133,12 +243,20 @@ def learning_view(request):
     learning_progress = LearningProgress.objects.filter(user=request.user).order_by('-last_activity')
 
     # Get learning content
-    learning_content = LearningContent.objects.filter(user=request.user).order_by('-created_at')[:10]
+    learning_content = LearningContent.objects.filter(user=request.user).select_related(
+        'catalog_entry').order_by('-created_at')[:10]
+
+    # Content still being generated in the background
+    pending_job = None
+    if request.GET.get('job'):
+        pending_job = AIJob.objects.filter(id=request.GET['job'], user=request.user,
+                                           status__in=['queued', 'running']).first()
 
     context = {
         'skills': skills,
         'learning_progress': learning_progress,
         'learning_content': learning_content,
+        'pending_job': pending_job,
         'product_types': [
             ('insurance', 'Insurance'),
             ('credit_card', 'Credit Card'),
@@ -169,37 +287,20 @@ def generate_learning_content_view(request):
         except Skill.DoesNotExist:
             skill_level = 'beginner'
 
-        # Generate content
-        result = LearningService.generate_learning_content(request.user, product_type, skill_level)
-
-        if result['status'] == 'success':
-            # Save content
-            content = result['response']
-            summary = content.split('\n\n')[0] if '\n\n' in content else content[:100] + '...'
-
-            learning_content = LearningContent.objects.create(
-                user=request.user,
-                product_type=product_type,
-                topic=f"Selling {product_type.replace('_', ' ').title()} Products",
-                content=content,
-                summary=summary,
-                difficulty_level=skill_level
-            )
-
-            # Update learning progress
-            learning_progress, created = LearningProgress.objects.get_or_create(
-                user=request.user,
-                module_name=f"{product_type.replace('_', ' ').title()} Basics",
-                defaults={
-                    'completion_percentage': 0,
-                    'completed': False
-                }
-            )
-
+        # Catalog modules are shared, so most partners get theirs immediately
+        entry = learning_catalog.get(product_type, skill_level)
+        if entry is not None:
+            learning_content = learning_catalog.assign(request.user, entry)
             return redirect('ai_assistant:learning_content_detail', content_id=learning_content.id)
-        else:
-            messages.error(request, 'Failed to generate learning content. Please try again.')
-            return redirect('ai_assistant:learning')
+
+        # Generate content in the background; the learning page picks up the result
+        job = enqueue(
+            'learning_content',
+            {'product_type': product_type, 'skill_level': skill_level},
+            user=request.user,
+            dedup_key=f"learning_content:{request.user.id}:{product_type}:{skill_level}"
+        )
+        return redirect(f"{reverse('ai_assistant:learning')}?job={job.id}")
 
     return redirect('ai_assistant:learning')
 
@@ -207,7 +308,8 @@ def generate_learning_content_view(request):
 @login_required
 def learning_content_detail_view(request, content_id):
     """View for displaying learning content"""
-    content = get_object_or_404(LearningContent, id=content_id, user=request.user)
+    content = get_object_or_404(LearningContent.objects.select_related('catalog_entry'), id=content_id,
+                                user=request.user)
 
     # Mark as read
     if not content.is_read:
@@ -257,7 +359,12 @@ def leads_view(request):
         ]
     }
 
-    return render(request, 'ai_assistant/leads.html', context)
+    response = render(request, 'ai_assistant/leads.html', context)
+
+    # Agents usually go on to message their top leads; have those drafts ready
+    schedule_outreach_prefetch(request.user)
+
+    return response
 
 
 @login_required
@@ -280,8 +387,7 @@ def add_lead_view(request):
             interest=interest,
             lead_source=lead_source,
             notes=notes,
-            status='new',
-            priority_score=random.uniform(0.5, 0.8)  # In a real app, use AI to determine score
+            status='new'
         )
 
         messages.success(request, f'Lead "{name}" has been added successfully.')
@@ -330,23 +436,47 @@ def update_lead_status_view(request, lead_id):
 
 
 @login_required
-def generate_lead_message_view(request, lead_id):
+async def generate_lead_message_view(request, lead_id):
     """View for generating a message for a lead"""
-    lead = get_object_or_404(CustomerLead, id=lead_id, user=request.user)
-
-    # Prepare lead data
-    lead_data = {
-        'name': lead.name,
-        'interest': lead.interest,
-        'status': lead.status,
-        'notes': lead.notes
-    }
+    user = await request.auser()
+    lead = await aget_object_or_404(CustomerLead, id=lead_id, user=user)
+
+    # Generate message, reusing one from a bulk run if the lead hasn't changed since
+    result = await LeadService.agenerate_outreach_messages(user, [outreach_lead_data(lead)])
+
+    if result['status'] == 'success':
+        return JsonResponse({'message': result['messages'][lead.id]})
+    else:
+        return JsonResponse({'error': result.get('message', 'An error occurred')}, status=500)
+
+
+@login_required
+async def generate_lead_messages_view(request):
+    """API view for generating messages for several selected leads"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        lead_ids = [int(lead_id) for lead_id in data.get('lead_ids', [])]
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+        return JsonResponse({'error': 'lead_ids must be a list of lead ids'}, status=400)
+
+    max_leads = getattr(settings, 'AI_OUTREACH_MAX_LEADS', 50)
+    if not lead_ids:
+        return JsonResponse({'error': 'No leads selected'}, status=400)
+    if len(lead_ids) > max_leads:
+        return JsonResponse({'error': f'Select at most {max_leads} leads'}, status=400)
+
+    user = await request.auser()
+    leads = [outreach_lead_data(lead) async for lead in CustomerLead.objects.filter(user=user, id__in=lead_ids)]
+    if not leads:
+        raise Http404('No matching leads')
 
-    # Generate message
-    result = LeadService.generate_outreach_message(request.user, lead_data, lead.interest)
+    result = await LeadService.agenerate_outreach_messages(user, leads)
 
     if result['status'] == 'success':
-        return JsonResponse({'message': result['response']})
+        return JsonResponse({'messages': result['messages'], 'failed': result['failed']})
     else:
         return JsonResponse({'error': result.get('message', 'An error occurred')}, status=500)
 
@@ -364,39 +494,27 @@ def analyze_leads_view(request):
         messages.warning(request, 'You need at least 3 active leads for analysis.')
         return redirect('ai_assistant:leads')
 
-    # Prepare lead data
-    lead_data = []
-    for lead in leads:
-        lead_data.append({
-            'id': lead.id,
-            'name': lead.name,
-            'interest': lead.interest,
-            'status': lead.status,
-            'lead_source': lead.lead_source,
-            'notes': lead.notes,
-            'created_at': lead.created_at.strftime('%Y-%m-%d')
-        })
+    # Analyze leads in the background; the page fills in when the job finishes
+    job = enqueue(
+        'lead_analysis',
+        {'lead_ids': list(leads.values_list('id', flat=True))},
+        user=request.user,
+        dedup_key=f"lead_analysis:{request.user.id}"
+    )
 
-    # Analyze leads
-    result = LeadService.analyze_leads(request.user, lead_data)
+    context = {
+        'job': job,
+        'leads': leads
+    }
 
-    if result['status'] == 'success':
-        # Create insight
-        AIInsight.objects.create(
-            user=request.user,
-            insight_text=result['response'],
-            category='lead'
-        )
+    return render(request, 'ai_assistant/lead_analysis.html', context)
 
-        context = {
-            'analysis': result['response'],
-            'leads': leads
-        }
 
-        return render(request, 'ai_assistant/lead_analysis.html', context)
-    else:
-        messages.error(request, 'Failed to analyze leads. Please try again.')
-        return redirect('ai_assistant:leads')
+@login_required
+def job_status_view(request, job_id):
+    """API view for polling the status of a background AI job"""
+    job = get_object_or_404(AIJob, id=job_id, user=request.user)
+    return JsonResponse(job_status(job))
 
 
 @login_required
@@ -424,8 +542,9 @@ def insights_view(request):
     """View for displaying all insights"""
     insights = AIInsight.objects.filter(user=request.user).order_by('-created_at')
 
-    # Mark all as read
+    # Mark all as read; update() sends no signals, so drop the cached insights card here
     insights.update(is_read=True)
+    dashboard_cache.invalidate_for('AIInsight', [request.user.id])
 
     context = {
         'insights': insights,
@@ -479,13 +598,14 @@ def mark_content_complete_view(request, content_id):
 
 
 @login_required
-def get_quiz_questions_view(request, content_id):
+async def get_quiz_questions_view(request, content_id):
     """API view for fetching quiz questions"""
-    content = get_object_or_404(LearningContent, id=content_id, user=request.user)
+    user = await request.auser()
+    content = await aget_object_or_404(LearningContent, id=content_id, user=user)
 
     # Get user's skill level
     try:
-        skill = Skill.objects.get(user=request.user, product_type=content.product_type)
+        skill = await Skill.objects.aget(user=user, product_type=content.product_type)
         skill_level = 'beginner'
         if skill.proficiency_level > 3:
             skill_level = 'intermediate'
@@ -494,11 +614,16 @@ def get_quiz_questions_view(request, content_id):
     except Skill.DoesNotExist:
         skill_level = 'beginner'
 
-    # Generate questions
-    result = LearningService.generate_quiz_questions(request.user, content.product_type, skill_level)
+    # Draw from the question bank; only an empty pool waits on the model
+    questions, low = await sync_to_async(question_bank.draw)(user, content.product_type, skill_level)
+    if not questions:
+        await question_bank.afill(content.product_type, skill_level, user)
+        questions, low = await sync_to_async(question_bank.draw)(user, content.product_type, skill_level)
+    if low:
+        await sync_to_async(schedule_quiz_replenish)(content.product_type, skill_level)
 
-    if result['status'] == 'success':
-        return JsonResponse({'status': 'success', 'questions': result['questions']})
+    if questions:
+        return JsonResponse({'status': 'success', 'questions': questions})
     else:
         return JsonResponse({'status': 'error', 'message': 'Failed to generate questions'})
 
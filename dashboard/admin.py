@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.db.models import Sum, Count
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
+from .goal_progress import with_progress, goal_progress
 from .models import SalesPerformance, PerformanceGoal, AIInsight, CustomerLead
 
 
@@ -39,7 +40,8 @@ class SalesPerformanceAdmin(admin.ModelAdmin):
 
 @admin.register(PerformanceGoal)
 class PerformanceGoalAdmin(admin.ModelAdmin):
-    list_display = ('user', 'month_year', 'target_amount', 'target_customers', 'achievement_percentage_display')
+    list_display = ('user', 'month_year', 'target_amount', 'target_customers', 'achievement_percentage_display',
+                    'customers_achievement_display', 'product_achievement_display')
     list_filter = ('month', 'year')
     search_fields = ('user__username',)
 
@@ -48,17 +50,40 @@ class PerformanceGoalAdmin(admin.ModelAdmin):
 
     month_year.short_description = 'Month/Year'
 
-    def achievement_percentage_display(self, obj):
-        percentage = obj.get_achieved_percentage()
+    def get_queryset(self, request):
+        # Achievement for every goal on the page comes from one aggregate query
+        return with_progress(super().get_queryset(request))
+
+    @staticmethod
+    def _percentage_html(percentage):
         if percentage < 33:
-            return '<span style="color: red;">{:.1f}%</span>'.format(percentage)
+            color = 'red'
         elif percentage < 66:
-            return '<span style="color: orange;">{:.1f}%</span>'.format(percentage)
+            color = 'orange'
         else:
-            return '<span style="color: green;">{:.1f}%</span>'.format(percentage)
+            color = 'green'
+        return format_html('<span style="color: {};">{}%</span>', color, f'{percentage:.1f}')
+
+    def achievement_percentage_display(self, obj):
+        return self._percentage_html(goal_progress(obj)['amount']['percentage'])
 
     achievement_percentage_display.short_description = 'Achievement'
-    achievement_percentage_display.allow_tags = True  # This tells Django the field contains HTML
+    achievement_percentage_display.admin_order_field = 'achieved_amount'
+
+    def customers_achievement_display(self, obj):
+        return self._percentage_html(goal_progress(obj)['customers']['percentage'])
+
+    customers_achievement_display.short_description = 'Customers'
+
+    def product_achievement_display(self, obj):
+        products = goal_progress(obj)['products']
+        if not products:
+            return '-'
+        return format_html_join(', ', '{}: {}', (
+            (product['label'], self._percentage_html(product['percentage'])) for product in products
+        ))
+
+    product_achievement_display.short_description = 'Product Targets'
 
 
 @admin.register(AIInsight)
@@ -82,8 +107,10 @@ class CustomerLeadAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'phone', 'email', 'interest', 'status', 'priority_score', 'created_at')
     list_filter = ('status', 'interest', 'lead_source')
     search_fields = ('name', 'phone', 'email', 'user__username', 'notes')
-    list_editable = ('status', 'priority_score')
+    list_editable = ('status',)
     date_hierarchy = 'created_at'
+    # Computed by LeadScorer whenever the lead is saved
+    readonly_fields = ('priority_score',)
 
     fieldsets = (
         ('Basic Information', {
@@ -0,0 +1,104 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncQuarter, TruncYear
+
+# Bucket sizes from finest to coarsest: (name, truncation, chart title, label format)
+GRANULARITIES = (
+    ('day', TruncDay, 'Daily', '%d %b'),
+    ('week', TruncWeek, 'Weekly', 'Week of %d %b %Y'),
+    ('month', TruncMonth, 'Monthly', '%b %Y'),
+    ('quarter', TruncQuarter, 'Quarterly', None),
+    ('year', TruncYear, 'Yearly', '%Y'),
+)
+
+
+def bucket_start(day, granularity):
+    """First day of the bucket a date falls in, matching the database truncation"""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        # TruncWeek starts weeks on Monday
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return date(day.year, 1, 1)
+
+
+def next_bucket(start, granularity):
+    """First day of the bucket after the one starting at ``start``"""
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    month = start.month - 1 + months
+    return date(start.year + month // 12, month % 12 + 1, 1)
+
+
+def bucket_label(start, granularity):
+    if granularity == 'quarter':
+        return f"Q{(start.month - 1) // 3 + 1} {start.year}"
+    label_format = next(fmt for name, _, _, fmt in GRANULARITIES if name == granularity)
+    return start.strftime(label_format)
+
+
+def bucket_count(start_date, end_date, granularity):
+    """Number of buckets a range spans"""
+    first, last = bucket_start(start_date, granularity), bucket_start(end_date, granularity)
+    if granularity == 'day':
+        return (last - first).days + 1
+    if granularity == 'week':
+        return (last - first).days // 7 + 1
+    months = (last.year - first.year) * 12 + last.month - first.month
+    return months // {'month': 1, 'quarter': 3, 'year': 12}[granularity] + 1
+
+
+def choose_granularity(start_date, end_date, max_points=None):
+    """Finest bucket size that keeps the series within ``max_points`` points"""
+    max_points = max_points or getattr(settings, 'ANALYTICS_MAX_POINTS', 62)
+    for name, _, _, _ in GRANULARITIES:
+        if bucket_count(start_date, end_date, name) <= max_points:
+            return name
+    return GRANULARITIES[-1][0]
+
+
+def sales_series(rollup, start_date, end_date, granularity=None, max_points=None):
+    """
+    Sales totals per time bucket, from one grouped query over the daily rollup
+
+    Args:
+        rollup: SalesDailyRollup queryset, already filtered to the partner and range
+        start_date (date): First day of the range
+        end_date (date): Last day of the range
+        granularity (str): day, week, month, quarter or year; None picks it from the range length
+        max_points (int): Most buckets returned; ranges too long even for yearly buckets keep the latest ones
+
+    Returns:
+        tuple: (granularity, chart title, list of {'date', 'start', 'total', 'count'} with empty buckets filled)
+    """
+    max_points = max_points or getattr(settings, 'ANALYTICS_MAX_POINTS', 62)
+    granularity = granularity or choose_granularity(start_date, end_date, max_points)
+    _, trunc, title, _ = next(entry for entry in GRANULARITIES if entry[0] == granularity)
+
+    totals = {
+        item['bucket']: item
+        for item in rollup.annotate(bucket=trunc('date')).values('bucket')
+        .annotate(total=Sum('amount'), count=Sum('count')).order_by()
+    }
+
+    series = []
+    start = bucket_start(start_date, granularity)
+    while start <= end_date:
+        bucket = totals.get(start, {})
+        series.append({
+            'date': bucket_label(start, granularity),
+            'start': start,
+            'total': float(bucket.get('total') or 0),
+            'count': bucket.get('count') or 0
+        })
+        start = next_bucket(start, granularity)
+    return granularity, title, series[-max_points:]
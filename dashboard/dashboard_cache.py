@@ -0,0 +1,196 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .goal_progress import with_progress, goal_progress
+from .models import SalesPerformance, SalesDailyRollup, PerformanceGoal, AIInsight, CustomerLead
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('new', 'contacted', 'interested')
+
+
+def build_sales(user, today):
+    """Month totals, product distribution and the last seven days"""
+    month_rollup = SalesDailyRollup.objects.filter(user=user, date__month=today.month, date__year=today.year)
+
+    month_totals = month_rollup.aggregate(total=Sum('amount'), commission=Sum('commission'), count=Sum('count'))
+
+    product_distribution = list(month_rollup.values('product_category').annotate(
+        count=Sum('count'),
+        total=Sum('amount')
+    ).order_by('-total'))
+
+    week_totals = dict(SalesDailyRollup.objects.filter(
+        user=user,
+        date__gte=today - timedelta(days=6),
+        date__lte=today
+    ).values_list('date').annotate(total=Sum('amount')).order_by())
+    week_days = [today - timedelta(days=i) for i in range(6, -1, -1)]
+
+    return {
+        'month_total': month_totals['total'] or 0,
+        'month_commission': month_totals['commission'] or 0,
+        'month_count': month_totals['count'] or 0,
+        'product_distribution': product_distribution,
+        'chart_labels': json.dumps([item['product_category'] for item in product_distribution]),
+        'chart_values': json.dumps([float(item['total']) for item in product_distribution]),
+        'week_labels': json.dumps([day.strftime('%d %b') for day in week_days]),
+        'week_values': json.dumps([float(week_totals.get(day, 0)) for day in week_days])
+    }
+
+
+def build_goal(user, today):
+    monthly_goal = with_progress(PerformanceGoal.objects.filter(user=user, month=today.month, year=today.year)).first()
+    progress = goal_progress(monthly_goal) if monthly_goal else None
+    return {
+        'monthly_goal': monthly_goal,
+        'goal_percentage': progress['amount']['percentage'] if progress else 0,
+        'goal_products': progress['products'] if progress else []
+    }
+
+
+def build_recent_sales(user, today):
+    return {'recent_sales': list(SalesPerformance.objects.filter(user=user).order_by('-date')[:5])}
+
+
+def build_insights(user, today):
+    return {'recent_insights': list(AIInsight.objects.filter(user=user).order_by('-created_at')[:3])}
+
+
+def build_leads(user, today):
+    return {'high_priority_leads': list(CustomerLead.objects.filter(
+        user=user,
+        status__in=ACTIVE_STATUSES
+    ).order_by('-priority_score')[:5])}
+
+
+def build_learning(user, today):
+    from accounts.models import LearningProgress
+    return {'learning_modules': list(LearningProgress.objects.filter(user=user).order_by('-last_activity')[:3])}
+
+
+# Dashboard cards and the function that computes each one's context entries
+FRAGMENTS = {
+    'sales': build_sales,
+    'goal': build_goal,
+    'recent_sales': build_recent_sales,
+    'insights': build_insights,
+    'leads': build_leads,
+    'learning': build_learning,
+}
+
+# Fragments computed from each model's rows
+MODEL_FRAGMENTS = {
+    'SalesPerformance': ('sales', 'goal', 'recent_sales'),
+    'SalesDailyRollup': ('sales', 'goal'),
+    'PerformanceGoal': ('goal',),
+    'AIInsight': ('insights',),
+    'CustomerLead': ('leads',),
+    'LearningProgress': ('learning',),
+}
+
+
+class DashboardCache:
+    """
+    Per-partner cache of the dashboard cards and the assembled dashboard context
+
+    Each card is a fragment cached under the partner and today's date, so
+    month and week boundaries start fresh entries. A repeat dashboard load
+    reads the assembled context, or the fragments it is made of, in one
+    cache round trip and no queries. The timeout only bounds how long
+    unused entries are kept: signals on the models a fragment is computed
+    from delete exactly the affected fragments, and the context, whenever
+    a row changes. Those signals fire in whichever process saved the row,
+    so the cache has to be shared by all of them (see CACHES in settings).
+    """
+
+    CONTEXT = 'context'
+
+    def __init__(self, timeout=60 * 60):
+        self.timeout = timeout
+
+    @staticmethod
+    def key(user_id, day, fragment):
+        return f"dashboard:{user_id}:{day.isoformat()}:{fragment}"
+
+    def fragments(self, user, today, names, with_context=False):
+        """
+        Read fragments from the cache, computing and storing the missing ones
+
+        Args:
+            user (User): Partner the dashboard is for
+            today (date): Day the dashboard is shown for
+            names (iterable): Fragment names from FRAGMENTS
+            with_context (bool): Also read and store the assembled context
+
+        Returns:
+            tuple: (context dictionary, set of the fragment names that were recomputed)
+        """
+        keys = {self.key(user.id, today, name): name for name in names}
+        context_key = self.key(user.id, today, self.CONTEXT)
+        try:
+            found = cache.get_many(list(keys) + ([context_key] if with_context else []))
+        except Exception as e:
+            logger.error(f"Error reading dashboard cache: {str(e)}")
+            found = {}
+
+        if context_key in found:
+            return found[context_key], set()
+
+        context = {}
+        missing = {}
+        computed = set()
+        for key, name in keys.items():
+            if key in found:
+                context.update(found[key])
+            else:
+                missing[key] = FRAGMENTS[name](user, today)
+                context.update(missing[key])
+                computed.add(name)
+
+        if with_context:
+            missing[context_key] = context
+        try:
+            cache.set_many(missing, self.timeout)
+        except Exception as e:
+            logger.error(f"Error writing dashboard cache: {str(e)}")
+        return context, computed
+
+    def context(self, user, today):
+        """Full dashboard context; see fragments"""
+        return self.fragments(user, today, FRAGMENTS, with_context=True)
+
+    def _delete(self, user_ids, names, day):
+        try:
+            cache.delete_many([self.key(user_id, day, name)
+                               for user_id in user_ids for name in list(names) + [self.CONTEXT]])
+        except Exception as e:
+            logger.error(f"Error invalidating dashboard cache: {str(e)}")
+
+    def invalidate(self, user_ids, names=FRAGMENTS):
+        """
+        Drop fragments, and the context, of some partners
+
+        Done straight away and again once the surrounding transaction
+        commits, so a dashboard computed from uncommitted rows meanwhile
+        is not left behind.
+        """
+        user_ids = list(user_ids)
+        names = list(names)
+        self._delete(user_ids, names, timezone.now().date())
+        transaction.on_commit(lambda: self._delete(user_ids, names, timezone.now().date()))
+
+    def invalidate_for(self, model_name, user_ids):
+        """Drop the fragments computed from a model's rows"""
+        self.invalidate(user_ids, MODEL_FRAGMENTS[model_name])
+
+
+dashboard_cache = DashboardCache(timeout=getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60 * 60))
@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from django.db.models import F, FilteredRelation, Q, Sum, Value, DecimalField, IntegerField
+from django.db.models.functions import Coalesce
+
+# Product-specific goal fields and the sales category each one tracks
+PRODUCT_TARGETS = (
+    ('insurance', 'Insurance', 'insurance_target'),
+    ('credit_card', 'Credit Card', 'credit_card_target'),
+    ('loan', 'Loan', 'loan_target'),
+    ('investment', 'Investment', 'investment_target'),
+)
+
+ZERO = Value(Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def percentage(achieved, target):
+    return float(achieved) / float(target) * 100 if target and target > 0 else 0
+
+
+def with_progress(goals):
+    """
+    Annotate goals with what was achieved in their month, in one query
+
+    Each goal is joined to its partner's daily sales rollup rows for the
+    goal's month only, and the rows are summed per goal; product totals are
+    conditional sums over the same rows.
+
+    Args:
+        goals: PerformanceGoal queryset
+
+    Returns:
+        QuerySet: The goals with achieved_amount, achieved_customers and achieved_<category> annotations
+    """
+    month_sales = FilteredRelation('user__sales_rollups', condition=Q(
+        user__sales_rollups__date__year=F('year'),
+        user__sales_rollups__date__month=F('month')
+    ))
+    products = {
+        f'achieved_{category}': Coalesce(Sum('month_sales__amount',
+                                             filter=Q(month_sales__product_category=category)), ZERO)
+        for category, _, _ in PRODUCT_TARGETS
+    }
+    return goals.annotate(month_sales=month_sales).annotate(
+        achieved_amount=Coalesce(Sum('month_sales__amount'), ZERO),
+        achieved_customers=Coalesce(Sum('month_sales__count'), Value(0, output_field=IntegerField())),
+        **products
+    )
+
+
+def goal_progress(goal):
+    """
+    Achievement of one goal annotated by with_progress
+
+    Returns:
+        dict: amount and customers progress, and a list of progress for the products that have a target
+    """
+    return {
+        'amount': {
+            'achieved': goal.achieved_amount,
+            'target': goal.target_amount,
+            'percentage': percentage(goal.achieved_amount, goal.target_amount),
+        },
+        'customers': {
+            'achieved': goal.achieved_customers,
+            'target': goal.target_customers,
+            'percentage': percentage(goal.achieved_customers, goal.target_customers),
+        },
+        'products': [
+            {
+                'category': category,
+                'label': label,
+                'achieved': getattr(goal, f'achieved_{category}'),
+                'target': getattr(goal, field),
+                'percentage': percentage(getattr(goal, f'achieved_{category}'), getattr(goal, field)),
+            }
+            for category, label, field in PRODUCT_TARGETS
+            if getattr(goal, field) and getattr(goal, field) > 0
+        ],
+    }
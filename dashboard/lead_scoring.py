@@ -0,0 +1,193 @@
+from datetime import timedelta
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .dashboard_cache import dashboard_cache
+from .models import CustomerLead, SalesPerformance
+
+ACTIVE_STATUSES = ('new', 'contacted', 'interested')
+
+# How far each status is along the funnel
+STATUS_STAGE = {'new': 0.3, 'contacted': 0.6, 'interested': 1.0}
+
+# Logistic weights for the lead features, in the order built by LeadScorer.features
+FEATURE_WEIGHTS = np.array([
+    2.0,   # funnel stage from status
+    1.0,   # recency of the lead
+    0.8,   # recently worked on (updated_at)
+    2.5,   # partner's conversion rate for the lead source
+    2.5,   # partner's conversion rate for the product interest
+    1.0,   # share of partner's recent sales in the product category
+    0.3,   # has notes
+])
+BIAS = -4.5
+
+# Beta prior for conversion rates, so a partner with few closed leads gets the global rate
+PRIOR_STRENGTH = 4.0
+DEFAULT_CONVERSION_RATE = 0.3
+
+
+class LeadScorer:
+    """
+    Vectorized priority scoring for CustomerLead
+
+    Each lead is turned into a feature vector (funnel stage, recency,
+    activity, the partner's historical conversion rates for the lead's
+    source and interest, and the partner's recent sales mix), and whole
+    batches are scored at once with a logistic model. Scores are in [0, 1];
+    converted and lost leads score 0.
+    """
+
+    PRIOR_KEY = 'lead_scoring:global_conversion_rate'
+
+    def __init__(self, recency_days=30, activity_days=14, sales_window_days=90, prior_timeout=60 * 60):
+        self.recency_days = recency_days
+        self.activity_days = activity_days
+        self.sales_window_days = sales_window_days
+        self.prior_timeout = prior_timeout
+
+    def global_conversion_rate(self, refresh=False):
+        """
+        Conversion rate over every partner's closed leads
+
+        It moves slowly and takes a pass over the whole table, so it is
+        cached for ``prior_timeout`` seconds unless ``refresh`` is set.
+        """
+        if not refresh:
+            rate = cache.get(self.PRIOR_KEY)
+            if rate is not None:
+                return rate
+
+        counts = dict(CustomerLead.objects.filter(status__in=['converted', 'lost'])
+                      .values_list('status').annotate(n=Count('id')))
+        closed = counts.get('converted', 0) + counts.get('lost', 0)
+        rate = counts.get('converted', 0) / closed if closed else DEFAULT_CONVERSION_RATE
+        cache.set(self.PRIOR_KEY, rate, self.prior_timeout)
+        return rate
+
+    def partner_stats(self, user_ids, prior=None):
+        """
+        Per-partner conversion rates by lead source and interest, and recent sales mix
+
+        Returns:
+            dict: user id -> {'source': {...}, 'interest': {...}, 'sales_mix': {...}}
+        """
+        prior = self.global_conversion_rate() if prior is None else prior
+        closed = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        for field in ('lead_source', 'interest'):
+            rows = (CustomerLead.objects.filter(user_id__in=user_ids, status__in=['converted', 'lost'])
+                    .values_list('user_id', field, 'status').annotate(n=Count('id')))
+            for user_id, value, status, n in rows:
+                counts = closed[(user_id, field)][value]
+                counts[0] += n if status == 'converted' else 0
+                counts[1] += n
+
+        since = timezone.now().date() - timedelta(days=self.sales_window_days)
+        sales = defaultdict(dict)
+        for user_id, category, n in (SalesPerformance.objects.filter(user_id__in=user_ids, date__gte=since)
+                                     .values_list('user_id', 'product_category').annotate(n=Count('id'))):
+            sales[user_id][category] = n
+
+        stats = {}
+        for user_id in user_ids:
+            def rates(field):
+                return {value: (converted + prior * PRIOR_STRENGTH) / (total + PRIOR_STRENGTH)
+                        for value, (converted, total) in closed[(user_id, field)].items()}
+
+            total_sales = sum(sales[user_id].values())
+            stats[user_id] = {
+                'prior': prior,
+                'source': rates('lead_source'),
+                'interest': rates('interest'),
+                'sales_mix': {category: n / total_sales for category, n in sales[user_id].items()},
+            }
+        return stats
+
+    def features(self, leads, stats):
+        """Build the feature matrix for a batch of leads"""
+        now = timezone.now()
+        rows = []
+        for lead in leads:
+            partner = stats[lead.user_id]
+            rows.append((
+                STATUS_STAGE.get(lead.status, 0.0),
+                (now - lead.created_at).total_seconds() / 86400,
+                (now - lead.updated_at).total_seconds() / 86400,
+                partner['source'].get(lead.lead_source, partner['prior']),
+                partner['interest'].get(lead.interest, partner['prior']),
+                partner['sales_mix'].get(lead.interest, 0.0),
+                1.0 if lead.notes else 0.0,
+            ))
+
+        x = np.array(rows, dtype=float).reshape(-1, len(FEATURE_WEIGHTS))
+        # Turn ages in days into decaying freshness values
+        x[:, 1] = np.exp(-np.maximum(x[:, 1], 0) / self.recency_days)
+        x[:, 2] = np.exp(-np.maximum(x[:, 2], 0) / self.activity_days)
+        return x
+
+    def score(self, leads, stats):
+        """Return an array of priority scores for the leads"""
+        if not leads:
+            return np.zeros(0)
+        x = self.features(leads, stats)
+        scores = 1.0 / (1.0 + np.exp(-(x @ FEATURE_WEIGHTS + BIAS)))
+        active = np.array([lead.status in ACTIVE_STATUSES for lead in leads])
+        return np.where(active, scores, 0.0)
+
+    def rescore(self, queryset=None, batch_size=1000, refresh_prior=False):
+        """
+        Recompute and store priority_score for the leads in ``queryset``
+
+        ``refresh_prior`` recomputes the global conversion rate instead of
+        using the cached one.
+
+        Returns:
+            int: Number of leads scored
+        """
+        queryset = (queryset if queryset is not None else CustomerLead.objects.all()).order_by('id')
+        fields = ('id', 'user_id', 'status', 'lead_source', 'interest', 'notes', 'created_at', 'updated_at',
+                  'priority_score')
+        prior = self.global_conversion_rate(refresh=refresh_prior)
+        stats = {}
+        scored = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).only(*fields)[:batch_size])
+            if not batch:
+                break
+
+            missing = {lead.user_id for lead in batch} - stats.keys()
+            if missing:
+                stats.update(self.partner_stats(missing, prior))
+
+            changed = []
+            for lead, score in zip(batch, self.score(batch, stats)):
+                score = round(float(score), 4)
+                if lead.priority_score != score:
+                    lead.priority_score = score
+                    changed.append(lead)
+            # bulk_update sends no signals, so this cannot trigger another rescore
+            CustomerLead.objects.bulk_update(changed, ['priority_score'])
+            if changed:
+                dashboard_cache.invalidate_for('CustomerLead', {lead.user_id for lead in changed})
+
+            scored += len(batch)
+            last_id = batch[-1].id
+        return scored
+
+    def rescore_user(self, user_id):
+        """Rescore all of a partner's leads, e.g. after their conversion history changed"""
+        return self.rescore(CustomerLead.objects.filter(user_id=user_id))
+
+
+lead_scorer = LeadScorer(
+    recency_days=getattr(settings, 'LEAD_SCORE_RECENCY_DAYS', 30),
+    activity_days=getattr(settings, 'LEAD_SCORE_ACTIVITY_DAYS', 14),
+    sales_window_days=getattr(settings, 'LEAD_SCORE_SALES_WINDOW_DAYS', 90),
+    prior_timeout=getattr(settings, 'LEAD_SCORE_PRIOR_TIMEOUT', 60 * 60)
+)
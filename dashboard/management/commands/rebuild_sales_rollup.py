@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+
+from dashboard.sales_rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollup from the raw sales records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the rollup of this username')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of partners rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        self.stdout.write('Rebuilding sales rollup...')
+        last_id = 0
+        partners = rows = 0
+        while True:
+            user_ids = list(users.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not user_ids:
+                break
+
+            rows += rebuild_rollup(user_ids)
+            partners += len(user_ids)
+            last_id = user_ids[-1]
+            self.stdout.write(f'  {partners} partners')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows for {partners} partners'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+
+from dashboard.lead_scoring import lead_scorer
+from dashboard.models import CustomerLead
+
+
+class Command(BaseCommand):
+    help = 'Recomputes priority scores for customer leads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rescore the leads of this username')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of leads scored per batch')
+
+    def handle(self, *args, **options):
+        leads = CustomerLead.objects.all()
+        if options['user']:
+            user = User.objects.get(username=options['user'])
+            leads = leads.filter(user=user)
+
+        self.stdout.write('Rescoring leads...')
+        scored = lead_scorer.rescore(leads, batch_size=options['batch_size'], refresh_prior=True)
+        self.stdout.write(self.style.SUCCESS(f'Rescored {scored} leads'))
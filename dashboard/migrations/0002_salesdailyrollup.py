@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_rollup(apps, schema_editor):
+    SalesPerformance = apps.get_model('dashboard', 'SalesPerformance')
+    SalesDailyRollup = apps.get_model('dashboard', 'SalesDailyRollup')
+    totals = (SalesPerformance.objects.values('user_id', 'date', 'product_category', 'customer_type')
+              .annotate(total_amount=Sum('amount'), total_commission=Sum('commission'), sale_count=Count('id'))
+              .order_by())
+    SalesDailyRollup.objects.bulk_create(
+        [SalesDailyRollup(user_id=item['user_id'], date=item['date'], product_category=item['product_category'],
+                          customer_type=item['customer_type'], amount=item['total_amount'],
+                          commission=item['total_commission'], count=item['sale_count'])
+         for item in totals],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('product_category', models.CharField(max_length=20)),
+                ('customer_type', models.CharField(max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('commission', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date', 'product_category', 'customer_type'), name='unique_sales_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
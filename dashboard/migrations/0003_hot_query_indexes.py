@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_salesdailyrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aiinsight',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='dashboard_a_user_id_9ec863_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerlead',
+            index=models.Index(fields=['user', 'status', 'priority_score'], name='dashboard_c_user_id_5c7619_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesperformance',
+            index=models.Index(fields=['user', 'date'], name='dashboard_s_user_id_c641b8_idx'),
+        ),
+    ]
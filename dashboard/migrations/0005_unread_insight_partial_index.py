@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_cache_table'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='aiinsight',
+            name='dashboard_a_user_id_9ec863_idx',
+        ),
+        migrations.AddIndex(
+            model_name='aiinsight',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at'], name='dashboard_unread_insight_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -51,6 +53,39 @@ class SalesPerformance(models.Model):
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The sale and its SalesDailyRollup update (made by the save signals) commit together
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class SalesDailyRollup(models.Model):
+    """Sales totals per partner, day, product category and customer type"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales_rollups')
+    date = models.DateField()
+    product_category = models.CharField(max_length=20)
+    customer_type = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    commission = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date} - {self.product_category} - {self.customer_type}"
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date', 'product_category', 'customer_type'],
+                                    name='unique_sales_daily_rollup')
+        ]
 
 
 class PerformanceGoal(models.Model):
@@ -79,16 +114,13 @@ class PerformanceGoal(models.Model):
 
     def get_achieved_percentage(self):
         """Calculate percentage of goal achieved"""
-        month_sales = SalesPerformance.objects.filter(
-            user=self.user,
-            date__month=self.month,
-            date__year=self.year
-        )
-
-        total_sales = sum(sale.amount for sale in month_sales)
-        if self.target_amount > 0:
-            return (total_sales / self.target_amount) * 100
-        return 0
+        from .goal_progress import with_progress, percentage
+        achieved = getattr(self, 'achieved_amount', None)
+        if achieved is None:
+            # Not loaded through goal_progress.with_progress; compute it for this goal alone
+            achieved = with_progress(PerformanceGoal.objects.filter(pk=self.pk)).values_list(
+                'achieved_amount', flat=True).first() or 0
+        return percentage(achieved, self.target_amount)
 
 
 class AIInsight(models.Model):
@@ -113,6 +145,11 @@ class AIInsight(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Only unread insights are polled for, newest first
+            models.Index(fields=['user', '-created_at'], condition=models.Q(is_read=False),
+                         name='dashboard_unread_insight_idx'),
+        ]
 
 
 class CustomerLead(models.Model):
@@ -171,4 +208,80 @@ class CustomerLead(models.Model):
         return f"{self.name} - {self.interest} - {self.status}"
 
     class Meta:
-        ordering = ['-priority_score', '-created_at']
\ No newline at end of file
+        ordering = ['-priority_score', '-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status', 'priority_score']),
+        ]
+
+
+# Keep lead priority scores current. A lead edit rescores that lead only; a sale changes the
+# partner's sales mix, which feeds all of their scores. Conversion rates that drift as leads
+# close are picked up by the next sale or the rescore_leads command.
+def _rescore_partner_leads(user_id):
+    from .lead_scoring import lead_scorer
+    transaction.on_commit(lambda: lead_scorer.rescore_user(user_id))
+
+
+@receiver(post_save, sender=CustomerLead)
+def rescore_lead_on_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    from .lead_scoring import lead_scorer
+    # Saves of the score itself, such as the rescore's own, change nothing the score is computed from
+    if raw or (update_fields and set(update_fields) <= {'priority_score'}):
+        return
+    lead_id = instance.pk
+    transaction.on_commit(lambda: lead_scorer.rescore(CustomerLead.objects.filter(pk=lead_id)))
+
+
+@receiver(post_save, sender=SalesPerformance)
+@receiver(post_delete, sender=SalesPerformance)
+def rescore_leads_on_sale_change(sender, instance, **kwargs):
+    _rescore_partner_leads(instance.user_id)
+
+
+# Keep SalesDailyRollup in step with every saved or deleted sale, in the same transaction
+@receiver(pre_save, sender=SalesPerformance)
+def remember_sale_before_change(sender, instance, raw=False, **kwargs):
+    from .sales_rollup import sale_rollup_row
+    previous = None
+    if instance.pk and not raw:
+        previous = SalesPerformance.objects.filter(pk=instance.pk).only(
+            'user_id', 'date', 'product_category', 'customer_type', 'amount', 'commission').first()
+    instance._rollup_previous = sale_rollup_row(previous) if previous else None
+
+
+@receiver(post_save, sender=SalesPerformance)
+def rollup_saved_sale(sender, instance, raw=False, **kwargs):
+    from .sales_rollup import sale_rollup_row, apply_to_rollup
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        apply_to_rollup(previous, -1)
+    apply_to_rollup(sale_rollup_row(instance), 1)
+
+
+@receiver(post_delete, sender=SalesPerformance)
+def rollup_deleted_sale(sender, instance, **kwargs):
+    from .sales_rollup import sale_rollup_row, apply_to_rollup
+    apply_to_rollup(sale_rollup_row(instance), -1)
+
+
+# Drop the cached dashboard cards computed from a changed row
+@receiver(post_save, sender=SalesPerformance)
+@receiver(post_delete, sender=SalesPerformance)
+@receiver(post_save, sender=PerformanceGoal)
+@receiver(post_delete, sender=PerformanceGoal)
+@receiver(post_save, sender=AIInsight)
+@receiver(post_delete, sender=AIInsight)
+@receiver(post_save, sender=CustomerLead)
+@receiver(post_delete, sender=CustomerLead)
+@receiver(post_save, sender='accounts.LearningProgress')
+@receiver(post_delete, sender='accounts.LearningProgress')
+def invalidate_dashboard_cache(sender, instance, **kwargs):
+    from .dashboard_cache import dashboard_cache
+    user_ids = {instance.user_id}
+    # A sale moved to another partner changes both dashboards
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        user_ids.add(previous['user_id'])
+    dashboard_cache.invalidate_for(sender.__name__, user_ids)
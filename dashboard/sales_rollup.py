@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .dashboard_cache import dashboard_cache
+from .models import SalesPerformance, SalesDailyRollup
+
+CENT = Decimal('0.01')
+
+# Columns a rollup row is keyed by
+ROLLUP_KEY = ('user_id', 'date', 'product_category', 'customer_type')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def sale_rollup_row(sale):
+    """The rollup key and totals one sale contributes, with values normalized as the database stores them"""
+    return {
+        'user_id': sale.user_id,
+        # A sale created with the default date holds a datetime until it is reloaded
+        'date': SalesPerformance._meta.get_field('date').to_python(sale.date),
+        'product_category': sale.product_category,
+        'customer_type': sale.customer_type,
+        'amount': _money(sale.amount),
+        'commission': _money(sale.commission),
+    }
+
+
+def apply_to_rollup(row, sign):
+    """Add (sign=1) or remove (sign=-1) one sale's totals in SalesDailyRollup"""
+    key = {field: row[field] for field in ROLLUP_KEY}
+    amount, commission = row['amount'] * sign, row['commission'] * sign
+
+    with transaction.atomic():
+        updated = SalesDailyRollup.objects.filter(**key).update(
+            amount=F('amount') + amount,
+            commission=F('commission') + commission,
+            count=F('count') + sign
+        )
+        if not updated and sign > 0:
+            try:
+                with transaction.atomic():
+                    SalesDailyRollup.objects.create(amount=amount, commission=commission, count=1, **key)
+            except IntegrityError:
+                # Created by a concurrent sale; add to it instead
+                SalesDailyRollup.objects.filter(**key).update(
+                    amount=F('amount') + amount, commission=F('commission') + commission, count=F('count') + 1
+                )
+        elif sign < 0:
+            SalesDailyRollup.objects.filter(count__lte=0, **key).delete()
+
+
+def rebuild_rollup(user_ids):
+    """
+    Recompute the rollup rows of some partners from their raw sales
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    totals = (SalesPerformance.objects.filter(user_id__in=user_ids)
+              .values(*ROLLUP_KEY)
+              .annotate(total_amount=Sum('amount'), total_commission=Sum('commission'), sale_count=Count('id'))
+              .order_by())
+    with transaction.atomic():
+        rows = [
+            SalesDailyRollup(
+                amount=item['total_amount'], commission=item['total_commission'], count=item['sale_count'],
+                **{field: item[field] for field in ROLLUP_KEY}
+            )
+            for item in totals
+        ]
+        SalesDailyRollup.objects.filter(user_id__in=user_ids).delete()
+        SalesDailyRollup.objects.bulk_create(rows)
+        dashboard_cache.invalidate_for('SalesDailyRollup', user_ids)
+    return len(rows)
@@ -1,3 +1,415 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ai_assistant.copilot_sessions import CopilotSessionStore
+from .analytics import choose_granularity, sales_series
+from .dashboard_cache import FRAGMENTS, dashboard_cache
+from .goal_progress import PRODUCT_TARGETS, goal_progress, with_progress
+from ai_assistant.models import Conversation, Message, LearningContent
+from .lead_scoring import lead_scorer
+from .models import SalesPerformance, SalesDailyRollup, PerformanceGoal, AIInsight, CustomerLead
+from .sales_rollup import ROLLUP_KEY, rebuild_rollup
+
+PARTNERS = 20
+ROWS_PER_PARTNER = 200
+CONVERSATIONS_PER_PARTNER = 5
+MESSAGES_PER_CONVERSATION = 40
+
+
+def index_name(model, fields):
+    """Name of the model's composite index on exactly these fields"""
+    return next(index.name for index in model._meta.indexes if list(index.fields) == fields)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are read with SQLite EXPLAIN QUERY PLAN')
+class HotQueryPlanTests(TestCase):
+    """
+    The per-partner queries behind the busiest views use their composite indexes
+
+    A dataset of many partners is created and ANALYZEd so the planner has
+    realistic statistics; each view is then requested, its queries captured
+    and run through EXPLAIN QUERY PLAN. A test fails if the expected index
+    is not chosen or a table is scanned in full.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(25)
+        today = timezone.now().date()
+        partners = [User.objects.create_user(f'partner{i}', password='secret') for i in range(PARTNERS)]
+        cls.user = partners[0]
+
+        sales, leads, insights, contents, conversations = [], [], [], [], []
+        for partner in partners:
+            for i in range(ROWS_PER_PARTNER):
+                sales.append(SalesPerformance(
+                    user=partner, date=today - timedelta(days=i), product='Product', customer_name='Customer',
+                    amount=1000, commission=100, product_category=rng.choice(['insurance', 'loan', 'credit_card'])
+                ))
+                leads.append(CustomerLead(
+                    user=partner, name='Lead', phone='9999999999', priority_score=rng.random(),
+                    status=rng.choice(['new', 'contacted', 'interested', 'converted', 'lost'])
+                ))
+                insights.append(AIInsight(user=partner, insight_text='Insight', category='performance',
+                                          is_read=i >= 5))
+                contents.append(LearningContent(
+                    user=partner, product_type=rng.choice(['insurance', 'loan', 'credit_card']), topic='Topic',
+                    difficulty_level='beginner', content='Content', summary='Summary'
+                ))
+            conversations += [Conversation(user=partner, title='Conversation')
+                              for _ in range(CONVERSATIONS_PER_PARTNER)]
+
+        # bulk_create sends no signals, so the rollup and dashboard cache receivers stay out of the way
+        SalesPerformance.objects.bulk_create(sales)
+        CustomerLead.objects.bulk_create(leads)
+        AIInsight.objects.bulk_create(insights)
+        LearningContent.objects.bulk_create(contents)
+        Conversation.objects.bulk_create(conversations)
+        Message.objects.bulk_create([
+            Message(conversation=conversation, role=rng.choice(['user', 'assistant']), content='Message')
+            for conversation in Conversation.objects.all() for _ in range(MESSAGES_PER_CONVERSATION)
+        ])
+        cls.conversation = Conversation.objects.filter(user=cls.user).first()
+        cls.content = LearningContent.objects.filter(user=cls.user).first()
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        # Dashboard cards are cached; every request here has to reach the database
+        cache.clear()
+
+    def capture(self, request):
+        """Run ``request`` and return the SELECT statements it sent"""
+        with CaptureQueriesContext(connection) as queries:
+            request()
+        return [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, statements, model, fields):
+        """Every statement reading the model's table avoids a full scan, and at least one uses the index"""
+        table = model._meta.db_table
+        index = index_name(model, fields)
+        plans = [self.plan(sql) for sql in statements if f'FROM "{table}"' in sql]
+        self.assertTrue(plans, f'No query read {table}')
+        for plan in plans:
+            self.assertNotIn(f'SCAN {table}', plan, f'Full scan of {table}: {plan}')
+        self.assertTrue(
+            any(f'INDEX {index} ' in step for plan in plans for step in plan),
+            f'{index} on {table} was not used: {plans}'
+        )
+
+    def test_dashboard_uses_sales_and_lead_indexes(self):
+        statements = self.capture(lambda: self.client.get('/'))
+        self.assertUsesIndex(statements, SalesPerformance, ['user', 'date'])
+        self.assertUsesIndex(statements, CustomerLead, ['user', 'status', 'priority_score'])
+
+    def test_leads_card_uses_lead_index(self):
+        statements = self.capture(lambda: self.client.get('/refresh-card/leads/'))
+        self.assertUsesIndex(statements, CustomerLead, ['user', 'status', 'priority_score'])
+
+    def test_leads_view_uses_lead_index(self):
+        statements = self.capture(lambda: self.client.get('/ai-assistant/leads/'))
+        self.assertUsesIndex(statements, CustomerLead, ['user', 'status', 'priority_score'])
+
+    def test_insight_poll_uses_unread_index(self):
+        statements = self.capture(lambda: self.client.get('/ai-assistant/check-insights/'))
+        # The plain is_read=False filter the view sends matches the partial index's condition
+        self.assertUsesIndex(statements, AIInsight, ['user', '-created_at'])
+        # The newest unread insight comes straight off the index, without sorting
+        for sql in statements:
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', self.plan(sql))
+
+    def test_related_learning_content_uses_product_index(self):
+        statements = self.capture(lambda: self.client.get(f'/ai-assistant/learning-content/{self.content.id}/'))
+        self.assertUsesIndex(statements, LearningContent, ['user', 'product_type', 'created_at'])
+
+    def test_copilot_history_uses_message_index(self):
+        store = CopilotSessionStore()
+        statements = self.capture(lambda: store.get_history(self.conversation))
+        self.assertUsesIndex(statements, Message, ['conversation', 'created_at'])
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', self.plan(statements[0]))
+
+
+class LeadRescoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('partner', password='secret')
+        self.leads = [CustomerLead.objects.create(user=self.user, name=f'Lead {i}', phone='9999999999',
+                                                  status='interested') for i in range(3)]
+
+    def test_lead_edit_rescores_that_lead_only(self):
+        lead = self.leads[0]
+        lead.notes = 'Asked for a call back'
+        with mock.patch.object(lead_scorer, 'rescore', wraps=lead_scorer.rescore) as rescore:
+            with self.captureOnCommitCallbacks(execute=True):
+                lead.save()
+        rescore.assert_called_once()
+        self.assertEqual(list(rescore.call_args.args[0].values_list('id', flat=True)), [lead.id])
+        lead.refresh_from_db()
+        self.assertGreater(lead.priority_score, 0)
+
+    def test_saving_only_the_score_does_not_rescore(self):
+        lead = self.leads[0]
+        lead.priority_score = 0.5
+        with mock.patch.object(lead_scorer, 'rescore') as rescore:
+            with self.captureOnCommitCallbacks(execute=True):
+                lead.save(update_fields=['priority_score'])
+        rescore.assert_not_called()
+        lead.refresh_from_db()
+        self.assertEqual(lead.priority_score, 0.5)
+
+    def test_global_conversion_rate_is_cached_until_refreshed(self):
+        self.assertEqual(lead_scorer.global_conversion_rate(refresh=True), 0.3)
+        CustomerLead.objects.filter(id=self.leads[0].id).update(status='converted')
+        self.assertEqual(lead_scorer.global_conversion_rate(), 0.3)
+        self.assertEqual(lead_scorer.global_conversion_rate(refresh=True), 1.0)
+
+
+class DashboardCacheInvalidationTests(TestCase):
+    """Writes that send no signals still drop the affected partner's cached cards"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('partner', password='secret')
+        self.other = User.objects.create_user('other', password='secret')
+        for user in (self.user, self.other):
+            AIInsight.objects.create(user=user, insight_text='Follow up with warm leads')
+            CustomerLead.objects.create(user=user, name='Lead', phone='9999999999', status='interested')
+        self.today = timezone.now().date()
+
+    def warm(self):
+        for user in (self.user, self.other):
+            dashboard_cache.context(user, self.today)
+
+    def cached(self, user, fragment):
+        return cache.get(dashboard_cache.key(user.id, self.today, fragment)) is not None
+
+    def assertInvalidated(self, fragment):
+        for name in list(FRAGMENTS) + [dashboard_cache.CONTEXT]:
+            with self.subTest(fragment=name):
+                self.assertEqual(self.cached(self.user, name), name not in (fragment, dashboard_cache.CONTEXT))
+                self.assertTrue(self.cached(self.other, name))
+
+    def test_reading_insights_drops_the_insights_card(self):
+        self.warm()
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('ai_assistant:insights'))
+        self.assertEqual(response.status_code, 200)
+        self.assertInvalidated('insights')
+
+        context, computed = dashboard_cache.context(self.user, self.today)
+        self.assertEqual(computed, {'insights'})
+        self.assertTrue(all(insight.is_read for insight in context['recent_insights']))
+
+    def test_rescore_drops_the_leads_card(self):
+        self.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            lead_scorer.rescore(CustomerLead.objects.filter(user=self.user))
+        self.assertInvalidated('leads')
+
+        context, computed = dashboard_cache.context(self.user, self.today)
+        self.assertEqual(computed, {'leads'})
+        self.assertGreater(context['high_priority_leads'][0].priority_score, 0)
+
+    def test_rescore_without_changes_keeps_the_cache(self):
+        lead_scorer.rescore(CustomerLead.objects.filter(user=self.user))
+        self.warm()
+        lead_scorer.rescore(CustomerLead.objects.filter(user=self.user))
+        self.assertTrue(self.cached(self.user, dashboard_cache.CONTEXT))
+
+
+class SalesRollupTests(TestCase):
+    """SalesDailyRollup always equals the raw sales grouped by its key"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('partner', password='secret')
+        self.other = User.objects.create_user('other', password='secret')
+
+    def sale(self, **fields):
+        values = {'user': self.user, 'date': date(2025, 3, 14), 'product': 'Product', 'customer_name': 'Customer',
+                  'amount': Decimal('1000.00'), 'commission': Decimal('100.00'), 'product_category': 'loan'}
+        values.update(fields)
+        return SalesPerformance.objects.create(**values)
+
+    def assertRollupMatchesSales(self):
+        expected = {
+            tuple(row[field] for field in ROLLUP_KEY): (row['amount'], row['commission'], row['count'])
+            for row in SalesPerformance.objects.values(*ROLLUP_KEY).annotate(
+                amount=Sum('amount'), commission=Sum('commission'), count=Count('id')).order_by()
+        }
+        rollup = {
+            tuple(row[field] for field in ROLLUP_KEY): (row['amount'], row['commission'], row['count'])
+            for row in SalesDailyRollup.objects.values(*ROLLUP_KEY, 'amount', 'commission', 'count')
+        }
+        self.assertEqual(rollup, expected)
+
+    def test_created_sales_add_up(self):
+        self.sale()
+        self.sale(amount=Decimal('250.50'), commission=Decimal('25.05'))
+        self.sale(product_category='insurance', customer_type='referred')
+        self.assertRollupMatchesSales()
+        self.assertEqual(SalesDailyRollup.objects.count(), 2)
+
+    def test_updated_amount_replaces_old_totals(self):
+        sale = self.sale()
+        self.sale()
+        sale.amount, sale.commission = Decimal('40.00'), Decimal('4.00')
+        sale.save()
+        self.assertRollupMatchesSales()
+
+    def test_sale_moved_to_another_day_category_and_partner(self):
+        sale = self.sale()
+        self.sale()
+        for field, value in (('date', date(2025, 3, 15)), ('product_category', 'insurance'),
+                             ('customer_type', 'existing'), ('user', self.other)):
+            setattr(sale, field, value)
+            sale.save()
+            self.assertRollupMatchesSales()
+
+    def test_deleted_sales_are_removed(self):
+        first, second = self.sale(), self.sale()
+        first.delete()
+        self.assertRollupMatchesSales()
+        second.delete()
+        self.assertRollupMatchesSales()
+        self.assertFalse(SalesDailyRollup.objects.exists())
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.sale()
+        self.sale(date=date(2025, 3, 1), product_category='credit_card')
+        self.sale(user=self.other)
+        incremental = list(SalesDailyRollup.objects.order_by(*ROLLUP_KEY).values(*ROLLUP_KEY, 'amount', 'count'))
+        rebuild_rollup([self.user.id, self.other.id])
+        self.assertEqual(
+            list(SalesDailyRollup.objects.order_by(*ROLLUP_KEY).values(*ROLLUP_KEY, 'amount', 'count')), incremental
+        )
+
+
+class SalesSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('partner', password='secret')
+
+    def sale(self, day, amount):
+        SalesPerformance.objects.create(user=self.user, date=day, product='Product', customer_name='Customer',
+                                        amount=amount, commission=0, product_category='loan')
+
+    def series(self, start_date, end_date, **kwargs):
+        rollup = SalesDailyRollup.objects.filter(user=self.user, date__gte=start_date, date__lte=end_date)
+        return sales_series(rollup, start_date, end_date, **kwargs)
+
+    def test_granularity_is_the_finest_within_max_points(self):
+        self.assertEqual(choose_granularity(date(2025, 1, 1), date(2025, 3, 3), 62), 'day')
+        self.assertEqual(choose_granularity(date(2025, 1, 1), date(2025, 3, 4), 62), 'week')
+        self.assertEqual(choose_granularity(date(2020, 1, 1), date(2025, 2, 1), 62), 'month')
+        self.assertEqual(choose_granularity(date(2015, 1, 1), date(2025, 1, 1), 62), 'quarter')
+        self.assertEqual(choose_granularity(date(1990, 1, 1), date(2025, 1, 1), 62), 'year')
+
+    def test_daily_gaps_are_filled_with_zeros(self):
+        self.sale(date(2025, 3, 1), 100)
+        self.sale(date(2025, 3, 1), 50)
+        self.sale(date(2025, 3, 4), 20)
+        granularity, title, series = self.series(date(2025, 3, 1), date(2025, 3, 5))
+
+        self.assertEqual((granularity, title), ('day', 'Daily'))
+        self.assertEqual([(point['start'], point['total'], point['count']) for point in series], [
+            (date(2025, 3, 1), 150.0, 2), (date(2025, 3, 2), 0.0, 0), (date(2025, 3, 3), 0.0, 0),
+            (date(2025, 3, 4), 20.0, 1), (date(2025, 3, 5), 0.0, 0),
+        ])
+
+    def test_weeks_start_on_monday(self):
+        # 2025-03-09 is a Sunday and 2025-03-10 the Monday after it
+        self.sale(date(2025, 3, 9), 10)
+        self.sale(date(2025, 3, 10), 20)
+        self.sale(date(2025, 3, 16), 30)
+        _, _, series = self.series(date(2025, 3, 5), date(2025, 3, 25), granularity='week')
+
+        self.assertEqual([(point['start'], point['total']) for point in series], [
+            (date(2025, 3, 3), 10.0), (date(2025, 3, 10), 50.0), (date(2025, 3, 17), 0.0), (date(2025, 3, 24), 0.0),
+        ])
+        self.assertEqual(series[1]['date'], 'Week of 10 Mar 2025')
+
+    def test_month_and_quarter_buckets(self):
+        self.sale(date(2025, 1, 31), 10)
+        self.sale(date(2025, 3, 1), 20)
+        self.sale(date(2025, 4, 1), 40)
+
+        _, _, months = self.series(date(2025, 1, 15), date(2025, 4, 30), granularity='month')
+        self.assertEqual([(point['date'], point['total']) for point in months],
+                         [('Jan 2025', 10.0), ('Feb 2025', 0.0), ('Mar 2025', 20.0), ('Apr 2025', 40.0)])
+
+        _, _, quarters = self.series(date(2025, 1, 15), date(2025, 9, 30), granularity='quarter')
+        self.assertEqual([(point['date'], point['total']) for point in quarters],
+                         [('Q1 2025', 30.0), ('Q2 2025', 40.0), ('Q3 2025', 0.0)])
+
+    def test_long_ranges_keep_the_latest_buckets(self):
+        self.sale(date(2025, 3, 31), 10)
+        granularity, _, series = self.series(date(2025, 1, 1), date(2025, 3, 31), granularity='day', max_points=7)
+        self.assertEqual(granularity, 'day')
+        self.assertEqual([point['start'] for point in series],
+                         [date(2025, 3, 25) + timedelta(days=i) for i in range(7)])
+        self.assertEqual(series[-1]['total'], 10.0)
+
+
+class GoalProgressTests(TestCase):
+    """with_progress agrees with summing each goal's sales row by row"""
+
+    def setUp(self):
+        rng = random.Random(24)
+        self.partners = [User.objects.create_user(f'partner{i}', password='secret') for i in range(3)]
+        categories = [category for category, _, _ in PRODUCT_TARGETS] + ['savings']
+        for partner in self.partners:
+            for month in (1, 2, 3):
+                PerformanceGoal.objects.create(user=partner, month=month, year=2025, target_amount=50000,
+                                               target_customers=10, insurance_target=5000, loan_target=20000)
+            for _ in range(40):
+                SalesPerformance.objects.create(
+                    user=partner, date=date(2024, 12, 20) + timedelta(days=rng.randrange(80)), product='Product',
+                    customer_name='Customer', amount=Decimal(rng.randrange(100, 5000)), commission=0,
+                    product_category=rng.choice(categories), customer_type=rng.choice(['new', 'existing'])
+                )
+        # A goal with no sales in its month
+        PerformanceGoal.objects.create(user=self.partners[0], month=6, year=2025, target_amount=1000)
+
+    def test_annotations_match_per_row_sums(self):
+        goals = list(with_progress(PerformanceGoal.objects.all()))
+        self.assertEqual(len(goals), PerformanceGoal.objects.count())
+
+        for goal in goals:
+            sales = list(SalesPerformance.objects.filter(user=goal.user, date__year=goal.year, date__month=goal.month))
+            self.assertEqual(goal.achieved_amount, sum((sale.amount for sale in sales), Decimal('0')))
+            self.assertEqual(goal.achieved_customers, len(sales))
+            for category, _, _ in PRODUCT_TARGETS:
+                self.assertEqual(getattr(goal, f'achieved_{category}'),
+                                 sum((sale.amount for sale in sales if sale.product_category == category),
+                                     Decimal('0')))
+
+    def test_goal_progress_reports_targets_that_are_set(self):
+        goal = with_progress(PerformanceGoal.objects.filter(user=self.partners[0], month=6)).get()
+        progress = goal_progress(goal)
+        self.assertEqual(progress['amount']['achieved'], 0)
+        self.assertEqual(progress['amount']['percentage'], 0)
+        self.assertEqual(progress['products'], [])
 
-# Create your tests here.
+        goal = with_progress(PerformanceGoal.objects.filter(user=self.partners[1], month=2)).get()
+        progress = goal_progress(goal)
+        self.assertEqual([product['category'] for product in progress['products']], ['insurance', 'loan'])
+        self.assertAlmostEqual(progress['amount']['percentage'], float(goal.achieved_amount) / 50000 * 100)
+        self.assertAlmostEqual(goal.get_achieved_percentage(), progress['amount']['percentage'])
@@ -2,13 +2,16 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.utils import timezone
-from django.db.models import Sum, Count, Avg
+from django.db.models import Sum
 from datetime import datetime, timedelta
 import json
 import random
 
-from .models import SalesPerformance, PerformanceGoal, AIInsight, CustomerLead
+from .analytics import sales_series
+from .dashboard_cache import dashboard_cache
+from .models import SalesPerformance, SalesDailyRollup, PerformanceGoal, AIInsight, CustomerLead
 from accounts.models import Skill, LearningProgress, UserProfile
+from ai_assistant.jobs import schedule_outreach_prefetch
 
 
 @login_required
@@ -17,87 +20,16 @@ def index_view(request):
     user = request.user
     today = timezone.now().date()
 
+    # Totals, goal, recent sales, insights, leads and learning progress, cached per card
+    context, computed = dashboard_cache.context(user, today)
 
-    # Get current month's data
-    current_month = today.month
-    current_year = today.year
-
-    # Calculate sales metrics
-    month_sales = SalesPerformance.objects.filter(
-        user=user,
-        date__month=current_month,
-        date__year=current_year
-    )
-
-    month_total = month_sales.aggregate(total=Sum('amount'))['total'] or 0
-    month_commission = month_sales.aggregate(total=Sum('commission'))['total'] or 0
-    month_count = month_sales.count()
+    response = render(request, 'dashboard/index.html', context)
 
-    # Get monthly goal
-    try:
-        monthly_goal = PerformanceGoal.objects.get(user=user, month=current_month, year=current_year)
-        goal_percentage = monthly_goal.get_achieved_percentage()
-    except PerformanceGoal.DoesNotExist:
-        monthly_goal = None
-        goal_percentage = 0
-
-    # Get recent sales
-    recent_sales = SalesPerformance.objects.filter(user=user).order_by('-date')[:5]
-
-    # Get recent insights
-    recent_insights = AIInsight.objects.filter(user=user).order_by('-created_at')[:3]
+    # Have outreach drafts ready for the high priority leads shown on the page
+    if 'leads' in computed:
+        schedule_outreach_prefetch(user)
 
-    # Get high priority leads
-    high_priority_leads = CustomerLead.objects.filter(
-        user=user,
-        status__in=['new', 'contacted', 'interested']
-    ).order_by('-priority_score')[:5]
-
-    # Get learning progress
-    learning_modules = LearningProgress.objects.filter(user=user).order_by('-last_activity')[:3]
-
-    # Calculate product distribution
-    product_distribution = month_sales.values('product_category').annotate(
-        count=Count('id'),
-        total=Sum('amount')
-    ).order_by('-total')
-
-    # Prepare chart data
-    chart_labels = [item['product_category'] for item in product_distribution]
-    chart_values = [float(item['total']) for item in product_distribution]
-
-    # Prepare recent performance data (last 7 days)
-    last_week_data = []
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        day_sales = SalesPerformance.objects.filter(user=user, date=day)
-        day_total = day_sales.aggregate(total=Sum('amount'))['total'] or 0
-        last_week_data.append({
-            'date': day.strftime('%d %b'),
-            'amount': float(day_total)
-        })
-
-    week_labels = [day['date'] for day in last_week_data]
-    week_values = [day['amount'] for day in last_week_data]
-
-    context = {
-        'month_total': month_total,
-        'month_commission': month_commission,
-        'month_count': month_count,
-        'monthly_goal': monthly_goal,
-        'goal_percentage': goal_percentage,
-        'recent_sales': recent_sales,
-        'recent_insights': recent_insights,
-        'high_priority_leads': high_priority_leads,
-        'learning_modules': learning_modules,
-        'product_distribution': product_distribution,
-        'chart_labels': json.dumps(chart_labels),
-        'chart_values': json.dumps(chart_values),
-        'week_labels': json.dumps([day['date'] for day in last_week_data]),
-        'week_values': json.dumps([day['amount'] for day in last_week_data])
-    }
-
-    return render(request, 'dashboard/index.html', context)
+    return response
 
 
 @login_required
@@ -130,51 +62,43 @@ def analytics_view(request):
 
         end_date = datetime(next_year, next_month, 1).date() - timedelta(days=1)
 
-    # Get sales data for selected period
-    sales_data = SalesPerformance.objects.filter(
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+
+    # Get sales totals for selected period from the daily rollup
+    rollup = SalesDailyRollup.objects.filter(
         user=user,
         date__gte=start_date,
         date__lte=end_date
     )
 
     # Calculate summary metrics
-    period_total = sales_data.aggregate(total=Sum('amount'))['total'] or 0
-    period_commission = sales_data.aggregate(total=Sum('commission'))['total'] or 0
-    period_count = sales_data.count()
+    totals = rollup.aggregate(total=Sum('amount'), commission=Sum('commission'), count=Sum('count'))
+    period_total = totals['total'] or 0
+    period_commission = totals['commission'] or 0
+    period_count = totals['count'] or 0
     avg_sale_value = period_total / period_count if period_count > 0 else 0
 
     # Calculate product category distribution
-    product_categories = sales_data.values('product_category').annotate(
-        count=Count('id'),
-        total=Sum('amount'),
-        avg_amount=Avg('amount')
-    ).order_by('-total')
+    product_categories = list(rollup.values('product_category').annotate(
+        count=Sum('count'),
+        total=Sum('amount')
+    ).order_by('-total'))
+    for item in product_categories:
+        item['avg_amount'] = item['total'] / item['count'] if item['count'] else 0
 
     # Calculate customer type distribution
-    customer_types = sales_data.values('customer_type').annotate(
-        count=Count('id'),
+    customer_types = rollup.values('customer_type').annotate(
+        count=Sum('count'),
         total=Sum('amount')
     ).order_by('-count')
 
-    # Calculate day-by-day performance
-    daily_performance = []
-    current_date = start_date
-    while current_date <= end_date:
-        day_sales = sales_data.filter(date=current_date)
-        day_total = day_sales.aggregate(total=Sum('amount'))['total'] or 0
-        day_count = day_sales.count()
-
-        daily_performance.append({
-            'date': current_date.strftime('%d %b'),
-            'total': float(day_total),
-            'count': day_count
-        })
-
-        current_date += timedelta(days=1)
+    # Calculate performance over time, bucketed by day, week, month... to fit the range
+    granularity, series_title, period_performance = sales_series(rollup, start_date, end_date)
 
     # Prepare chart data
-    period_labels = [day['date'] for day in daily_performance]
-    period_values = [day['total'] for day in daily_performance]
+    period_labels = [bucket['date'] for bucket in period_performance]
+    period_values = [bucket['total'] for bucket in period_performance]
 
     # Product distribution chart
     product_labels = [item['product_category'] for item in product_categories]
@@ -193,7 +117,9 @@ def analytics_view(request):
         'avg_sale_value': avg_sale_value,
         'product_categories': product_categories,
         'customer_types': customer_types,
-        'daily_performance': daily_performance,
+        'granularity': granularity,
+        'series_title': series_title,
+        'period_performance': period_performance,
         'period_labels': json.dumps(period_labels),
         'period_values': json.dumps(period_values),
         'product_labels': json.dumps(product_labels),
@@ -257,36 +183,30 @@ def set_goals_view(request):
     return render(request, 'dashboard/set_goals.html', context)
 
 
+# Cards that can be refreshed on their own: (cached fragment, partial template)
+REFRESHABLE_CARDS = {
+    'recent_sales': ('recent_sales', 'dashboard/partials/recent_sales.html'),
+    'insights': ('insights', 'dashboard/partials/insights.html'),
+    'leads': ('leads', 'dashboard/partials/leads.html'),
+}
+
+
 @login_required
 def refresh_card_view(request, card_id):
     """AJAX view for refreshing dashboard cards"""
     user = request.user
     today = timezone.now().date()
 
-    if card_id == 'recent_sales':
-        # Refresh recent sales card
-        recent_sales = SalesPerformance.objects.filter(user=user).order_by('-date')[:5]
-        html = render(request, 'dashboard/partials/recent_sales.html', {'recent_sales': recent_sales}).content.decode()
-        return JsonResponse({'html': html})
-
-    elif card_id == 'insights':
-        # Refresh insights card
-        recent_insights = AIInsight.objects.filter(user=user).order_by('-created_at')[:3]
-        html = render(request, 'dashboard/partials/insights.html',
-                      {'recent_insights': recent_insights}).content.decode()
-        return JsonResponse({'html': html})
-
-    elif card_id == 'leads':
-        # Refresh leads card
-        high_priority_leads = CustomerLead.objects.filter(
-            user=user,
-            status__in=['new', 'contacted', 'interested']
-        ).order_by('-priority_score')[:5]
-        html = render(request, 'dashboard/partials/leads.html',
-                      {'high_priority_leads': high_priority_leads}).content.decode()
-        return JsonResponse({'html': html})
+    if card_id not in REFRESHABLE_CARDS:
+        return JsonResponse({'error': 'Invalid card ID'}, status=400)
+
+    fragment, template = REFRESHABLE_CARDS[card_id]
+    context, computed = dashboard_cache.fragments(user, today, [fragment])
+    html = render(request, template, context).content.decode()
 
-    return JsonResponse({'error': 'Invalid card ID'}, status=400)
+    if 'leads' in computed:
+        schedule_outreach_prefetch(user)
+    return JsonResponse({'html': html})
 
 
 @login_required
@@ -300,12 +220,11 @@ def add_sale_view(request):
     current_year = today.year
 
     # Calculate current month sales count for insights
-    month_sales = SalesPerformance.objects.filter(
+    month_count = SalesDailyRollup.objects.filter(
         user=user,
         date__month=current_month,
         date__year=current_year
-    )
-    month_count = month_sales.count()
+    ).aggregate(count=Sum('count'))['count'] or 0
 
     if request.method == 'POST':
         # Process form data
@@ -6,7 +6,8 @@ from django.contrib.auth.models import User, Group
 from django.db.models import Count, Sum
 from dashboard.models import SalesPerformance, CustomerLead, AIInsight, PerformanceGoal
 from accounts.models import UserProfile
-from ai_assistant.models import Conversation, Message, AIResponse, LearningContent, SalesTemplate
+from ai_assistant.models import Conversation, Message, AIResponse, AICacheEntry, CircuitBreakerState, AIJob, \
+    LearningCatalogEntry, LearningContent, QuizQuestion, SalesTemplate
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.sites.models import Site
@@ -20,10 +21,12 @@ from django.urls import reverse
 from accounts.admin import UserAdmin as CustomUserAdmin
 from django.contrib.auth.admin import GroupAdmin
 from dashboard.admin import SalesPerformanceAdmin, PerformanceGoalAdmin, AIInsightAdmin, CustomerLeadAdmin
-from ai_assistant.admin import ConversationAdmin, MessageAdmin, AIResponseAdmin, LearningContentAdmin, \
-    SalesTemplateAdmin
+from ai_assistant.admin import ConversationAdmin, MessageAdmin, AIResponseAdmin, AICacheEntryAdmin, \
+    CircuitBreakerStateAdmin, AIJobAdmin, LearningCatalogEntryAdmin, LearningContentAdmin, \
+    QuizQuestionAdmin, SalesTemplateAdmin
 from django.conf import settings
 from django.contrib.auth.views import LoginView
+from ai_assistant.telemetry import telemetry
 
 
 class FinArvaAdminSite(AdminSite):
@@ -168,6 +171,10 @@ class FinArvaAdminSite(AdminSite):
         recent_sales = SalesPerformance.objects.all().order_by('-date')[:10]
         recent_leads = CustomerLead.objects.all().order_by('-created_at')[:10]
 
+        # AI usage per request type over the last week
+        ai_usage = telemetry.summary(days=7)
+        ai_cost_per_day = sum(row['cost_per_day'] for row in ai_usage)
+
         context = {
             'title': 'FinArva AI Admin Dashboard',
             'total_users': total_users,
@@ -185,6 +192,8 @@ class FinArvaAdminSite(AdminSite):
             'total_responses': total_responses,
             'recent_sales': recent_sales,
             'recent_leads': recent_leads,
+            'ai_usage': ai_usage,
+            'ai_cost_per_day': ai_cost_per_day,
             'start_date': start_date,
             'today': today
         }
@@ -208,6 +217,11 @@ admin_site.register(CustomerLead, CustomerLeadAdmin)
 admin_site.register(Conversation, ConversationAdmin)
 admin_site.register(Message, MessageAdmin)
 admin_site.register(AIResponse, AIResponseAdmin)
+admin_site.register(AICacheEntry, AICacheEntryAdmin)
+admin_site.register(CircuitBreakerState, CircuitBreakerStateAdmin)
+admin_site.register(AIJob, AIJobAdmin)
+admin_site.register(LearningCatalogEntry, LearningCatalogEntryAdmin)
 admin_site.register(LearningContent, LearningContentAdmin)
+admin_site.register(QuizQuestion, QuizQuestionAdmin)
 admin_site.register(SalesTemplate, SalesTemplateAdmin)
 admin_site.register(Site, SiteAdmin)
\ No newline at end of file
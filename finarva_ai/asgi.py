@@ -3,6 +3,12 @@ ASGI config for finarva_ai project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The AI endpoints (sales co-pilot suggestions, lead messages and quiz
+questions) are async views. Served from here, e.g. with
+``uvicorn finarva_ai.asgi:application``, they await OpenAI on the event loop
+so one process can keep many completions in flight instead of tying up a
+worker per call.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
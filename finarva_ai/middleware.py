@@ -1,5 +1,7 @@
 # Create a new file: finarva_ai/middleware.py
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from ai_assistant.resilience import set_request_deadline, clear_request_deadline
 
 class AdminAuthMiddleware(MiddlewareMixin):
     """
@@ -12,4 +14,20 @@ class AdminAuthMiddleware(MiddlewareMixin):
                 # If a user is logged in but not as admin, log them out for admin pages
                 # This doesn't affect their session elsewhere
                 request.admin_user_conflict = True
-        return None
\ No newline at end of file
+        return None
+
+
+class AIDeadlineMiddleware(MiddlewareMixin):
+    """
+    Give each request a time budget for AI calls
+
+    AIService caps per-call timeouts and retries by what is left of this
+    budget, so a slow upstream cannot hold a worker past it.
+    """
+    def process_request(self, request):
+        set_request_deadline(getattr(settings, 'AI_REQUEST_BUDGET', 25))
+        return None
+
+    def process_response(self, request, response):
+        clear_request_deadline()
+        return response
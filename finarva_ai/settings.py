@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'finarva_ai.request_middleware.RequestMiddleware',  # Custom middleware for request context
+    'finarva_ai.middleware.AIDeadlineMiddleware',  # Time budget for AI calls
     'django.contrib.sessions.middleware.SessionMiddleware',
     'finarva_ai.session_middleware.SeparateAdminSessionMiddleware',  # Custom admin session middleware
     'django.middleware.common.CommonMiddleware',
@@ -76,6 +77,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'finarva_ai.wsgi.application'
+ASGI_APPLICATION = 'finarva_ai.asgi.application'
 
 # Database
 DATABASES = {
@@ -85,6 +87,25 @@ DATABASES = {
     }
 }
 
+# Cache shared by every web and job worker process. Dashboard cards are dropped
+# by model signals in whichever process changed the data, so a per-process cache
+# would keep serving stale cards. Redis is used when REDIS_URL is set (needs the
+# redis package); otherwise a database table, created by migrate or createcachetable.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'finarva_cache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -153,3 +174,149 @@ LOGIN_URL = 'accounts:login'
 
 # OpenAI API settings
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Point at a local stand-in (see run_fake_openai), e.g. http://127.0.0.1:8765/v1
+OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')
+
+# AI response cache
+# Only deterministic prompts are cached; the TTL (seconds) is chosen by cache type
+AI_CACHE_BACKEND = 'ai_assistant.ai_cache.TieredResponseCache'
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '1000'))
+AI_CACHE_TTLS = {
+    'objection': 60 * 60 * 24 * 7,
+    'learning_content': 60 * 60 * 24 * 7,
+}
+
+# Identical in-flight AI requests share one upstream call; this bounds how long
+# followers wait (seconds) and how long a cross-process lock row stays valid
+AI_SINGLE_FLIGHT_TIMEOUT = 60
+
+# Copilot conversation context window (estimated prompt tokens). Older turns
+# beyond the budget are folded into a cached rolling summary.
+AI_CONTEXT_MAX_TOKENS = int(os.getenv('AI_CONTEXT_MAX_TOKENS', '3000'))
+AI_CONTEXT_RECENT_TURNS = 6
+AI_CONTEXT_SUMMARY_TOKENS = 250
+
+# Server-held co-pilot sessions: size and lifetime (seconds) of the in-process history cache
+AI_COPILOT_SESSION_CACHE_SIZE = 500
+AI_COPILOT_SESSION_TTL = 60 * 60 * 6
+
+# OpenAI rate governor. The organisation's limits are token buckets in the
+# database named after AI_RATE_LIMIT_SHARED_BUCKET, shared by every web and job
+# worker process (None keeps a separate budget per process). Calls that cannot
+# be admitted within AI_RATE_LIMIT_MAX_WAIT seconds fail with the fallback response.
+AI_RATE_LIMIT_RPM = int(os.getenv('AI_RATE_LIMIT_RPM', '3500'))
+AI_RATE_LIMIT_TPM = int(os.getenv('AI_RATE_LIMIT_TPM', '90000'))
+AI_RATE_LIMIT_MAX_WAIT = 30
+AI_RATE_LIMIT_SHARED_BUCKET = 'openai'
+AI_RATE_LIMIT_PRIORITIES = {
+    'copilot': 'interactive',
+    'learning': 'standard',
+    'lead': 'standard',
+    'performance': 'batch',
+}
+
+# Upstream resilience: per-request AI time budget and per-call timeout (seconds),
+# retries with exponential backoff and jitter, and the circuit breaker
+AI_REQUEST_BUDGET = 25
+AI_CALL_TIMEOUT = 20
+AI_RETRY_MAX_ATTEMPTS = 3
+AI_RETRY_BASE_DELAY = 0.5
+AI_RETRY_MAX_DELAY = 8
+AI_BREAKER_FAILURE_THRESHOLD = 5
+AI_BREAKER_RECOVERY_TIMEOUT = 30
+
+# Request hedging: if a call of one of these request types is slower than the
+# observed p95, a duplicate is sent. At most AI_HEDGE_BUDGET_RATIO of calls are hedged.
+AI_HEDGE_REQUEST_TYPES = ['copilot']
+AI_HEDGE_PERCENTILE = 95
+AI_HEDGE_BUDGET_RATIO = 0.05
+AI_HEDGE_WINDOW = 200
+AI_HEDGE_MIN_SAMPLES = 20
+# Threads per process for sync hedged calls; calls made while all are busy run
+# inline on the caller's thread, unhedged, instead of queueing for one
+AI_HEDGE_MAX_WORKERS = 32
+
+# Background AI jobs (run with `run_ai_workers`). A running job whose worker
+# has not reported back within the visibility timeout (seconds) is retried.
+AI_JOB_WORKERS = 4
+AI_JOB_POLL_INTERVAL = 2.0
+AI_JOB_MAX_ATTEMPTS = 3
+AI_JOB_RETRY_DELAY = 30
+AI_JOB_VISIBILITY_TIMEOUT = 300
+
+# AIResponse logging is buffered in memory and written in batches by a
+# background thread. A failed batch is retried AI_LOG_RETRIES times, backing off
+# from AI_LOG_RETRY_DELAY seconds, then re-queued. Records beyond
+# AI_LOG_BUFFER_SIZE are dropped.
+AI_LOG_BUFFER_SIZE = 10000
+AI_LOG_BATCH_SIZE = 200
+AI_LOG_FLUSH_INTERVAL = 2.0
+AI_LOG_RETRIES = 3
+AI_LOG_RETRY_DELAY = 0.2
+
+# Number of prompt/response digests whose blob ids are kept in memory
+AI_BLOB_CACHE_SIZE = 5000
+
+# AI telemetry: seconds between flushes of in-memory metrics to AICallRollup,
+# and model prices in USD per 1K tokens used to compute spend
+AI_TELEMETRY_FLUSH_INTERVAL = 60
+AI_MODEL_PRICES = {
+    'gpt-3.5-turbo': {'prompt': 0.0005, 'completion': 0.0015},
+}
+
+# Record/replay of ChatCompletion responses: 'record' saves real responses to
+# AI_CASSETTE_PATH, 'replay' serves them from there without calling the API
+AI_CASSETTE_MODE = os.getenv('AI_CASSETTE_MODE') or None
+AI_CASSETTE_PATH = os.getenv('AI_CASSETTE_PATH', os.path.join(BASE_DIR, 'cassettes'))
+
+# Lead analysis for more than AI_LEAD_ANALYSIS_CHUNK_SIZE leads is map-reduced:
+# at most AI_LEAD_ANALYSIS_MAX_LEADS pre-ranked leads are scored in parallel
+# chunks, and the best AI_LEAD_ANALYSIS_SHORTLIST_SIZE go to the final call
+AI_LEAD_ANALYSIS_CHUNK_SIZE = 20
+AI_LEAD_ANALYSIS_SHORTLIST_SIZE = 10
+AI_LEAD_ANALYSIS_MAX_LEADS = 300
+AI_LEAD_ANALYSIS_PARALLELISM = 4
+AI_LEAD_ANALYSIS_NOTES_CHARS = 300
+
+# Bulk outreach messages: leads per completion, packs in flight at once,
+# the most leads per request, and how long a lead's message is reused
+# (a change to the lead's status or notes always makes a new one)
+AI_OUTREACH_PACK_SIZE = 5
+AI_OUTREACH_PARALLELISM = 4
+AI_OUTREACH_MAX_LEADS = 50
+AI_OUTREACH_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Outreach drafts for a partner's top AI_OUTREACH_PREFETCH_TOP_K leads are
+# written in the background when the leads page or dashboard is opened, at
+# most AI_OUTREACH_PREFETCH_DAILY_BUDGET drafts per partner per day
+AI_OUTREACH_PREFETCH_TOP_K = 3
+AI_OUTREACH_PREFETCH_DAILY_BUDGET = 20
+
+# Shared learning modules are stored per product, level and catalog version;
+# bump the version to have them regenerated (warm_learning_catalog)
+AI_LEARNING_CATALOG_VERSION = 1
+
+# Quiz question bank: questions per quiz, questions asked for per generation
+# call, and the pool size per product and level that top-ups aim for and
+# never go beyond
+AI_QUIZ_SIZE = 5
+AI_QUIZ_BANK_BATCH_SIZE = 10
+AI_QUIZ_BANK_TARGET_POOL = 50
+AI_QUIZ_BANK_MAX_POOL = 200
+
+# Lead priority scoring: decay windows (days) for lead age and last activity,
+# and how far back a partner's sales mix is taken from
+LEAD_SCORE_RECENCY_DAYS = 30
+LEAD_SCORE_ACTIVITY_DAYS = 14
+LEAD_SCORE_SALES_WINDOW_DAYS = 90
+# Seconds the conversion rate over all partners' leads, the prior for every partner's rates,
+# is cached; the rescore_leads command always recomputes it
+LEAD_SCORE_PRIOR_TIMEOUT = 60 * 60
+
+# Sales analytics charts use the finest of day/week/month/quarter/year buckets
+# that keeps the series within this many points
+ANALYTICS_MAX_POINTS = 62
+
+# Dashboard cards are cached per partner and dropped by model signals when their
+# data changes; the timeout (seconds) only bounds how long unused entries are kept
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
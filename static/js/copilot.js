@@ -1,7 +1,8 @@
 // Sales Co-Pilot JavaScript for FinArva AI
 
-// Store conversation context
+// Local transcript of the conversation; the server keeps the history for the session
 let conversationContext = [];
+let sessionId = null;
 let transcriptStarted = false;
 let customerType = '';
 let productType = '';
@@ -55,22 +56,38 @@ function initSalesCopilot() {
 
 // Start the conversation
 function startConversation(customerType, productType) {
-    // Add system message to context
-    conversationContext = [{
-        role: 'system',
-        content: `You are an AI sales assistant helping a GroMo Partner (GP) sell financial products in India.
-        The GP is currently talking to a ${customerType} customer about a ${productType} product.
-        Provide real-time sales suggestions, objection handling tips, and product information to help the GP close the sale.
-        Keep suggestions brief, practical, and tailored to the Indian market context.`
-    }];
-
+    conversationContext = [];
     transcriptStarted = true;
 
     // Display initial greeting and tips
     displayAIMessage("I'm your sales co-pilot for this conversation! As you talk with your customer, I'll provide real-time suggestions to help you close the sale. Start by sharing what the customer is saying, and I'll guide you.");
 
-    // Add initial tips based on customer and product type
-    generateInitialTips(customerType, productType);
+    // Open a server-side session; the system prompt and history live there
+    fetch('/ai-assistant/copilot/session/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCsrfToken()
+        },
+        body: JSON.stringify({
+            customer_type: customerType,
+            product_type: productType
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.session_id) {
+            throw new Error(data.error || 'Could not start session');
+        }
+        sessionId = data.session_id;
+
+        // Add initial tips based on customer and product type
+        generateInitialTips(customerType, productType);
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        displayAIMessage("Sorry, I couldn't start the co-pilot session. Please try again.");
+    });
 }
 
 // Generate initial tips based on customer and product type
@@ -98,38 +115,8 @@ function generateInitialTips(customerType, productType) {
     // Scroll to bottom
     scrollToBottom();
 
-    // Send to API
-    fetch('/ai-assistant/generate-suggestion/', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': getCsrfToken()
-        },
-        body: JSON.stringify({
-            messages: conversationContext
-        })
-    })
-    .then(response => response.json())
-    .then(data => {
-        // Remove loading message
-        document.getElementById('chatMessages').removeChild(loadingMessage);
-
-        // Display AI response
-        displayAIMessage(data.response);
-
-        // Add to context
-        conversationContext.push({
-            role: 'assistant',
-            content: data.response
-        });
-    })
-    .catch(error => {
-        console.error('Error:', error);
-        // Remove loading message
-        document.getElementById('chatMessages').removeChild(loadingMessage);
-        // Display error
-        displayAIMessage("Sorry, I couldn't generate tips. Please try again.");
-    });
+    // Stream from API
+    streamAIResponse(prompt, loadingMessage, "Sorry, I couldn't generate tips. Please try again.");
 }
 
 // Setup form submission
@@ -156,7 +143,7 @@ function setupFormSubmission() {
         userMessageInput.value = '';
 
         // Generate AI response
-        generateAIResponse();
+        generateAIResponse(userMessage);
     });
 }
 
@@ -190,10 +177,13 @@ function displayAIMessage(message) {
 
     // Scroll to bottom
     scrollToBottom();
+
+    // Return the message body so it can be updated while streaming
+    return messageElement.querySelector('.chat-message.ai > div:last-child');
 }
 
-// Generate AI response
-function generateAIResponse() {
+// Generate AI response to the latest user message
+function generateAIResponse(userMessage) {
     // Show loading state
     const loadingMessage = document.createElement('div');
     loadingMessage.className = 'chat-message ai d-flex mb-3';
@@ -208,37 +198,92 @@ function generateAIResponse() {
     // Scroll to bottom
     scrollToBottom();
 
-    // Send to API
-    fetch('/ai-assistant/generate-suggestion/', {
+    // Stream from API
+    streamAIResponse(userMessage, loadingMessage, "Sorry, I couldn't generate a response. Please try again.");
+}
+
+// Stream the AI response to a new message, showing tokens as they arrive
+function streamAIResponse(userMessage, loadingMessage, errorText) {
+    let messageBody = null;
+    let fullText = '';
+
+    // Replace the loading message with an empty AI message on the first token
+    function appendToken(token) {
+        if (!messageBody) {
+            document.getElementById('chatMessages').removeChild(loadingMessage);
+            messageBody = displayAIMessage('');
+        }
+        fullText += token;
+        messageBody.innerText = fullText;
+        scrollToBottom();
+    }
+
+    // Handle a single Server-Sent Event block
+    function handleEvent(block) {
+        let eventType = 'message';
+        let data = '';
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                eventType = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        });
+
+        if (eventType === 'message' && data) {
+            appendToken(JSON.parse(data).token);
+        } else if (eventType === 'error') {
+            throw new Error(JSON.parse(data).error);
+        }
+    }
+
+    fetch('/ai-assistant/stream-suggestion/', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
             'X-CSRFToken': getCsrfToken()
         },
-        body: JSON.stringify({
+        // Only the new turn is sent once a session exists
+        body: JSON.stringify(sessionId ? {
+            session_id: sessionId,
+            message: userMessage
+        } : {
             messages: conversationContext
         })
     })
-    .then(response => response.json())
-    .then(data => {
-        // Remove loading message
-        document.getElementById('chatMessages').removeChild(loadingMessage);
+    .then(async response => {
+        if (!response.ok) {
+            throw new Error(`Request failed with status ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
 
-        // Display AI response
-        displayAIMessage(data.response);
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            events.forEach(handleEvent);
+        }
 
         // Add to context
         conversationContext.push({
             role: 'assistant',
-            content: data.response
+            content: fullText
         });
     })
     .catch(error => {
         console.error('Error:', error);
-        // Remove loading message
-        document.getElementById('chatMessages').removeChild(loadingMessage);
+        // Remove loading message if no tokens arrived
+        if (!messageBody) {
+            document.getElementById('chatMessages').removeChild(loadingMessage);
+        }
         // Display error
-        displayAIMessage("Sorry, I couldn't generate a response. Please try again.");
+        displayAIMessage(errorText);
     });
 }
 
@@ -321,7 +366,7 @@ function handleObjection(objection) {
     });
 
     // Generate AI response
-    generateAIResponse();
+    generateAIResponse(prompt);
 }
 
 // Setup conversation controls
@@ -341,6 +386,7 @@ function setupConversationControls() {
 
                 // Reset conversation context
                 conversationContext = [];
+                sessionId = null;
                 transcriptStarted = false;
             }
         });
@@ -0,0 +1,22 @@
+// Polling for background AI jobs
+
+function pollAIJob(statusUrl, onSuccess, onFailure, interval) {
+    interval = interval || 2000;
+
+    function check() {
+        fetch(statusUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'succeeded') {
+                    onSuccess(data.result);
+                } else if (data.status === 'failed') {
+                    onFailure(data.error);
+                } else {
+                    setTimeout(check, interval);
+                }
+            })
+            .catch(() => setTimeout(check, interval * 2));
+    }
+
+    check();
+}